@@ -0,0 +1,191 @@
+import asyncio
+import json
+import random
+import time
+
+import aiohttp
+import pandas as pd
+
+from fundamentals_store import get_default_store
+from instrumentation import increment, timed
+
+ALPHA_VANTAGE_URL = "https://www.alphavantage.co/query"
+STATEMENT_FUNCTIONS = {
+    "income_statement": "INCOME_STATEMENT",
+    "balance_sheet": "BALANCE_SHEET",
+    "cash_flow": "CASH_FLOW",
+}
+DEFAULT_REQUESTS_PER_MINUTE = 75
+
+
+class RateLimitError(Exception):
+    """
+    Raised when Alpha Vantage answers with a rate-limit note instead of data.
+    """
+
+
+class TokenBucket:
+    """
+    Asyncio token bucket that spaces requests out to a requests-per-minute quota.
+    """
+
+    def __init__(self, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, burst=5):
+        """
+        Args:
+        requests_per_minute (float): The sustained number of requests allowed per minute.
+        burst (int): The number of requests that may be sent back-to-back while tokens are available.
+        """
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        Wait until a token is available and take it.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def _request_json(session, bucket, base_url, params, max_retries, backoff_seconds):
+    # Rate-limited GET with exponential backoff on transport errors, 429/5xx responses and rate-limit notes
+    for attempt in range(max_retries + 1):
+        await bucket.acquire()
+        try:
+            with timed("http_request", function=params["function"]):
+                async with session.get(base_url, params=params) as response:
+                    if response.status == 429 or response.status >= 500:
+                        raise aiohttp.ClientResponseError(response.request_info, response.history,
+                                                          status=response.status, message=response.reason)
+                    response.raise_for_status()
+                    body = await response.read()
+            increment("fetch_bytes", len(body))
+            payload = json.loads(body)
+            if "Error Message" in payload:
+                raise ValueError(payload["Error Message"])
+            if "Note" in payload or "Information" in payload:
+                raise RateLimitError(payload.get("Note") or payload.get("Information"))
+            return payload
+        except (aiohttp.ClientError, asyncio.TimeoutError, RateLimitError) as e:
+            retryable = not isinstance(e, aiohttp.ClientResponseError) or e.status == 429 or e.status >= 500
+            if not retryable or attempt == max_retries:
+                raise
+            increment("fetch_retries", reason=type(e).__name__)
+            await asyncio.sleep(backoff_seconds * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+async def fetch_ticker(session, bucket, ticker, api_key, base_url=ALPHA_VANTAGE_URL, max_retries=4,
+                       backoff_seconds=1.0):
+    """
+    Fetch the overview and the three annual statements of a ticker concurrently.
+
+    Args:
+    session (aiohttp.ClientSession): The pooled HTTP session to use.
+    bucket (TokenBucket): The rate limiter shared by all requests.
+    ticker (str): The stock ticker symbol.
+    api_key (str): The Alpha Vantage API key.
+    base_url (str): The Alpha Vantage query endpoint.
+    max_retries (int): How often a failed request is retried.
+    backoff_seconds (float): The base delay of the exponential backoff between retries.
+
+    Returns:
+    dict: Financial data shaped like fetch_financial_data's output.
+
+    Raises:
+    LookupError: If a statement has no annual reports, e.g. for an unknown or delisted symbol.
+    """
+    def request(function):
+        params = {"function": function, "symbol": ticker, "apikey": api_key}
+        return _request_json(session, bucket, base_url, params, max_retries, backoff_seconds)
+
+    overview_data, *statements = await asyncio.gather(
+        request("OVERVIEW"), *(request(function) for function in STATEMENT_FUNCTIONS.values()))
+
+    financial_data = {statement: pd.DataFrame(payload.get("annualReports", []))
+                      for statement, payload in zip(STATEMENT_FUNCTIONS, statements)}
+    # Alpha Vantage answers unknown symbols with empty payloads, which must not overwrite stored data
+    empty = [statement for statement in STATEMENT_FUNCTIONS if financial_data[statement].empty]
+    if empty:
+        raise LookupError(f"No annual reports for {ticker} in {', '.join(empty)}")
+    financial_data["shares_outstanding"] = int(overview_data.get("SharesOutstanding", 0))
+    return financial_data
+
+
+async def fetch_universe(tickers, api_key, store=None, requests_per_minute=DEFAULT_REQUESTS_PER_MINUTE, burst=5,
+                         max_concurrent_tickers=16, max_retries=4, backoff_seconds=1.0, base_url=ALPHA_VANTAGE_URL,
+                         only_stale=True, on_result=None):
+    """
+    Fetch many tickers concurrently and write each one into the fundamentals store as soon as it arrives.
+
+    Args:
+    tickers (list): The stock ticker symbols to fetch.
+    api_key (str): The Alpha Vantage API key.
+    store (FundamentalsStore, optional): The store the results are written to. Defaults to the process-wide store.
+    requests_per_minute (float): The API quota to respect across all requests.
+    burst (int): The number of requests that may be sent back-to-back.
+    max_concurrent_tickers (int): The maximum number of tickers in flight at once.
+    max_retries (int): How often a failed request is retried.
+    backoff_seconds (float): The base delay of the exponential backoff between retries.
+    base_url (str): The Alpha Vantage query endpoint.
+    only_stale (bool): Whether to skip tickers that are already fresh in the store.
+    on_result (callable, optional): Called with (ticker, financial_data, error) as each ticker finishes.
+
+    Returns:
+    dict: The 'fetched' tickers and the 'failed' tickers mapped to their errors.
+    """
+    store = store or get_default_store()
+    if only_stale:
+        tickers = store.stale_tickers(tickers)
+
+    bucket = TokenBucket(requests_per_minute, burst)
+    semaphore = asyncio.Semaphore(max_concurrent_tickers)
+    fetched, failed = [], {}
+
+    async def fetch_and_store(session, ticker):
+        # A failed store write fails only its ticker, like a failed fetch, instead of the whole gather
+        try:
+            async with semaphore:
+                financial_data = await fetch_ticker(session, bucket, ticker, api_key, base_url, max_retries,
+                                                    backoff_seconds)
+            # The SQLite write blocks, so it runs on a thread instead of stalling the other tickers' requests
+            await asyncio.to_thread(store.put, ticker, financial_data)
+        except Exception as e:
+            failed[ticker] = e
+            if on_result:
+                on_result(ticker, None, e)
+            return
+        fetched.append(ticker)
+        if on_result:
+            on_result(ticker, financial_data, None)
+
+    connector = aiohttp.TCPConnector(limit=max_concurrent_tickers * 4)
+    timeout = aiohttp.ClientTimeout(total=60)
+    async with aiohttp.ClientSession(connector=connector, timeout=timeout) as session:
+        await asyncio.gather(*(fetch_and_store(session, ticker) for ticker in tickers))
+
+    return {"fetched": fetched, "failed": failed}
+
+
+def refresh_universe(tickers, api_key, store=None, **kwargs):
+    """
+    Blocking wrapper around fetch_universe.
+
+    Args:
+    tickers (list): The stock ticker symbols to fetch.
+    api_key (str): The Alpha Vantage API key.
+    store (FundamentalsStore, optional): The store the results are written to.
+    **kwargs: Further options passed on to fetch_universe.
+
+    Returns:
+    dict: The 'fetched' tickers and the 'failed' tickers mapped to their errors.
+    """
+    return asyncio.run(fetch_universe(tickers, api_key, store=store, **kwargs))
@@ -0,0 +1,319 @@
+import argparse
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from batch_runner import read_tickers
+from batch_valuation import batch_dcf_valuation
+from compact_financials import CompactFinancials, FieldIndex
+from fundamentals_store import FundamentalsStore, DEFAULT_STORE_PATH
+from instrumentation import timed
+from llm_parsing import parse_forecast_values
+from statistical_forecasting import StatisticalForecaster, FORECAST_METHODS, FORECAST_METRICS
+from valuation_graph import llm_cashflow_forecaster
+
+DEFAULT_MIN_HISTORY = 3
+DEFAULT_HOLDING_PERIOD_DAYS = 365
+DEFAULT_REPORTING_LAG_DAYS = 90
+DEFAULT_CHUNK_SIZE = 500
+BACKTEST_COLUMNS = ["ticker", "as_of", "fiscal_year", "first_year", "discount_rate", "perpetual_growth_rate",
+                    "shares_outstanding"]
+
+logger = logging.getLogger(__name__)
+
+
+def llm_backtest_forecaster(ticker, compact, time_period, first_year):
+    """
+    Forecast a point-in-time record with the model, through the model response cache.
+
+    The model may know what happened after the as-of date, so model backtests carry look-ahead bias; the
+    statistical forecasters only ever see the truncated history.
+
+    Args:
+    ticker (str): The stock ticker symbol.
+    compact (CompactFinancials): The financials known at the as-of date.
+    time_period (int): The number of forecast years.
+    first_year (int): The first forecast year.
+
+    Returns:
+    tuple: The operating cash flow and capital expenditures forecasts as JSON strings.
+    """
+    return llm_cashflow_forecaster(ticker, compact.to_frame(), time_period, first_year)
+
+
+def _forecast_free_cash_flows(forecaster, ticker, compact, time_period, first_year):
+    # Statistical forecasters project the arrays directly, skipping the JSON round trip of the model path
+    if isinstance(forecaster, StatisticalForecaster):
+        operating_cashflow, capital_expenditures = (forecaster.project(compact[metric], time_period)
+                                                    for metric in FORECAST_METRICS)
+        return np.subtract(operating_cashflow, capital_expenditures)
+    operating_cashflow_json, capital_expenditures_json = forecaster(ticker, compact, time_period, first_year)
+    operating_cashflow = parse_forecast_values(operating_cashflow_json)
+    capital_expenditures = parse_forecast_values(capital_expenditures_json)
+    return np.array([operating_cashflow[year] - capital_expenditures[year] for year in operating_cashflow])
+
+
+def _per_ticker(values, ticker):
+    return float(values[ticker] if isinstance(values, dict) else values)
+
+
+@timed("backtest")
+def backtest_valuations(financial_data, discount_rates, perpetual_growth_rates, forecaster=None, time_period=10,
+                        min_history=DEFAULT_MIN_HISTORY, first_as_of_year=None, last_as_of_year=None,
+                        point_in_time_shares=True, convention="end", field_index=None):
+    """
+    Replay the valuation of many tickers as of each past fiscal year, using only data known at that point.
+
+    For every ticker and fiscal year, the history is truncated after that year, the cash flows are forecast
+    from the truncated history starting the following year, and net debt is taken from that year's balance
+    sheet. All (ticker, year) valuations then run through batch_dcf_valuation in one pass.
+
+    Args:
+    financial_data (dict): Financial data as returned by fetch_financial_data (e.g. from
+        FundamentalsStore.get_many) or CompactFinancials, keyed by ticker.
+    discount_rates (float or dict): The discount rate of every ticker, or one rate per ticker.
+    perpetual_growth_rates (float or dict): The perpetual growth rate of every ticker, or one rate per ticker.
+    forecaster (callable, optional): Called with (ticker, compact, time_period, first_year) where compact is
+        the point-in-time CompactFinancials; returns the operating cash flow and capital expenditures
+        forecasts as JSON strings. Defaults to StatisticalForecaster().
+    time_period (int): The number of forecast years.
+    min_history (int): The number of historical years required before the first as-of year.
+    first_as_of_year (int, optional): The first fiscal year to value as of.
+    last_as_of_year (int, optional): The last fiscal year to value as of.
+    point_in_time_shares (bool): Whether to use the share count reported in each year's balance sheet
+        (commonStockSharesOutstanding) instead of the current shares outstanding. Years without a reported
+        count are left without a share count, so their per-share value is NaN.
+    convention (str): The discounting convention of batch_dcf_valuation, 'end' or 'mid_year'.
+    field_index (FieldIndex, optional): The index shared by the converted records.
+
+    Returns:
+    tuple: A DataFrame with one row per valued (ticker, as-of fiscal year), sorted by ticker and year, and
+    a dict mapping the (ticker, as_of) pairs that failed to their errors.
+    """
+    forecaster = forecaster or StatisticalForecaster()
+    field_index = field_index or FieldIndex()
+    rows, free_cash_flows, failures = [], [], {}
+    total_debt, cash_and_equivalents = [], []
+
+    for ticker, data in financial_data.items():
+        try:
+            compact = data if isinstance(data, CompactFinancials) else \
+                CompactFinancials.from_financial_data(ticker, data, field_index)
+            liabilities = compact['totalLiabilities']
+            cash = compact['cashAndCashEquivalentsAtCarryingValue']
+        except Exception as e:
+            logger.warning("Backtest of %s failed: %s", ticker, e)
+            failures[(ticker, None)] = e
+            continue
+        if not point_in_time_shares:
+            reported_shares = None
+        elif 'commonStockSharesOutstanding' in compact:
+            reported_shares = compact['commonStockSharesOutstanding']
+        else:
+            reported_shares = np.full(len(compact.fiscal_years), np.nan)
+
+        for position, fiscal_year in enumerate(compact.fiscal_years.tolist()):
+            if position + 1 < min_history or (first_as_of_year is not None and fiscal_year < first_as_of_year) or \
+                    (last_as_of_year is not None and fiscal_year > last_as_of_year):
+                continue
+            fiscal_date = int(compact.fiscal_dates[position])
+            as_of = f"{fiscal_date // 10000:04d}-{fiscal_date // 100 % 100:02d}-{fiscal_date % 100:02d}"
+            try:
+                fcf = _forecast_free_cash_flows(forecaster, ticker, compact.truncate(position + 1), time_period,
+                                                fiscal_year + 1)
+                if len(fcf) != time_period:
+                    raise ValueError(f"Expected {time_period} forecast years, got {len(fcf)}")
+            except Exception as e:
+                logger.warning("Backtest of %s as of %s failed: %s", ticker, as_of, e)
+                failures[(ticker, as_of)] = e
+                continue
+
+            # Today's share count would leak later buybacks and issuance into the past valuation
+            shares_outstanding = compact.shares_outstanding
+            if reported_shares is not None:
+                shares_outstanding = float(reported_shares[position]) \
+                    if np.isfinite(reported_shares[position]) and reported_shares[position] > 0 else np.nan
+            rows.append((ticker, as_of, fiscal_year, fiscal_year + 1, _per_ticker(discount_rates, ticker),
+                         _per_ticker(perpetual_growth_rates, ticker), shares_outstanding))
+            free_cash_flows.append(fcf)
+            total_debt.append(liabilities[position])
+            cash_and_equivalents.append(cash[position])
+
+    valuations = pd.DataFrame(rows, columns=BACKTEST_COLUMNS)
+    if rows:
+        results = batch_dcf_valuation(np.vstack(free_cash_flows), valuations["discount_rate"].to_numpy(),
+                                      valuations["perpetual_growth_rate"].to_numpy(), np.array(total_debt),
+                                      np.array(cash_and_equivalents), valuations["shares_outstanding"].to_numpy(),
+                                      convention=convention)
+        valuations = pd.concat([valuations, results.reset_index(drop=True)], axis=1)
+    return valuations.sort_values(["ticker", "fiscal_year"], ignore_index=True), failures
+
+
+def compare_to_prices(valuations, prices, holding_period_days=DEFAULT_HOLDING_PERIOD_DAYS,
+                      reporting_lag_days=DEFAULT_REPORTING_LAG_DAYS):
+    """
+    Line the backtest valuations up with market prices.
+
+    A fiscal year's statements are only published some time after its end, so each valuation is priced at
+    the as-of date plus the reporting lag, when the valuation could first have been made.
+
+    Args:
+    valuations (DataFrame): The valuations from backtest_valuations.
+    prices (DataFrame): Prices indexed by date, one column per ticker.
+    holding_period_days (int): The number of days after the priced date at which the forward price is taken.
+    reporting_lag_days (int): The number of days after the as-of fiscal date at which its statements are
+        assumed to be public.
+
+    Returns:
+    DataFrame: The valuations with the last 'price' on or before the as-of date plus the reporting lag, the
+    'upside' of the per-share value over that price, and the 'forward_price' and 'forward_return' after the
+    holding period. Prices are NaN for dates after a ticker's last quote, e.g. once it was delisted.
+    """
+    long_prices = prices.rename_axis("date").reset_index().melt(id_vars="date", var_name="ticker", value_name="price")
+    long_prices["date"] = pd.to_datetime(long_prices["date"])
+    long_prices = long_prices.dropna(subset=["price"]).sort_values("date")
+
+    compared = valuations.assign(
+        priced_date=pd.to_datetime(valuations["as_of"]) + pd.Timedelta(days=reporting_lag_days))
+    compared["forward_date"] = compared["priced_date"] + pd.Timedelta(days=holding_period_days)
+    compared = pd.merge_asof(compared.sort_values("priced_date"), long_prices, left_on="priced_date",
+                             right_on="date", by="ticker").drop(columns="date")
+    compared = pd.merge_asof(compared.sort_values("forward_date"),
+                             long_prices.rename(columns={"price": "forward_price"}), left_on="forward_date",
+                             right_on="date", by="ticker").drop(columns="date")
+    # merge_asof carries a ticker's last quote forward indefinitely, so dates after it have no price
+    last_quote_date = compared["ticker"].map(long_prices.groupby("ticker")["date"].max())
+    compared.loc[compared["priced_date"] > last_quote_date, "price"] = np.nan
+    compared.loc[compared["forward_date"] > last_quote_date, "forward_price"] = np.nan
+
+    compared["upside"] = compared["Per Share Value"] / compared["price"] - 1
+    compared["forward_return"] = compared["forward_price"] / compared["price"] - 1
+    return compared.drop(columns=["priced_date", "forward_date"]).sort_values(["ticker", "fiscal_year"],
+                                                                             ignore_index=True)
+
+
+def summarize_backtest(compared):
+    """
+    Summarize how well the valuations anticipated price moves, per as-of fiscal year.
+
+    Args:
+    compared (DataFrame): The output of compare_to_prices.
+
+    Returns:
+    DataFrame: Indexed by fiscal year, with the number of priced 'tickers', the 'median_upside', the
+    'rank_correlation' between upside and forward return, and the 'hit_rate' of upsides whose sign
+    matched the forward return.
+    """
+    priced = compared.dropna(subset=["upside", "forward_return"])
+    priced = priced[np.isfinite(priced["upside"])]
+
+    def summarize(group):
+        return pd.Series({
+            "tickers": len(group),
+            "median_upside": group["upside"].median(),
+            "rank_correlation": group["upside"].rank().corr(group["forward_return"].rank())
+            if len(group) > 1 else np.nan,
+            "hit_rate": (np.sign(group["upside"]) == np.sign(group["forward_return"])).mean(),
+        })
+
+    return priced.groupby("fiscal_year")[["upside", "forward_return"]].apply(summarize)
+
+
+def backtest_universe(tickers, store, discount_rate, perpetual_growth_rate, chunk_size=DEFAULT_CHUNK_SIZE, **kwargs):
+    """
+    Backtest tickers from the fundamentals store, converting them to compact records chunk by chunk.
+
+    Only the compact records of the universe are kept in memory; the statement DataFrames of a chunk are
+    dropped once converted.
+
+    Args:
+    tickers (list): The stock ticker symbols.
+    store (FundamentalsStore): The fundamentals store to read from.
+    discount_rate (float or dict): The discount rate of every ticker, or one rate per ticker.
+    perpetual_growth_rate (float or dict): The perpetual growth rate of every ticker, or one rate per ticker.
+    chunk_size (int): The number of tickers loaded from the store at once.
+    **kwargs: Further options of backtest_valuations.
+
+    Returns:
+    tuple: The valuations DataFrame and the failures, as returned by backtest_valuations.
+    """
+    field_index = FieldIndex()
+    compacts, failures = {}, {}
+    for start in range(0, len(tickers), chunk_size):
+        chunk = tickers[start:start + chunk_size]
+        stored_data = store.get_many(chunk, allow_stale=True)
+        for ticker in chunk:
+            if ticker not in stored_data:
+                failures[(ticker, None)] = LookupError(f"No financial data available for {ticker}")
+                continue
+            try:
+                compacts[ticker] = CompactFinancials.from_financial_data(ticker, stored_data[ticker], field_index)
+            except Exception as e:
+                failures[(ticker, None)] = e
+        del stored_data
+
+    valuations, backtest_failures = backtest_valuations(compacts, discount_rate, perpetual_growth_rate,
+                                                        field_index=field_index, **kwargs)
+    failures.update(backtest_failures)
+    return valuations, failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backtest point-in-time DCF valuations over past fiscal years.")
+    parser.add_argument("tickers", nargs="?", default="-",
+                        help="File with one ticker per line, or '-' to read from stdin (default).")
+    parser.add_argument("-o", "--output", default="backtest.csv", help="Where the valuations are written.")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="Path of the fundamentals store.")
+    parser.add_argument("--discount-rate", type=float, required=True, help="Discount rate of every ticker.")
+    parser.add_argument("--growth-rate", type=float, required=True, help="Perpetual growth rate of every ticker.")
+    parser.add_argument("--forecaster", choices=("llm", *FORECAST_METHODS), default="regression",
+                        help="Cash flow forecaster; the model path carries look-ahead bias.")
+    parser.add_argument("--time-period", type=int, default=10, help="Number of forecast years.")
+    parser.add_argument("--min-history", type=int, default=DEFAULT_MIN_HISTORY,
+                        help="Historical years required before the first as-of year.")
+    parser.add_argument("--from-year", type=int, help="First fiscal year to value as of.")
+    parser.add_argument("--to-year", type=int, help="Last fiscal year to value as of.")
+    parser.add_argument("--prices", help="CSV of prices, a date column followed by one column per ticker.")
+    parser.add_argument("--holding-period-days", type=int, default=DEFAULT_HOLDING_PERIOD_DAYS,
+                        help="Days after the priced date at which forward returns are measured.")
+    parser.add_argument("--reporting-lag-days", type=int, default=DEFAULT_REPORTING_LAG_DAYS,
+                        help="Days after a fiscal year end until its statements are public and it is priced.")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Tickers loaded from the store at once.")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=os.getenv("AUTODCF_LOG_LEVEL", "WARNING"))
+
+    if args.tickers == "-":
+        tickers = read_tickers(sys.stdin)
+    else:
+        with open(args.tickers) as file:
+            tickers = read_tickers(file)
+
+    started_at = time.perf_counter()
+    forecaster = llm_backtest_forecaster if args.forecaster == "llm" else StatisticalForecaster(args.forecaster)
+    with FundamentalsStore(args.store) as store:
+        valuations, failures = backtest_universe(
+            tickers, store, args.discount_rate, args.growth_rate, chunk_size=args.chunk_size, forecaster=forecaster,
+            time_period=args.time_period, min_history=args.min_history, first_as_of_year=args.from_year,
+            last_as_of_year=args.to_year)
+
+    if args.prices:
+        valuations = compare_to_prices(valuations, pd.read_csv(args.prices, index_col=0),
+                                       args.holding_period_days, args.reporting_lag_days)
+        print(summarize_backtest(valuations).to_string(), file=sys.stderr)
+    valuations.to_csv(args.output, index=False)
+
+    print(f"Backtested {len(valuations)} ticker-years of {valuations['ticker'].nunique() if len(valuations) else 0} "
+          f"tickers, {len(failures)} failed in {time.perf_counter() - started_at:.1f}s", file=sys.stderr)
+    return 1 if failures and valuations.empty else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,428 @@
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from forecast_orchestrator import run_forecasts, DEFAULT_MAX_CONCURRENCY
+from fundamentals_store import FundamentalsStore, DEFAULT_STORE_PATH
+from instrumentation import get_registry
+from main import extract_detailed_financials_frame, value_from_forecasts
+from statistical_forecasting import StatisticalForecaster, FORECAST_METHODS
+from support_functions import extract_historicals
+
+DEFAULT_CHUNK_SIZE = 500
+RESULT_FIELDS = ["ticker", "per_share_value", "discount_rate", "perpetual_growth_rate", "time_period", "first_year",
+                 "valued_at"]
+OUTPUT_FORMATS = ("csv", "jsonl", "parquet")
+
+logger = logging.getLogger(__name__)
+
+
+def read_tickers(lines):
+    """
+    Parse a ticker list, one ticker per line.
+
+    Blank lines and '#' comments are ignored, commas and whitespace also separate tickers, and duplicates
+    are dropped while keeping the first occurrence.
+
+    Args:
+    lines (iterable): The lines of the ticker file.
+
+    Returns:
+    list: The upper-cased tickers in file order.
+    """
+    tickers = {}
+    for line in lines:
+        for ticker in line.split("#", 1)[0].replace(",", " ").split():
+            tickers.setdefault(ticker.upper(), None)
+    return list(tickers)
+
+
+class Checkpoint:
+    """
+    Append-only JSON lines record of finished tickers, so an interrupted run can resume where it stopped.
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+        path (str): Path of the checkpoint file; existing entries are loaded.
+        """
+        self.path = path
+        self.completed = set()
+        self.failed = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # A line cut off by an interrupted write
+                        continue
+                    if entry["status"] == "ok":
+                        self.completed.add(entry["ticker"])
+                        self.failed.pop(entry["ticker"], None)
+                    else:
+                        self.failed[entry["ticker"]] = entry.get("error")
+        self._file = open(path, "a")
+
+    def record(self, ticker, error=None):
+        """
+        Mark a ticker as finished.
+
+        Args:
+        ticker (str): The stock ticker symbol.
+        error (Exception, optional): The error that made the ticker fail.
+        """
+        entry = {"ticker": ticker, "status": "ok" if error is None else "failed",
+                 "finished_at": datetime.now(timezone.utc).isoformat()}
+        if error is None:
+            self.completed.add(ticker)
+            self.failed.pop(ticker, None)
+        else:
+            entry["error"] = f"{type(error).__name__}: {error}"
+            self.failed[ticker] = entry["error"]
+        self._file.write(json.dumps(entry) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class CSVResultWriter:
+    rows_per_flush = 1
+
+    def __init__(self, path):
+        write_header = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, "a", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=RESULT_FIELDS)
+        if write_header:
+            self._writer.writeheader()
+
+    def write(self, rows):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class JSONLinesResultWriter:
+    rows_per_flush = 1
+
+    def __init__(self, path):
+        self._file = open(path, "a")
+
+    def write(self, rows):
+        self._file.write("".join(json.dumps(row) + "\n" for row in rows))
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def parquet_part_paths(path):
+    """
+    List a Parquet output file and the '<name>.partN.parquet' files written next to it, in write order.
+
+    Args:
+    path (str): The Parquet output path given to ParquetResultWriter.
+
+    Returns:
+    list: The existing paths; read them together, e.g. with pyarrow.parquet.read_table(paths).
+    """
+    stem, extension = os.path.splitext(path)
+    paths = [path] if os.path.exists(path) else []
+    part = 1
+    while os.path.exists(f"{stem}.part{part}{extension or '.parquet'}"):
+        paths.append(f"{stem}.part{part}{extension or '.parquet'}")
+        part += 1
+    return paths
+
+
+class ParquetResultWriter:
+    """
+    Writes results as Parquet files. A Parquet file is only readable once its footer is written, so every
+    write produces a complete file: the first one at the output path and the next ones as
+    '<name>.partN.parquet' next to it. Each file is written under a temporary name and renamed into place,
+    so the rows are durable before their tickers are checkpointed and an interrupted run never leaves an
+    unreadable file behind.
+    """
+
+    rows_per_flush = 1000
+
+    def __init__(self, path):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.path = path
+        self._pa = pa
+        self._pq = pq
+        self._schema = pa.schema([("ticker", pa.string()), ("per_share_value", pa.float64()),
+                                  ("discount_rate", pa.float64()), ("perpetual_growth_rate", pa.float64()),
+                                  ("time_period", pa.int64()), ("first_year", pa.int64()),
+                                  ("valued_at", pa.string())])
+
+    def write(self, rows):
+        stem, extension = os.path.splitext(self.path)
+        part_path = self.path
+        part = 1
+        while os.path.exists(part_path):
+            part_path = f"{stem}.part{part}{extension or '.parquet'}"
+            part += 1
+        temporary_path = f"{part_path}.tmp"
+        self._pq.write_table(self._pa.Table.from_pylist(rows, schema=self._schema), temporary_path)
+        os.replace(temporary_path, part_path)
+
+    def close(self):
+        pass
+
+
+RESULT_WRITERS = {
+    "csv": CSVResultWriter,
+    "jsonl": JSONLinesResultWriter,
+    "parquet": ParquetResultWriter,
+}
+
+
+def value_universe(tickers, writer, checkpoint, api_key=None, time_period=10, first_year=2024, store=None,
+                   chunk_size=DEFAULT_CHUNK_SIZE, max_concurrency=DEFAULT_MAX_CONCURRENCY, batch_size=None,
+                   bypass_cache=False, fetch=True, requests_per_minute=None, forecaster=None, discount_rate=None,
+                   perpetual_growth_rate=None, processes=None):
+    """
+    Value a universe of tickers in one process, streaming each result out as it completes.
+
+    Tickers are processed in chunks: stale fundamentals are refreshed concurrently, the chunk is loaded from
+    the store in one query, and the model forecasts run on the forecast orchestrator's worker pool. Each
+    ticker is valued as soon as its forecasts arrive, on a valuation thread so the orchestrator's event loop
+    keeps dispatching model calls meanwhile. A ticker is recorded in the checkpoint only after its
+    result has been written, and tickers already completed in the checkpoint are skipped.
+
+    With a local forecaster and both rates given, no model requests are made; with processes set, such
+    offline runs are valued on a process pool by value_universe_parallel.
+
+    Args:
+    tickers (list): The stock ticker symbols to value.
+    writer: A result writer from RESULT_WRITERS.
+    checkpoint (Checkpoint): The checkpoint of finished tickers.
+    api_key (str, optional): The Alpha Vantage API key. Without it, only data already in the store is used.
+    time_period (int): The number of forecast years.
+    first_year (int): The first forecast year.
+    store (FundamentalsStore, optional): The fundamentals store to read from and write to.
+    chunk_size (int): The number of tickers loaded and forecast together.
+    max_concurrency (int): The maximum number of model calls in flight.
+    batch_size (int, optional): The number of tickers per batched cash flow request.
+    bypass_cache (bool): Whether to skip the model response cache.
+    fetch (bool): Whether to refresh stale fundamentals from Alpha Vantage.
+    requests_per_minute (float, optional): The Alpha Vantage quota; defaults to fetch_universe's.
+    forecaster (callable, optional): A local cash flow forecaster such as a StatisticalForecaster, replacing
+        the model's cash flow forecasts.
+    discount_rate (float, optional): The discount rate to use instead of the model's.
+    perpetual_growth_rate (float, optional): The perpetual growth rate to use instead of the model's.
+    processes (int, optional): The number of worker processes for offline runs.
+
+    Returns:
+    dict: The number of 'valued' and 'skipped' tickers and the 'failed' tickers mapped to their errors.
+    """
+    store = store or FundamentalsStore()
+    pending_tickers = [ticker for ticker in tickers if ticker not in checkpoint.completed]
+    summary = {"valued": 0, "skipped": len(tickers) - len(pending_tickers), "failed": {}}
+    pending_rows, pending_checkpoints = [], []
+    rates = None
+    if discount_rate is not None and perpetual_growth_rate is not None:
+        rates = (discount_rate, perpetual_growth_rate)
+    offline = forecaster is not None and rates is not None
+
+    def flush():
+        if pending_rows:
+            writer.write(pending_rows)
+        for ticker in pending_checkpoints:
+            checkpoint.record(ticker)
+        pending_rows.clear()
+        pending_checkpoints.clear()
+
+    def fail(ticker, error):
+        logger.warning("Valuation of %s failed: %s", ticker, error)
+        summary["failed"][ticker] = error
+        checkpoint.record(ticker, error)
+
+    def succeed(ticker, per_share_value, ticker_discount_rate, ticker_perpetual_growth_rate):
+        pending_rows.append({
+            "ticker": ticker,
+            "per_share_value": float(per_share_value),
+            "discount_rate": ticker_discount_rate,
+            "perpetual_growth_rate": ticker_perpetual_growth_rate,
+            "time_period": time_period,
+            "first_year": first_year,
+            "valued_at": datetime.now(timezone.utc).isoformat(),
+        })
+        pending_checkpoints.append(ticker)
+        summary["valued"] += 1
+        if len(pending_rows) >= writer.rows_per_flush:
+            flush()
+
+    for start in range(0, len(pending_tickers), chunk_size):
+        chunk = pending_tickers[start:start + chunk_size]
+
+        if fetch and api_key:
+            from async_fetch import refresh_universe
+
+            fetch_options = {"requests_per_minute": requests_per_minute} if requests_per_minute else {}
+            refresh_universe(chunk, api_key, store=store, **fetch_options)
+        stored_data = store.get_many(chunk, allow_stale=True)
+        chunk_data = {ticker: stored_data[ticker] for ticker in chunk if ticker in stored_data}
+        for ticker in chunk:
+            if ticker not in chunk_data:
+                fail(ticker, LookupError(f"No financial data available for {ticker}"))
+
+        if offline and processes:
+            from parallel_valuation import value_universe_parallel
+
+            values = value_universe_parallel(chunk_data, discount_rate, perpetual_growth_rate, forecaster,
+                                             time_period, first_year, max_workers=processes)
+            for ticker, per_share_value in values.items():
+                if isinstance(per_share_value, Exception):
+                    fail(ticker, per_share_value)
+                else:
+                    succeed(ticker, per_share_value, float(discount_rate), float(perpetual_growth_rate))
+            flush()
+            continue
+
+        inputs, jobs, cashflow_forecasts = {}, [], {}
+        for ticker, financial_data in chunk_data.items():
+            try:
+                historical_df, num_years_historicals = extract_detailed_financials_frame(
+                    financial_data["income_statement"], financial_data["balance_sheet"], financial_data["cash_flow"])
+                operating_cashflow_historicals, capex_historicals = extract_historicals(historical_df)
+                if forecaster is not None:
+                    operating_cashflow_json, capital_expenditures_json = forecaster(ticker, historical_df, time_period,
+                                                                                    first_year)
+                    cashflow_forecasts[ticker] = {"operating_cashflow_json": operating_cashflow_json,
+                                                  "capital_expenditures_json": capital_expenditures_json}
+            except Exception as e:
+                fail(ticker, e)
+                continue
+            inputs[ticker] = (financial_data, historical_df, num_years_historicals)
+            jobs.append((ticker, operating_cashflow_historicals, capex_historicals))
+
+        def value_result(ticker, forecasts, error):
+            if error is None:
+                if discount_rate is not None:
+                    forecasts["discount_rate"] = float(discount_rate)
+                if perpetual_growth_rate is not None:
+                    forecasts["perpetual_growth_rate"] = float(perpetual_growth_rate)
+                try:
+                    per_share_value = value_from_forecasts(*inputs.pop(ticker), forecasts)
+                except Exception as e:
+                    error = e
+            if error is not None:
+                fail(ticker, error)
+                return
+            succeed(ticker, per_share_value, forecasts["discount_rate"], forecasts["perpetual_growth_rate"])
+
+        if offline:
+            for ticker, _, _ in jobs:
+                value_result(ticker, dict(cashflow_forecasts[ticker]), None)
+        elif jobs:
+            # on_result runs on the event loop thread; the DCF and the writes go to a single valuation thread,
+            # which also keeps the rows and the checkpoint free of concurrent updates
+            valuations = []
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="valuation") as valuation_executor:
+                run_forecasts(jobs, time_period, first_year, max_concurrency=max_concurrency,
+                              bypass_cache=bypass_cache, batch_size=batch_size, cashflow_forecasts=cashflow_forecasts,
+                              rates=rates, on_result=lambda *result: valuations.append(
+                                  valuation_executor.submit(value_result, *result)))
+            for valuation in valuations:
+                valuation.result()
+        flush()
+
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Value a universe of tickers with the DCF pipeline.")
+    parser.add_argument("tickers", nargs="?", default="-",
+                        help="File with one ticker per line, or '-' to read from stdin (default).")
+    parser.add_argument("-o", "--output", default="valuations.csv", help="Where results are streamed to.")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS,
+                        help="Output format; inferred from the output file extension by default.")
+    parser.add_argument("--checkpoint", help="Checkpoint file; defaults to '<output>.checkpoint.jsonl'.")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint and value every ticker.")
+    parser.add_argument("--time-period", type=int, default=10, help="Number of forecast years.")
+    parser.add_argument("--first-year", type=int, default=2024, help="First forecast year.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help="Maximum number of model calls in flight.")
+    parser.add_argument("--batch-size", type=int, help="Tickers per batched cash flow forecast request.")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Tickers loaded and forecast together.")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="Path of the fundamentals store.")
+    parser.add_argument("--no-fetch", action="store_true", help="Only use fundamentals already in the store.")
+    parser.add_argument("--requests-per-minute", type=float, help="Alpha Vantage request quota.")
+    parser.add_argument("--bypass-cache", action="store_true", help="Skip the model response cache.")
+    parser.add_argument("--forecaster", choices=("llm", *FORECAST_METHODS), default="llm",
+                        help="Cash flow forecaster: the model, or a local statistical method.")
+    parser.add_argument("--discount-rate", type=float, help="Discount rate to use instead of the model's.")
+    parser.add_argument("--growth-rate", type=float, help="Perpetual growth rate to use instead of the model's.")
+    parser.add_argument("--processes", type=int,
+                        help="Worker processes for offline runs (local forecaster and both rates given).")
+    parser.add_argument("--metrics", help="Append the run's metrics as JSON lines to this file.")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=os.getenv("AUTODCF_LOG_LEVEL", "WARNING"))
+
+    if args.tickers == "-":
+        tickers = read_tickers(sys.stdin)
+    else:
+        with open(args.tickers) as file:
+            tickers = read_tickers(file)
+
+    output_format = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+    if output_format not in RESULT_WRITERS:
+        parser.error(f"cannot infer the output format from '{args.output}', pass --format")
+    checkpoint_path = args.checkpoint or f"{args.output}.checkpoint.jsonl"
+    if args.restart:
+        paths = [checkpoint_path, args.output]
+        if output_format == "parquet":
+            paths += parquet_part_paths(args.output)
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    api_key = os.getenv("ALPHAVANTAGE_API_KEY")
+    if not api_key and not args.no_fetch:
+        print("ALPHAVANTAGE_API_KEY is not set, only fundamentals already in the store are used.", file=sys.stderr)
+
+    started_at = time.perf_counter()
+    checkpoint = Checkpoint(checkpoint_path)
+    writer = RESULT_WRITERS[output_format](args.output)
+    try:
+        with FundamentalsStore(args.store) as store:
+            summary = value_universe(tickers, writer, checkpoint, api_key, args.time_period, args.first_year, store,
+                                     chunk_size=args.chunk_size, max_concurrency=args.workers,
+                                     batch_size=args.batch_size, bypass_cache=args.bypass_cache,
+                                     fetch=not args.no_fetch, requests_per_minute=args.requests_per_minute,
+                                     forecaster=None if args.forecaster == "llm" else StatisticalForecaster(args.forecaster),
+                                     discount_rate=args.discount_rate, perpetual_growth_rate=args.growth_rate,
+                                     processes=args.processes)
+    finally:
+        writer.close()
+        checkpoint.close()
+        if args.metrics:
+            with open(args.metrics, "a") as file:
+                file.write(get_registry().to_json_lines())
+
+    print(f"Valued {summary['valued']} tickers, skipped {summary['skipped']} already completed, "
+          f"{len(summary['failed'])} failed in {time.perf_counter() - started_at:.1f}s", file=sys.stderr)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+import numpy as np
+import pandas as pd
+
+from support_functions import calculate_terminal_value
+from calculation_functions import adjust_for_net_debt
+from discounting import discount_factor_matrix, discount_periods, terminal_periods
+
+
+def forecast_free_cash_flows(df, historical_years):
+    """
+    Extract the forecast-period Free Cash Flow vector from a combined historical and forecast DataFrame.
+
+    Args:
+    df (DataFrame): The financial data, including 'operatingCashflow', 'capitalExpenditures' and 'fiscalDateEnding'.
+    historical_years (int): The number of years of historical data in the DataFrame.
+
+    Returns:
+    ndarray: The Free Cash Flow of each forecast year, ordered by fiscal date.
+    """
+    df = df.sort_values(by='fiscalDateEnding')
+    operating_cashflow = pd.to_numeric(df['operatingCashflow'], errors='coerce').to_numpy(dtype=float)
+    capital_expenditures = pd.to_numeric(df['capitalExpenditures'], errors='coerce').to_numpy(dtype=float)
+    return (operating_cashflow - capital_expenditures)[historical_years:]
+
+
+def stack_free_cash_flows(dfs, historical_years):
+    """
+    Stack the forecast Free Cash Flows of several tickers into a single matrix.
+
+    Args:
+    dfs (list): Combined historical and forecast DataFrames, one per ticker.
+    historical_years (list): The number of historical years in each DataFrame.
+
+    Returns:
+    ndarray: An N x T matrix of Free Cash Flows (tickers x forecast years).
+    """
+    rows = [forecast_free_cash_flows(df, years) for df, years in zip(dfs, historical_years)]
+    horizons = {len(row) for row in rows}
+    if len(horizons) > 1:
+        raise ValueError(f"All tickers must share the same forecast horizon, got {sorted(horizons)}")
+    return np.vstack(rows)
+
+
+def extract_net_debt_inputs(balance_sheet_dfs):
+    """
+    Extract the latest total debt and cash positions from several balance sheets.
+
+    Args:
+    balance_sheet_dfs (list): Balance sheet DataFrames with the latest fiscal year in the first row.
+
+    Returns:
+    tuple: Arrays of total debt and of cash and cash equivalents, one entry per ticker.
+    """
+    total_debt = np.array([float(df.iloc[0]['totalLiabilities']) for df in balance_sheet_dfs])
+    cash_and_equivalents = np.array([float(df.iloc[0]['cashAndCashEquivalentsAtCarryingValue'])
+                                     for df in balance_sheet_dfs])
+    return total_debt, cash_and_equivalents
+
+
+def batch_dcf_valuation(fcf_matrix, discount_rates, perpetual_growth_rates, total_debt, cash_and_equivalents,
+                        shares_outstanding, years_in_future=None, tickers=None, convention="end"):
+    """
+    Perform the DCF analysis for many tickers at once using array operations.
+
+    Mirrors perform_dcf_analysis: each forecast FCF is discounted by its years in future (the first forecast
+    year is year 0), the Gordon terminal value is discounted from the end of the last forecast year, and the enterprise
+    value is adjusted for net debt before the per-share value is calculated. Discount factor vectors come
+    from the discounting kernel's cache, so tickers sharing a discount rate share one vector.
+
+    Args:
+    fcf_matrix (ndarray): An N x T matrix of forecast Free Cash Flows (tickers x forecast years).
+    discount_rates (float or ndarray): The discount rate (WACC) of each ticker.
+    perpetual_growth_rates (float or ndarray): The perpetual growth rate of each ticker.
+    total_debt (float or ndarray): The total debt of each ticker.
+    cash_and_equivalents (float or ndarray): The cash and cash equivalents of each ticker.
+    shares_outstanding (float or ndarray): The number of shares outstanding of each ticker.
+    years_in_future (ndarray, optional): Years in future of each forecast column, either T or N x T.
+        Defaults to the periods of convention.
+    tickers (list, optional): Labels for the rows of the result.
+    convention (str): 'end' (0..T-1, as perform_dcf_analysis) or 'mid_year' (-0.5..T-1.5); exact day counts
+        are passed as years_in_future, see discount_periods.
+
+    Returns:
+    DataFrame: One row per ticker with the intermediate values and the per-share value.
+    """
+    fcf_matrix = np.atleast_2d(np.asarray(fcf_matrix, dtype=float))
+    num_tickers, horizon = fcf_matrix.shape
+
+    def per_ticker(values):
+        return np.broadcast_to(np.asarray(values, dtype=float), (num_tickers,))
+
+    discount_rates = per_ticker(discount_rates)
+    perpetual_growth_rates = per_ticker(perpetual_growth_rates)
+    total_debt = per_ticker(total_debt)
+    cash_and_equivalents = per_ticker(cash_and_equivalents)
+    shares_outstanding = per_ticker(shares_outstanding)
+
+    if years_in_future is None:
+        years_in_future = discount_periods(horizon, convention)
+    years_in_future = np.asarray(years_in_future, dtype=float)
+    factors = discount_factor_matrix(discount_rates, years_in_future)
+    terminal_factor = (1 + discount_rates) ** -terminal_periods(years_in_future, convention)
+
+    # Discount Future FCFs and sum their Present Values
+    total_present_value_of_fcfs = (fcf_matrix * factors).sum(axis=1)
+
+    # Terminal Value at the end of the projection period, discounted back to its present value
+    terminal_value = calculate_terminal_value(fcf_matrix[:, -1], perpetual_growth_rates, discount_rates)
+    present_value_of_terminal_value = terminal_value * terminal_factor
+
+    total_enterprise_value = total_present_value_of_fcfs + present_value_of_terminal_value
+    adjusted_enterprise_value = adjust_for_net_debt(total_enterprise_value, total_debt, cash_and_equivalents)
+
+    # Equity Value and Per-Share Value, as in calculate_equity_and_per_share_value
+    equity_value = adjusted_enterprise_value - total_debt
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_share_value = np.where(shares_outstanding != 0, equity_value / shares_outstanding, 0.0)
+
+    return pd.DataFrame({
+        'Total Present Value of FCF': total_present_value_of_fcfs,
+        'Terminal Value': terminal_value,
+        'Present Value of Terminal Value': present_value_of_terminal_value,
+        'Enterprise Value': total_enterprise_value,
+        'Adjusted Enterprise Value': adjusted_enterprise_value,
+        'Equity Value': equity_value,
+        'Per Share Value': per_share_value,
+    }, index=tickers)
@@ -0,0 +1,211 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from benchmark_fixtures import make_universe
+from batch_valuation import stack_free_cash_flows, extract_net_debt_inputs, batch_dcf_valuation
+from google_gemini import FakeLLMBackend, set_backend, predict_opcf, predict_capex
+from llm_cache import LLMResponseCache, set_default_cache
+from main import (extract_detailed_financials, extract_detailed_financials_frame, setup_and_forecast_dataframe_llm,
+                  perform_dcf_analysis)
+from support_functions import calculate_free_cash_flow, discount_cash_flows, extract_historicals
+
+DEFAULT_SIZES = (1, 100, 10_000)
+DEFAULT_REGRESSION_THRESHOLD = 1.2
+
+
+def _measure(function, make_inputs, track_memory):
+    # One timed pass, then (optionally) a second pass under tracemalloc so tracing does not skew the timing
+    inputs = make_inputs()
+    start = time.perf_counter()
+    outputs = [function(*args) for args in inputs]
+    seconds = time.perf_counter() - start
+
+    peak_memory_bytes = None
+    if track_memory:
+        inputs = make_inputs()
+        tracemalloc.start()
+        baseline_bytes = tracemalloc.get_traced_memory()[0]
+        [function(*args) for args in inputs]
+        peak_memory_bytes = tracemalloc.get_traced_memory()[1] - baseline_bytes
+        tracemalloc.stop()
+    return outputs, seconds, peak_memory_bytes
+
+
+def benchmark_pipeline(num_tickers, time_period=10, first_year=2024, num_years=20, track_memory=True):
+    """
+    Time each valuation stage over a synthetic universe, using the fake model for forecasts.
+
+    Args:
+    num_tickers (int): The number of tickers in the universe.
+    time_period (int): The number of forecast years.
+    first_year (int): The first forecast year.
+    num_years (int): The number of historical years per ticker.
+    track_memory (bool): Whether to measure the peak memory of each stage.
+
+    Returns:
+    dict: Per stage, the elapsed 'seconds', 'tickers_per_second' and 'peak_memory_bytes'.
+    """
+    universe = make_universe(num_tickers, num_years)
+    results = {}
+
+    def stage(name, function, make_inputs, num_items=num_tickers):
+        outputs, seconds, peak_memory_bytes = _measure(function, make_inputs, track_memory)
+        results[name] = {
+            "seconds": seconds,
+            "tickers_per_second": num_items / seconds if seconds else None,
+            "peak_memory_bytes": peak_memory_bytes,
+        }
+        return outputs
+
+    statements = [(data["income_statement"], data["balance_sheet"], data["cash_flow"]) for data in universe.values()]
+    stage("extract_detailed_financials", extract_detailed_financials, lambda: statements)
+    detailed = stage("extract_detailed_financials_frame", extract_detailed_financials_frame, lambda: statements)
+    historical_dfs = [historical_df for historical_df, _ in detailed]
+    num_years_historicals = [num_years_historical for _, num_years_historical in detailed]
+
+    # Forecasts come from the deterministic fake model through an in-memory response cache and are not timed
+    previous_backend = set_backend(FakeLLMBackend())
+    previous_cache = set_default_cache(LLMResponseCache(":memory:"))
+    try:
+        forecasts = []
+        for ticker, historical_df in zip(universe, historical_dfs):
+            operating_cashflow_historicals, capex_historicals = extract_historicals(historical_df)
+            forecasts.append((predict_opcf(ticker, time_period, first_year, operating_cashflow_historicals),
+                              predict_capex(ticker, time_period, first_year, capex_historicals)))
+    finally:
+        set_backend(previous_backend)
+        set_default_cache(previous_cache)
+
+    forecasted_dfs = stage("setup_and_forecast_dataframe_llm", setup_and_forecast_dataframe_llm,
+                           lambda: [(historical_df, *forecast) for historical_df, forecast in zip(historical_dfs, forecasts)])
+    sorted_dfs = [df.sort_values(by='fiscalDateEnding') for df in forecasted_dfs]
+    fcf_dfs = stage("calculate_free_cash_flow", calculate_free_cash_flow, lambda: [(df.copy(),) for df in sorted_dfs])
+    stage("discount_cash_flows", discount_cash_flows,
+          lambda: [(df.copy(), 0.08, years) for df, years in zip(fcf_dfs, num_years_historicals)])
+
+    stage("perform_dcf_analysis", perform_dcf_analysis,
+          lambda: [(df, data["balance_sheet"], data, 0.08, 0.025, years)
+                   for df, data, years in zip(forecasted_dfs, universe.values(), num_years_historicals)])
+
+    fcf_matrix = stack_free_cash_flows(forecasted_dfs, num_years_historicals)
+    total_debt, cash_and_equivalents = extract_net_debt_inputs([data["balance_sheet"] for data in universe.values()])
+    shares_outstanding = np.array([data["shares_outstanding"] for data in universe.values()])
+    stage("batch_dcf_valuation", batch_dcf_valuation,
+          lambda: [(fcf_matrix, 0.08, 0.025, total_debt, cash_and_equivalents, shares_outstanding)])
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, time_period=10, first_year=2024, num_years=20, track_memory=True):
+    """
+    Run the pipeline benchmark for several universe sizes.
+
+    Args:
+    sizes (list): The universe sizes to benchmark.
+    time_period (int): The number of forecast years.
+    first_year (int): The first forecast year.
+    num_years (int): The number of historical years per ticker.
+    track_memory (bool): Whether to measure the peak memory of each stage.
+
+    Returns:
+    dict: The environment metadata and the per-size, per-stage results.
+    """
+    return {
+        "metadata": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "time_period": time_period,
+            "num_years": num_years,
+        },
+        "results": {str(size): benchmark_pipeline(size, time_period, first_year, num_years, track_memory)
+                    for size in sizes},
+    }
+
+
+def compare_to_baseline(current, baseline, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    """
+    Compare benchmark results with a stored baseline.
+
+    Args:
+    current (dict): Results from run_benchmarks.
+    baseline (dict): Earlier results from run_benchmarks.
+    threshold (float): The slowdown factor above which a stage counts as a regression.
+
+    Returns:
+    list: One (size, stage, baseline seconds, current seconds, ratio, regressed) tuple per common stage.
+    """
+    comparisons = []
+    for size, stages in current["results"].items():
+        for stage, measurement in stages.items():
+            baseline_measurement = baseline["results"].get(size, {}).get(stage)
+            if not baseline_measurement or not baseline_measurement["seconds"]:
+                continue
+            ratio = measurement["seconds"] / baseline_measurement["seconds"]
+            comparisons.append((size, stage, baseline_measurement["seconds"], measurement["seconds"], ratio,
+                                ratio > threshold))
+    return comparisons
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the valuation pipeline on synthetic fixtures.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Universe sizes to run.")
+    parser.add_argument("--time-period", type=int, default=10, help="Number of forecast years.")
+    parser.add_argument("--num-years", type=int, default=20, help="Number of historical years per ticker.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the peak memory measurement pass.")
+    parser.add_argument("--output", default="benchmark_results.json", help="Where to write the results.")
+    parser.add_argument("--baseline", help="Baseline results to compare against.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD,
+                        help="Slowdown factor reported as a regression.")
+    args = parser.parse_args()
+
+    # The baseline is read before anything is written, and never overwritten by the run it is compared with
+    baseline = None
+    if args.baseline:
+        if os.path.exists(args.output) and os.path.samefile(args.output, args.baseline):
+            parser.error("--output must differ from --baseline, or the baseline would be overwritten")
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+
+    results = run_benchmarks(args.sizes, args.time_period, num_years=args.num_years, track_memory=not args.no_memory)
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+
+    for size, stages in results["results"].items():
+        print(f"---------- {size} tickers -----------------")
+        for stage, measurement in stages.items():
+            memory = measurement["peak_memory_bytes"]
+            memory = f"{memory / 2 ** 20:10.1f} MiB" if memory is not None else ""
+            print(f"{stage:36s} {measurement['seconds']:10.4f} s {measurement['tickers_per_second']:14.1f} tickers/s {memory}")
+
+    if baseline is not None:
+        comparisons = compare_to_baseline(results, baseline, args.threshold)
+        print("---------- Comparison with baseline -----------------")
+        for size, stage, baseline_seconds, seconds, ratio, regressed in comparisons:
+            print(f"{size:>6s} {stage:36s} {baseline_seconds:10.4f} s -> {seconds:10.4f} s  x{ratio:5.2f}"
+                  f"{'  REGRESSION' if regressed else ''}")
+        if any(comparison[-1] for comparison in comparisons):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
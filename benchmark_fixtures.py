@@ -0,0 +1,104 @@
+import numpy as np
+import pandas as pd
+
+INCOME_STATEMENT_FIELDS = [
+    'grossProfit', 'totalRevenue', 'costOfRevenue', 'costofGoodsAndServicesSold', 'operatingIncome',
+    'sellingGeneralAndAdministrative', 'researchAndDevelopment', 'operatingExpenses', 'investmentIncomeNet',
+    'netInterestIncome', 'interestIncome', 'interestExpense', 'nonInterestIncome', 'otherNonOperatingIncome',
+    'depreciation', 'depreciationAndAmortization', 'incomeBeforeTax', 'incomeTaxExpense',
+    'interestAndDebtExpense', 'netIncomeFromContinuingOperations', 'comprehensiveIncomeNetOfTax', 'ebit',
+    'ebitda', 'netIncome',
+]
+BALANCE_SHEET_FIELDS = [
+    'totalAssets', 'totalCurrentAssets', 'cashAndCashEquivalentsAtCarryingValue', 'cashAndShortTermInvestments',
+    'inventory', 'currentNetReceivables', 'totalNonCurrentAssets', 'propertyPlantEquipment',
+    'accumulatedDepreciationAmortizationPPE', 'intangibleAssets', 'intangibleAssetsExcludingGoodwill', 'goodwill',
+    'investments', 'longTermInvestments', 'shortTermInvestments', 'otherCurrentAssets', 'otherNonCurrentAssets',
+    'totalLiabilities', 'totalCurrentLiabilities', 'currentAccountsPayable', 'deferredRevenue', 'currentDebt',
+    'shortTermDebt', 'totalNonCurrentLiabilities', 'capitalLeaseObligations', 'longTermDebt',
+    'currentLongTermDebt', 'longTermDebtNoncurrent', 'shortLongTermDebtTotal', 'otherCurrentLiabilities',
+    'otherNonCurrentLiabilities', 'totalShareholderEquity', 'treasuryStock', 'retainedEarnings', 'commonStock',
+    'commonStockSharesOutstanding',
+]
+CASH_FLOW_FIELDS = [
+    'operatingCashflow', 'paymentsForOperatingActivities', 'proceedsFromOperatingActivities',
+    'changeInOperatingLiabilities', 'changeInOperatingAssets', 'depreciationDepletionAndAmortization',
+    'capitalExpenditures', 'changeInReceivables', 'changeInInventory', 'profitLoss', 'cashflowFromInvestment',
+    'cashflowFromFinancing', 'proceedsFromRepaymentsOfShortTermDebt', 'paymentsForRepurchaseOfCommonStock',
+    'paymentsForRepurchaseOfEquity', 'paymentsForRepurchaseOfPreferredStock', 'dividendPayout',
+    'dividendPayoutCommonStock', 'dividendPayoutPreferredStock', 'proceedsFromIssuanceOfCommonStock',
+    'proceedsFromIssuanceOfLongTermDebtAndCapitalSecuritiesNet', 'proceedsFromIssuanceOfPreferredStock',
+    'proceedsFromRepurchaseOfEquity', 'proceedsFromSaleOfTreasuryStock', 'changeInCashAndCashEquivalents',
+    'changeInExchangeRate', 'netIncome',
+]
+
+
+def _make_statement(rng, fields, fiscal_dates, scale, none_share):
+    values = rng.uniform(0.05, 1.0, size=(len(fiscal_dates), len(fields))) * scale
+    cells = np.round(values).astype(np.int64).astype(str).astype(object)
+    cells[rng.random(cells.shape) < none_share] = "None"
+    statement = pd.DataFrame(cells, columns=fields)
+    statement.insert(0, 'reportedCurrency', 'USD')
+    statement.insert(0, 'fiscalDateEnding', fiscal_dates)
+    return statement
+
+
+def make_financial_data(num_years=20, last_fiscal_year=2023, seed=0, none_share=0.05):
+    """
+    Build synthetic financial data shaped like the output of fetch_financial_data.
+
+    Statements hold Alpha Vantage field names with string values, the latest fiscal year first, and a share
+    of "None" cells. The fields the DCF relies on are kept consistent so valuations are well-defined.
+
+    Args:
+    num_years (int): The number of annual reports per statement.
+    last_fiscal_year (int): The fiscal year of the latest report.
+    seed (int): Seed for the random number generator.
+    none_share (float): The share of cells set to "None".
+
+    Returns:
+    dict: The income statement, balance sheet and cash flow DataFrames and the shares outstanding.
+    """
+    rng = np.random.default_rng(seed)
+    scale = 10 ** rng.uniform(8, 11)
+    fiscal_dates = [f"{last_fiscal_year - year}-09-30" for year in range(num_years)]
+
+    income_statement = _make_statement(rng, INCOME_STATEMENT_FIELDS, fiscal_dates, scale, none_share)
+    balance_sheet = _make_statement(rng, BALANCE_SHEET_FIELDS, fiscal_dates, scale, none_share)
+    cash_flow = _make_statement(rng, CASH_FLOW_FIELDS, fiscal_dates, scale, none_share)
+
+    # Keep the fields the valuation depends on numeric and plausible
+    balance_sheet['totalCurrentAssets'] = np.round(rng.uniform(0.3, 0.6, num_years) * scale).astype(np.int64).astype(str)
+    balance_sheet['totalCurrentLiabilities'] = np.round(rng.uniform(0.1, 0.3, num_years) * scale).astype(np.int64).astype(str)
+    balance_sheet['totalLiabilities'] = np.round(rng.uniform(0.3, 0.6, num_years) * scale).astype(np.int64).astype(str)
+    balance_sheet['cashAndCashEquivalentsAtCarryingValue'] = np.round(rng.uniform(0.05, 0.2, num_years) * scale).astype(np.int64).astype(str)
+    operating_cashflow = scale * 0.2 * (1.05 ** -np.arange(num_years)) * rng.uniform(0.9, 1.1, num_years)
+    cash_flow['operatingCashflow'] = np.round(operating_cashflow).astype(np.int64).astype(str)
+    cash_flow['capitalExpenditures'] = np.round(operating_cashflow * rng.uniform(0.1, 0.3, num_years)).astype(np.int64).astype(str)
+
+    return {
+        "income_statement": income_statement,
+        "balance_sheet": balance_sheet,
+        "cash_flow": cash_flow,
+        "shares_outstanding": int(scale / rng.uniform(20, 200)),
+    }
+
+
+def make_universe(num_tickers, num_years=20, distinct=100, seed=0):
+    """
+    Build a synthetic universe of tickers for benchmarks.
+
+    To keep large universes cheap to hold in memory, only `distinct` fixtures are generated and reused
+    (by reference) across tickers; every ticker is still processed independently by the pipeline.
+
+    Args:
+    num_tickers (int): The number of tickers in the universe.
+    num_years (int): The number of annual reports per statement.
+    distinct (int): The number of distinct fixtures to generate.
+    seed (int): Seed for the first fixture; the others use consecutive seeds.
+
+    Returns:
+    dict: Synthetic financial data keyed by ticker ('T00000', 'T00001', ...).
+    """
+    fixtures = [make_financial_data(num_years, seed=seed + index) for index in range(min(distinct, num_tickers))]
+    return {f"T{index:05d}": fixtures[index % len(fixtures)] for index in range(num_tickers)}
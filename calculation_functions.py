@@ -1,3 +1,6 @@
+import numpy as np
+
+
 def calculate_equity_and_per_share_value(adjusted_enterprise_value, total_debt, shares_outstanding):
     """
     Calculate the equity value and the per-share value of a company.
@@ -70,3 +73,66 @@ def calculate_average_growth_rate(values):
                 rates.append(growth_rate)
     return sum(rates) / len(rates) if rates else 0
 
+
+def calculate_cagr(values):
+    """
+    Calculate the compound annual growth rate between the first and the last valid historical value.
+
+    Args:
+    values (list): A list of numerical values representing yearly historical data, oldest first.
+
+    Returns:
+    float: The compound annual growth rate, or 0 if it is undefined (fewer than two valid values, or a
+    first or last value that is not positive).
+    """
+    valid = [(year, float(value)) for year, value in enumerate(values)
+             if value is not None and np.isfinite(float(value)) and float(value) != 0]
+    if len(valid) < 2:
+        return 0
+    (first_year, first_value), (last_year, last_value) = valid[0], valid[-1]
+    if first_value <= 0 or last_value <= 0:
+        return 0
+    return (last_value / first_value) ** (1 / (last_year - first_year)) - 1
+
+
+def calculate_regression_growth_rate(values):
+    """
+    Calculate the growth rate of a log-linear least-squares fit over the full history.
+
+    Unlike the average growth rate or the CAGR, every year contributes to the fit, so single outlier
+    years have less influence on the result.
+
+    Args:
+    values (list): A list of numerical values representing yearly historical data, oldest first.
+
+    Returns:
+    float: The fitted yearly growth rate, or 0 if fewer than two positive values are available.
+    """
+    values = np.array([np.nan if value is None else value for value in values], dtype=float)
+    years = np.arange(len(values))
+    positive = np.isfinite(values) & (values > 0)
+    if positive.sum() < 2:
+        return 0
+    slope = np.polyfit(years[positive], np.log(values[positive]), 1)[0]
+    return float(np.expm1(slope))
+
+
+def project_mean_reverting_values(base_value, initial_growth_rate, long_term_growth_rate, years, reversion_rate=0.3):
+    """
+    Project future values with a growth rate that reverts from its current level to a long-term rate.
+
+    Each year closes reversion_rate of the remaining gap between the growth rate and the long-term rate.
+
+    Args:
+    base_value (float): The initial value from which to project.
+    initial_growth_rate (float): The growth rate of the first projected year.
+    long_term_growth_rate (float): The growth rate the projection reverts to.
+    years (int): Number of years to project into the future.
+    reversion_rate (float): The share of the gap closed each year, between 0 (no reversion) and 1.
+
+    Returns:
+    list: A list of projected values over the specified number of years.
+    """
+    growth_rates = long_term_growth_rate + (initial_growth_rate - long_term_growth_rate) * \
+        (1 - reversion_rate) ** np.arange(years)
+    return (base_value * np.cumprod(1 + growth_rates)).tolist()
@@ -0,0 +1,266 @@
+import sys
+
+import numpy as np
+import pandas as pd
+
+from batch_valuation import batch_dcf_valuation
+from llm_parsing import parse_forecast_values
+from main import extract_detailed_financials_frame
+
+EXCLUDE_COLUMNS = ('fiscalDateEnding', 'reportedCurrency')
+
+
+class FieldIndex:
+    """
+    Field-name-to-column index shared by the CompactFinancials of a universe.
+
+    Field names and currency codes are stored once per universe instead of once per ticker and statement.
+    """
+
+    __slots__ = ("names", "positions", "currencies", "currency_codes")
+
+    def __init__(self, names=()):
+        """
+        Args:
+        names (iterable): Field names to register up front.
+        """
+        self.names = []
+        self.positions = {}
+        self.currencies = []
+        self.currency_codes = {}
+        for name in names:
+            self.add(name)
+
+    def __len__(self):
+        return len(self.names)
+
+    def add(self, name):
+        """
+        Return the column of a field, registering it if it is new.
+        """
+        position = self.positions.get(name)
+        if position is None:
+            position = self.positions[name] = len(self.names)
+            self.names.append(sys.intern(name))
+        return position
+
+    def currency_code(self, currency):
+        """
+        Return the category code of a currency, registering it if it is new.
+        """
+        code = self.currency_codes.get(currency)
+        if code is None:
+            code = self.currency_codes[currency] = len(self.currencies)
+            self.currencies.append(currency)
+        return code
+
+
+class CompactFinancials:
+    """
+    Compact typed record of a ticker's combined historical financials.
+
+    Every numeric field of the three statements is stored once, as a column of a single float64 matrix with
+    one row per fiscal year in ascending order. Column positions come from a FieldIndex shared by all
+    tickers, fiscal dates are stored as YYYYMMDD integers and the reporting currency as a category code.
+    Indexing by field name returns the yearly series, so it can stand in for the DataFrame from
+    extract_detailed_financials_frame where only series are read, e.g. in a StatisticalForecaster.
+    """
+
+    __slots__ = ("ticker", "field_index", "fiscal_dates", "currency_code", "values", "shares_outstanding")
+
+    def __init__(self, ticker, field_index, fiscal_dates, currency_code, values, shares_outstanding):
+        """
+        Args:
+        ticker (str): The stock ticker symbol.
+        field_index (FieldIndex): The index of the matrix columns.
+        fiscal_dates (ndarray): The fiscal year end dates as YYYYMMDD int32, ascending.
+        currency_code (int): The FieldIndex category code of the reporting currency, or -1 if unknown.
+        values (ndarray): The years x fields float64 matrix.
+        shares_outstanding (int): The number of shares outstanding.
+        """
+        self.ticker = ticker
+        self.field_index = field_index
+        self.fiscal_dates = fiscal_dates
+        self.currency_code = currency_code
+        self.values = values
+        self.shares_outstanding = shares_outstanding
+
+    @classmethod
+    def from_frame(cls, ticker, historical_df, shares_outstanding, field_index):
+        """
+        Build a record from the year-indexed DataFrame of extract_detailed_financials_frame.
+
+        Args:
+        ticker (str): The stock ticker symbol.
+        historical_df (DataFrame): Historical financials indexed by fiscal year in ascending order.
+        shares_outstanding (int): The number of shares outstanding.
+        field_index (FieldIndex): The index shared by the universe.
+
+        Returns:
+        CompactFinancials: The compact record.
+        """
+        fields = [column for column in historical_df.columns if column not in EXCLUDE_COLUMNS]
+        positions = [field_index.add(field) for field in fields]
+        values = np.full((len(historical_df), len(field_index)), np.nan)
+        values[:, positions] = historical_df[fields].to_numpy(dtype=float)
+
+        fiscal_dates = np.array([int(fiscal_date.replace('-', '')) for fiscal_date in historical_df['fiscalDateEnding']],
+                                dtype=np.int32)
+        currencies = historical_df['reportedCurrency'].dropna() if 'reportedCurrency' in historical_df else []
+        currency_code = field_index.currency_code(currencies.iloc[-1]) if len(currencies) else -1
+        return cls(ticker, field_index, fiscal_dates, currency_code, values, int(shares_outstanding))
+
+    @classmethod
+    def from_financial_data(cls, ticker, financial_data, field_index):
+        """
+        Build a record from financial data as returned by fetch_financial_data.
+
+        Args:
+        ticker (str): The stock ticker symbol.
+        financial_data (dict): The income statement, balance sheet and cash flow DataFrames and shares outstanding.
+        field_index (FieldIndex): The index shared by the universe.
+
+        Returns:
+        CompactFinancials: The compact record.
+        """
+        historical_df, _ = extract_detailed_financials_frame(
+            financial_data["income_statement"], financial_data["balance_sheet"], financial_data["cash_flow"])
+        return cls.from_frame(ticker, historical_df, financial_data["shares_outstanding"], field_index)
+
+    def __getitem__(self, field):
+        position = self.field_index.positions.get(field)
+        if position is None or position >= self.values.shape[1]:
+            raise KeyError(field)
+        return self.values[:, position]
+
+    def __contains__(self, field):
+        position = self.field_index.positions.get(field)
+        return position is not None and position < self.values.shape[1]
+
+    def __len__(self):
+        return len(self.fiscal_dates)
+
+    @property
+    def fiscal_years(self):
+        return self.fiscal_dates // 10000
+
+    @property
+    def currency(self):
+        return self.field_index.currencies[self.currency_code] if self.currency_code >= 0 else None
+
+    @property
+    def nbytes(self):
+        return self.values.nbytes + self.fiscal_dates.nbytes
+
+    def truncate(self, num_years):
+        """
+        Return a record of the oldest num_years fiscal years, sharing this record's arrays.
+        """
+        return CompactFinancials(self.ticker, self.field_index, self.fiscal_dates[:num_years], self.currency_code,
+                                 self.values[:num_years], self.shares_outstanding)
+
+    def as_of(self, fiscal_date):
+        """
+        Return a record of the fiscal years ending on or before a date, as known at that date.
+
+        Args:
+        fiscal_date (str or int): The date as 'YYYY-MM-DD' or as a YYYYMMDD integer.
+
+        Returns:
+        CompactFinancials: The point-in-time record, sharing this record's arrays.
+        """
+        if isinstance(fiscal_date, str):
+            fiscal_date = int(fiscal_date.replace('-', ''))
+        return self.truncate(int(np.searchsorted(self.fiscal_dates, fiscal_date, side='right')))
+
+    def latest(self, field):
+        """
+        Return the value of a field in the latest fiscal year.
+        """
+        return float(self[field][-1])
+
+    def to_frame(self):
+        """
+        Rebuild the year-indexed DataFrame of extract_detailed_financials_frame, e.g. for the model forecaster.
+
+        Returns:
+        DataFrame: The historical financials indexed by fiscal year in ascending order.
+        """
+        df = pd.DataFrame(self.values, columns=self.field_index.names[:self.values.shape[1]],
+                          index=self.fiscal_years.astype(str))
+        df.insert(0, 'reportedCurrency', self.currency)
+        df.insert(0, 'fiscalDateEnding', [f"{date // 10000:04d}-{date // 100 % 100:02d}-{date % 100:02d}"
+                                          for date in self.fiscal_dates.tolist()])
+        return df
+
+
+def compact_universe(financial_data, field_index=None):
+    """
+    Convert the financial data of many tickers into CompactFinancials sharing one FieldIndex.
+
+    Args:
+    financial_data (dict): Financial data as returned by fetch_financial_data, keyed by ticker.
+    field_index (FieldIndex, optional): The index to extend; a new one is created by default.
+
+    Returns:
+    dict: CompactFinancials keyed by ticker, in input order.
+    """
+    field_index = field_index or FieldIndex()
+    return {ticker: CompactFinancials.from_financial_data(ticker, data, field_index)
+            for ticker, data in financial_data.items()}
+
+
+def forecast_compact_universe(compacts, forecaster, time_period=10, first_year=2024):
+    """
+    Forecast the cash flows of many compact records with a local forecaster.
+
+    Args:
+    compacts (dict): CompactFinancials keyed by ticker.
+    forecaster (callable): Called with (ticker, compact, time_period, first_year), e.g. a StatisticalForecaster;
+        returns the operating cash flow and capital expenditures forecasts as JSON strings.
+    time_period (int): The number of forecast years.
+    first_year (int): The first forecast year.
+
+    Returns:
+    dict: The (operating cash flow JSON, capital expenditures JSON) forecasts keyed by ticker.
+    """
+    return {ticker: forecaster(ticker, compact, time_period, first_year) for ticker, compact in compacts.items()}
+
+
+def compact_dcf_valuation(compacts, forecasts, discount_rates, perpetual_growth_rates):
+    """
+    Run the DCF analysis directly on compact records, with the array engine of batch_dcf_valuation.
+
+    The forecast free cash flows come from the forecast JSONs, and total debt, cash and shares outstanding
+    from the latest fiscal year of each record, as in perform_dcf_analysis.
+
+    Args:
+    compacts (dict): CompactFinancials keyed by ticker.
+    forecasts (dict): The (operating cash flow JSON, capital expenditures JSON) forecasts keyed by ticker.
+    discount_rates (float or dict): The discount rate of every ticker, or one rate per ticker.
+    perpetual_growth_rates (float or dict): The perpetual growth rate of every ticker, or one rate per ticker.
+
+    Returns:
+    DataFrame: One row per ticker with the intermediate values and the per-share value.
+    """
+    tickers = list(compacts)
+    rows = []
+    for ticker in tickers:
+        operating_cashflow_json, capital_expenditures_json = forecasts[ticker]
+        operating_cashflow = parse_forecast_values(operating_cashflow_json)
+        capital_expenditures = parse_forecast_values(capital_expenditures_json)
+        rows.append([operating_cashflow[year] - capital_expenditures[year] for year in operating_cashflow])
+    horizons = {len(row) for row in rows}
+    if len(horizons) > 1:
+        raise ValueError(f"All tickers must share the same forecast horizon, got {sorted(horizons)}")
+
+    def per_ticker(values):
+        return [values[ticker] for ticker in tickers] if isinstance(values, dict) else values
+
+    return batch_dcf_valuation(
+        np.array(rows, dtype=float).reshape(len(tickers), -1),
+        per_ticker(discount_rates), per_ticker(perpetual_growth_rates),
+        np.array([compacts[ticker].latest('totalLiabilities') for ticker in tickers]),
+        np.array([compacts[ticker].latest('cashAndCashEquivalentsAtCarryingValue') for ticker in tickers]),
+        np.array([compacts[ticker].shares_outstanding for ticker in tickers], dtype=float),
+        tickers=tickers)
@@ -0,0 +1,130 @@
+from functools import lru_cache
+
+import numpy as np
+
+CONVENTIONS = ("end", "mid_year", "actual_365")
+DAYS_PER_YEAR = 365.0
+DEFAULT_CACHE_SIZE = 4096
+
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+@lru_cache(maxsize=DEFAULT_CACHE_SIZE)
+def _period_vector(horizon, convention):
+    periods = np.arange(horizon, dtype=float)
+    if convention == "mid_year":
+        periods -= 0.5
+    return _read_only(periods)
+
+
+def actual_periods(valuation_date, fiscal_dates):
+    """
+    Calculate exact day-count periods (actual/365) from a valuation date to each forecast fiscal date.
+
+    Args:
+    valuation_date (str): The valuation date as 'YYYY-MM-DD', usually the first forecast fiscal date.
+    fiscal_dates (list): The forecast fiscal dates as 'YYYY-MM-DD' strings.
+
+    Returns:
+    ndarray: The number of years between the valuation date and each fiscal date.
+    """
+    days = np.asarray(fiscal_dates, dtype="datetime64[D]") - np.datetime64(valuation_date, "D")
+    return days.astype(float) / DAYS_PER_YEAR
+
+
+def discount_periods(horizon, convention="end", valuation_date=None, fiscal_dates=None):
+    """
+    Return the discounting period of each forecast year under a timing convention.
+
+    All conventions measure from the same valuation date, the end of the first forecast year, which is not
+    discounted, as perform_dcf_analysis always has. 'end' counts whole years (0, 1, ...). 'mid_year' assumes
+    cash flows arrive in the middle of each forecast year, half a year before 'end' (-0.5, 0.5, ...).
+    'actual_365' counts the exact days from the valuation date to each forecast fiscal date, so it matches
+    'end' up to leap days and shifted fiscal year ends.
+
+    Args:
+    horizon (int): The number of forecast years.
+    convention (str): 'end', 'mid_year' or 'actual_365'.
+    valuation_date (str, optional): The valuation date as 'YYYY-MM-DD'; defaults to the first forecast fiscal date.
+    fiscal_dates (list, optional): The forecast fiscal dates as 'YYYY-MM-DD' strings; required for 'actual_365'.
+
+    Returns:
+    ndarray: A read-only vector of the periods, in years.
+    """
+    if convention not in CONVENTIONS:
+        raise ValueError(f"Unknown discounting convention '{convention}', expected one of {', '.join(CONVENTIONS)}")
+    if convention == "actual_365":
+        if fiscal_dates is None:
+            raise ValueError("The 'actual_365' convention needs the forecast fiscal dates")
+        if len(fiscal_dates) != horizon:
+            raise ValueError(f"Expected {horizon} fiscal dates, got {len(fiscal_dates)}")
+        if valuation_date is None:
+            valuation_date = fiscal_dates[0]
+        return _read_only(actual_periods(valuation_date, fiscal_dates))
+    return _period_vector(int(horizon), convention)
+
+
+def terminal_periods(periods, convention="end"):
+    """
+    Return the period at which the terminal value is discounted: the end of the last forecast year.
+
+    Args:
+    periods (ndarray): The discounting periods from discount_periods, either T or N x T.
+    convention (str): The convention the periods were computed with.
+
+    Returns:
+    float or ndarray: The terminal period, one per row of periods.
+    """
+    last_periods = np.asarray(periods, dtype=float)[..., -1]
+    if convention == "mid_year":
+        return last_periods + 0.5
+    return last_periods
+
+
+@lru_cache(maxsize=DEFAULT_CACHE_SIZE)
+def _cached_discount_factors(discount_rate, periods):
+    return _read_only((1.0 + discount_rate) ** -np.array(periods))
+
+
+def discount_factors(discount_rate, periods):
+    """
+    Return the discount factor of each period, cached per (rate, periods) for reuse across tickers.
+
+    Args:
+    discount_rate (float): The discount rate (WACC).
+    periods (ndarray): The discounting periods from discount_periods.
+
+    Returns:
+    ndarray: A read-only vector of 1 / (1 + discount_rate) ** period.
+    """
+    return _cached_discount_factors(float(discount_rate), tuple(np.asarray(periods, dtype=float).tolist()))
+
+
+def discount_factor_matrix(discount_rates, periods):
+    """
+    Return the discount factors of many tickers, computing each distinct rate's vector only once.
+
+    Args:
+    discount_rates (ndarray): The discount rate of each ticker.
+    periods (ndarray): The discounting periods, either T shared by all tickers or N x T.
+
+    Returns:
+    ndarray: An N x T matrix of discount factors.
+    """
+    discount_rates = np.asarray(discount_rates, dtype=float)
+    periods = np.asarray(periods, dtype=float)
+    if periods.ndim > 1:
+        return (1 + discount_rates[:, None]) ** -periods
+    unique_rates, rate_positions = np.unique(discount_rates, return_inverse=True)
+    return np.vstack([discount_factors(rate, periods) for rate in unique_rates])[rate_positions]
+
+
+def clear_discount_cache():
+    """
+    Drop every cached period and discount factor vector.
+    """
+    _period_vector.cache_clear()
+    _cached_discount_factors.cache_clear()
@@ -0,0 +1,186 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from instrumentation import increment, timed
+from google_gemini import predict_capex, predict_opcf, predict_dcrate, predict_perpgrowthrate, predict_batch_cashflows
+
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_CALL_TIMEOUT = 60.0
+
+logger = logging.getLogger(__name__)
+
+
+class ForecastTimeoutError(Exception):
+    """
+    Raised when a single model call of a ticker's forecast exceeds its timeout.
+    """
+
+
+async def forecast_ticker(ticker, time_period, first_year, operating_cashflow_historicals, capex_historicals,
+                          run_call, bypass_cache=False, cashflow_forecasts=None, rates=None):
+    """
+    Run the four model calls of one ticker concurrently.
+
+    If one call fails or times out, the ticker's remaining calls are cancelled.
+
+    Args:
+    ticker (str): The stock ticker symbol.
+    time_period (int): The number of forecast years.
+    first_year (int): The first forecast year.
+    operating_cashflow_historicals (str): Historical operating cash flow JSON from extract_historicals.
+    capex_historicals (str): Historical capital expenditures JSON from extract_historicals.
+    run_call (callable): Coroutine function that runs a blocking call under the concurrency cap and timeout.
+    bypass_cache (bool): Whether to skip the response cache.
+    cashflow_forecasts (awaitable, optional): Resolves to the ticker's 'operating_cashflow_json' and
+        'capital_expenditures_json' from a batched request, replacing the two per-ticker cash flow calls.
+        If it resolves to None, the two calls are made after all, each through run_call.
+    rates (tuple, optional): A fixed (discount_rate, perpetual_growth_rate), replacing the two rate calls.
+
+    Returns:
+    dict: The capital expenditures and operating cash flow JSON strings and the discount and perpetual
+    growth rates.
+    """
+    calls = {}
+    if rates is None:
+        calls["discount_rate"] = partial(predict_dcrate, ticker, time_period, bypass_cache=bypass_cache)
+        calls["perpetual_growth_rate"] = partial(predict_perpgrowthrate, ticker, time_period, bypass_cache=bypass_cache)
+    cashflow_calls = {
+        "capital_expenditures_json": partial(predict_capex, ticker, time_period, first_year, capex_historicals,
+                                             bypass_cache=bypass_cache),
+        "operating_cashflow_json": partial(predict_opcf, ticker, time_period, first_year,
+                                           operating_cashflow_historicals, bypass_cache=bypass_cache),
+    }
+    if cashflow_forecasts is None:
+        calls.update(cashflow_calls)
+
+    async def cashflows_or_calls():
+        cashflows = await cashflow_forecasts
+        if cashflows is not None:
+            return cashflows
+        # Not in the batched response: each cash flow forecast gets its own concurrency slot and timeout
+        increment("llm_batch_fallbacks")
+        results = await asyncio.gather(*(run_call(call) for call in cashflow_calls.values()))
+        return dict(zip(cashflow_calls, results))
+
+    tasks = {name: asyncio.create_task(run_call(call)) for name, call in calls.items()}
+    if cashflow_forecasts is not None:
+        tasks["cashflows"] = asyncio.create_task(cashflows_or_calls())
+    try:
+        await asyncio.gather(*tasks.values())
+    except BaseException:
+        for task in tasks.values():
+            task.cancel()
+        raise
+
+    forecasts = {name: task.result() for name, task in tasks.items()}
+    forecasts.update(forecasts.pop("cashflows", {}))
+    if rates is not None:
+        forecasts["discount_rate"], forecasts["perpetual_growth_rate"] = rates
+    forecasts["discount_rate"] = float(forecasts["discount_rate"])
+    forecasts["perpetual_growth_rate"] = float(forecasts["perpetual_growth_rate"])
+    return forecasts
+
+
+async def forecast_universe(jobs, time_period, first_year, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                            call_timeout=DEFAULT_CALL_TIMEOUT, bypass_cache=False, on_result=None, batch_size=None,
+                            cashflow_forecasts=None, rates=None):
+    """
+    Forecast many tickers concurrently, with at most max_concurrency model calls in flight.
+
+    The blocking predict_* calls run on a dedicated thread pool. A call that exceeds call_timeout fails its
+    ticker; the thread finishes in the background but its result is discarded. With batch_size set, the
+    cash flow forecasts of batch_size tickers are requested together through predict_batch_cashflows.
+    Tickers missing from a batched response, or whose whole batch failed, make the usual per-ticker cash
+    flow calls instead, each with its own concurrency slot and timeout.
+    Tickers with precomputed cashflow_forecasts, e.g. from a StatisticalForecaster, only request the rates,
+    and with fixed rates they make no rate calls either.
+
+    Args:
+    jobs (list): Tuples of (ticker, operating_cashflow_historicals, capex_historicals).
+    time_period (int): The number of forecast years.
+    first_year (int): The first forecast year.
+    max_concurrency (int): The maximum number of model calls in flight across all tickers.
+    call_timeout (float): Seconds a single model call may take.
+    bypass_cache (bool): Whether to skip the response cache.
+    on_result (callable, optional): Called with (ticker, forecasts, error) as each ticker finishes.
+    batch_size (int, optional): The number of tickers per batched cash flow request.
+    cashflow_forecasts (dict, optional): Tickers mapped to their precomputed 'operating_cashflow_json' and
+        'capital_expenditures_json'.
+    rates (tuple, optional): A fixed (discount_rate, perpetual_growth_rate) used for every ticker.
+
+    Returns:
+    dict: The forecasts of each ticker, or the exception that made it fail.
+    """
+    cashflow_forecasts = cashflow_forecasts or {}
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_concurrency)
+    executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="forecast")
+
+    async def run_call(call):
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(loop.run_in_executor(executor, call), call_timeout)
+            except asyncio.TimeoutError:
+                raise ForecastTimeoutError(f"{call.func.__name__} timed out after {call_timeout}s") from None
+
+    batches = {}
+    if batch_size:
+        batch_jobs = [job for job in jobs if job[0] not in cashflow_forecasts]
+        for start in range(0, len(batch_jobs), batch_size):
+            batch = batch_jobs[start:start + batch_size]
+            batch_task = asyncio.ensure_future(run_call(partial(predict_batch_cashflows, batch, time_period, first_year,
+                                                                len(batch), bypass_cache=bypass_cache, fallback=False)))
+            batches.update((ticker, batch_task) for ticker, _, _ in batch)
+
+    async def batched_cashflows(ticker):
+        # Shielded, since the batch is shared with other tickers and must not be cancelled by one of them.
+        # None sends the ticker back through forecast_ticker's per-ticker cash flow calls.
+        try:
+            return (await asyncio.shield(batches[ticker])).get(ticker)
+        except Exception as e:
+            logger.warning("Batched forecast of %s failed, falling back to per-ticker requests: %s", ticker, e)
+            return None
+
+    async def precomputed_cashflows(ticker):
+        return cashflow_forecasts[ticker]
+
+    async def run_job(ticker, operating_cashflow_historicals, capex_historicals):
+        if ticker in cashflow_forecasts:
+            cashflows = precomputed_cashflows(ticker)
+        else:
+            cashflows = batched_cashflows(ticker) if batch_size else None
+        try:
+            with timed("forecast"):
+                forecasts = await forecast_ticker(ticker, time_period, first_year, operating_cashflow_historicals,
+                                                  capex_historicals, run_call, bypass_cache, cashflows, rates)
+        except Exception as e:
+            if on_result:
+                on_result(ticker, None, e)
+            return ticker, e
+        if on_result:
+            on_result(ticker, forecasts, None)
+        return ticker, forecasts
+
+    try:
+        results = await asyncio.gather(*(run_job(*job) for job in jobs))
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return dict(results)
+
+
+def run_forecasts(jobs, time_period, first_year, **kwargs):
+    """
+    Blocking wrapper around forecast_universe.
+
+    Args:
+    jobs (list): Tuples of (ticker, operating_cashflow_historicals, capex_historicals).
+    time_period (int): The number of forecast years.
+    first_year (int): The first forecast year.
+    **kwargs: Further options passed on to forecast_universe.
+
+    Returns:
+    dict: The forecasts of each ticker, or the exception that made it fail.
+    """
+    return asyncio.run(forecast_universe(jobs, time_period, first_year, **kwargs))
@@ -0,0 +1,304 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from support_functions import to_float_array
+
+STATEMENTS = ('income_statement', 'balance_sheet', 'cash_flow')
+TEXT_COLUMNS = ('fiscalDateEnding', 'reportedCurrency')
+SCHEMA_VERSION = 1
+DEFAULT_STORE_PATH = "fundamentals.sqlite"
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_MMAP_SIZE = 1 << 30
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tickers (
+    ticker TEXT PRIMARY KEY,
+    shares_outstanding INTEGER NOT NULL,
+    fetched_at REAL NOT NULL,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS statements (
+    ticker TEXT NOT NULL,
+    statement TEXT NOT NULL,
+    columns TEXT NOT NULL,
+    text_values TEXT NOT NULL,
+    num_rows INTEGER NOT NULL,
+    numeric_values BLOB NOT NULL,
+    PRIMARY KEY (ticker, statement)
+);
+"""
+
+
+class FundamentalsStore:
+    """
+    SQLite-backed store of fetched financial statements, keyed by ticker and statement.
+
+    Each statement is stored as one row holding its numeric fields already converted to float64 (with the
+    to_float rules, so "None" becomes 0) in a single BLOB, and its text fields (fiscalDateEnding,
+    reportedCurrency and any field that is not a number) as JSON. Loading a statement is therefore one
+    buffer copy instead of parsing every cell from a string. A ticker is upserted atomically in a single
+    transaction and many tickers are read back with one query. Each ticker carries the time it was fetched
+    and a version that increments on every upsert, which is used to decide whether the data is stale.
+    Reads go through SQLite's memory-mapped I/O.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, mmap_size=DEFAULT_MMAP_SIZE):
+        """
+        Open (and create if needed) a fundamentals store.
+
+        Args:
+        path (str): Path of the SQLite database file.
+        ttl_seconds (float): Age after which stored data is considered stale. None disables expiry.
+        mmap_size (int): Maximum number of bytes of the database file to memory-map for reads.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(f"PRAGMA mmap_size={int(mmap_size)}")
+
+        schema_version = self._connection.execute("PRAGMA user_version").fetchone()[0]
+        if schema_version not in (0, SCHEMA_VERSION):
+            raise ValueError(f"Unsupported fundamentals store schema version {schema_version} in {path}")
+        self._connection.executescript(_SCHEMA)
+        self._connection.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Close the underlying database connection.
+        """
+        with self._lock:
+            self._connection.close()
+
+    def put(self, ticker, financial_data, fetched_at=None):
+        """
+        Atomically insert or replace all statements of a ticker.
+
+        Args:
+        ticker (str): The stock ticker symbol.
+        financial_data (dict): Financial data as returned by fetch_financial_data.
+        fetched_at (float, optional): Unix time the data was fetched. Defaults to now.
+
+        Returns:
+        int: The new version of the ticker's data.
+        """
+        fetched_at = time.time() if fetched_at is None else fetched_at
+        rows = [(ticker, statement, *_encode_statement(financial_data[statement])) for statement in STATEMENTS]
+
+        with self._lock:
+            cursor = self._connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                cursor.execute("DELETE FROM statements WHERE ticker = ?", (ticker,))
+                cursor.executemany("INSERT INTO statements VALUES (?, ?, ?, ?, ?, ?)", rows)
+                cursor.execute(
+                    """
+                    INSERT INTO tickers (ticker, shares_outstanding, fetched_at, version) VALUES (?, ?, ?, 1)
+                    ON CONFLICT(ticker) DO UPDATE SET shares_outstanding = excluded.shares_outstanding,
+                                                      fetched_at = excluded.fetched_at,
+                                                      version = tickers.version + 1
+                    """,
+                    (ticker, int(financial_data["shares_outstanding"]), fetched_at))
+                version = cursor.execute("SELECT version FROM tickers WHERE ticker = ?", (ticker,)).fetchone()[0]
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+        return version
+
+    def metadata(self, tickers=None):
+        """
+        Return the staleness metadata of stored tickers.
+
+        Args:
+        tickers (list, optional): Tickers to look up. Defaults to every stored ticker.
+
+        Returns:
+        DataFrame: Indexed by ticker, with 'shares_outstanding', 'fetched_at', 'version' and 'stale' columns.
+        """
+        with self._lock:
+            metadata = pd.read_sql_query(
+                "SELECT ticker, shares_outstanding, fetched_at, version FROM tickers" +
+                self._ticker_filter("tickers", tickers),
+                self._connection, index_col="ticker")
+        metadata["stale"] = self._is_stale(metadata["fetched_at"])
+        return metadata
+
+    def stale_tickers(self, tickers):
+        """
+        Return the tickers that are missing from the store or whose data has expired.
+
+        Args:
+        tickers (list): Tickers to check.
+
+        Returns:
+        list: The tickers that need to be (re)fetched, in input order.
+        """
+        metadata = self.metadata(tickers)
+        fresh = set(metadata.index[~metadata["stale"]])
+        return [ticker for ticker in tickers if ticker not in fresh]
+
+    def get(self, ticker, allow_stale=False):
+        """
+        Load the financial data of a single ticker.
+
+        Args:
+        ticker (str): The stock ticker symbol.
+        allow_stale (bool): Whether to return data older than the store's TTL.
+
+        Returns:
+        dict or None: Financial data shaped like fetch_financial_data's output, or None if not available.
+        """
+        return self.get_many([ticker], allow_stale=allow_stale).get(ticker)
+
+    def get_many(self, tickers=None, allow_stale=False):
+        """
+        Load the financial data of many tickers with a single query per table.
+
+        Args:
+        tickers (list, optional): Tickers to load. Defaults to every stored ticker.
+        allow_stale (bool): Whether to return data older than the store's TTL.
+
+        Returns:
+        dict: Financial data shaped like fetch_financial_data's output, keyed by ticker. Missing (and,
+        unless allowed, stale) tickers are left out.
+        """
+        metadata = self.metadata(tickers)
+        if not allow_stale:
+            metadata = metadata[~metadata["stale"]]
+        if metadata.empty:
+            return {}
+
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT ticker, statement, columns, text_values, num_rows, numeric_values FROM statements" +
+                self._ticker_filter("statements", list(metadata.index))).fetchall()
+
+        financial_data = {ticker: {"shares_outstanding": int(shares)}
+                          for ticker, shares in metadata["shares_outstanding"].items()}
+        for ticker, statement, columns, text_values, num_rows, numeric_values in rows:
+            financial_data[ticker][statement] = _decode_statement(columns, text_values, num_rows, numeric_values)
+
+        for data in financial_data.values():
+            for statement in STATEMENTS:
+                if statement not in data:
+                    data[statement] = pd.DataFrame()
+        return financial_data
+
+    def import_legacy_json(self, ticker, filename=None):
+        """
+        Import a ticker from the legacy '{ticker}_financial_data.json' cache file.
+
+        Args:
+        ticker (str): The stock ticker symbol.
+        filename (str, optional): Path of the legacy JSON file.
+
+        Returns:
+        dict or None: The imported financial data, or None if no legacy file exists.
+        """
+        filename = filename or f"{ticker}_financial_data.json"
+        if not os.path.exists(filename):
+            return None
+        with open(filename, 'r') as file:
+            financial_data = json.load(file)
+        for statement in STATEMENTS:
+            financial_data[statement] = pd.DataFrame(financial_data[statement])
+        self.put(ticker, financial_data, fetched_at=os.path.getmtime(filename))
+        return self.get(ticker, allow_stale=True)
+
+    def _is_stale(self, fetched_at):
+        if self.ttl_seconds is None:
+            return pd.Series(False, index=fetched_at.index)
+        return fetched_at < time.time() - self.ttl_seconds
+
+    def _ticker_filter(self, table, tickers):
+        # Requested tickers go through a temporary table, which avoids SQLite's bound-parameter limit
+        if tickers is None:
+            return ""
+        self._connection.execute("CREATE TEMP TABLE IF NOT EXISTS requested_tickers (ticker TEXT PRIMARY KEY)")
+        self._connection.execute("DELETE FROM requested_tickers")
+        self._connection.executemany("INSERT OR IGNORE INTO requested_tickers VALUES (?)",
+                                     ((ticker,) for ticker in tickers))
+        return f" WHERE {table}.ticker IN (SELECT ticker FROM requested_tickers)"
+
+
+def get_default_store():
+    """
+    Return the process-wide fundamentals store, opening it on first use.
+
+    Returns:
+    FundamentalsStore: The shared store at DEFAULT_STORE_PATH.
+    """
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = FundamentalsStore()
+        return _default_store
+
+
+def set_default_store(store):
+    """
+    Replace the process-wide fundamentals store, e.g. with a temporary store in tests.
+
+    Args:
+    store (FundamentalsStore): The store to install.
+
+    Returns:
+    FundamentalsStore or None: The previously installed store.
+    """
+    global _default_store
+    with _default_store_lock:
+        previous_store, _default_store = _default_store, store
+        return previous_store
+
+
+def _encode_statement(df):
+    # Numeric fields become one row-major float64 buffer; text fields (and fields holding anything other
+    # than numbers) are kept as JSON lists. Rows keep their order, so repeated fiscal dates are preserved.
+    columns = [str(column) for column in df.columns]
+    cells = df.to_numpy(dtype=object)
+    numbers = to_float_array(cells) if cells.size else np.empty(cells.shape)
+    is_text = np.array([isinstance(cell, str) for cell in cells.ravel()], dtype=bool).reshape(cells.shape)
+    unparsable = (np.isnan(numbers) & is_text).any(axis=0) if cells.size else np.zeros(len(columns), dtype=bool)
+
+    text_values, numeric_positions = {}, []
+    for position, column in enumerate(columns):
+        if column in TEXT_COLUMNS or unparsable[position]:
+            text_values[column] = [None if cell is None else str(cell) for cell in cells[:, position]]
+        else:
+            numeric_positions.append(position)
+    numeric_values = np.ascontiguousarray(numbers[:, numeric_positions], dtype=np.float64)
+    return json.dumps(columns), json.dumps(text_values), len(df), numeric_values.tobytes()
+
+
+def _decode_statement(columns, text_values, num_rows, numeric_values):
+    columns = json.loads(columns)
+    if not columns:
+        return pd.DataFrame()
+    text_values = json.loads(text_values)
+    numeric_columns = [column for column in columns if column not in text_values]
+    numbers = np.frombuffer(numeric_values, dtype=np.float64).reshape(num_rows, len(numeric_columns)).copy()
+    df = pd.concat([pd.DataFrame(text_values, index=pd.RangeIndex(num_rows), dtype=object),
+                    pd.DataFrame(numbers, columns=numeric_columns)], axis=1, copy=False)
+    # Text fields usually come first already, in which case no reordering copy is needed
+    if list(df.columns) != columns:
+        df = df[columns]
+    return df
+
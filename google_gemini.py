@@ -1,11 +1,32 @@
-from dotenv import load_dotenv
-from google.oauth2 import service_account
-import vertexai
-from vertexai.language_models import ChatModel
-from vertexai.preview.generative_models import GenerativeModel
+import json
+import logging
 import os
+import re
+import threading
+import time
 
-load_dotenv()
+from instrumentation import increment, timed
+from llm_cache import get_default_cache, response_cache_key
+from llm_parsing import ForecastParseError, extract_json_payload, parse_forecast, parse_forecast_mapping, parse_number, forecast_to_json
+
+MODEL_NAME = "gemini-pro"
+GENERATION_CONFIG = {
+    "max_output_tokens": 252,
+    "temperature": 0,
+}
+
+BATCH_GENERATION_CONFIG = {
+    "max_output_tokens": 8192,
+    "temperature": 0,
+}
+DEFAULT_BATCH_SIZE = 10
+BATCH_METRICS = ("operatingCashflow", "capitalExpenditures")
+MAX_FORECAST_REPAIRS = 2
+
+logger = logging.getLogger(__name__)
+
+_backend = None
+_backend_lock = threading.Lock()
 
 def format_gemini_opcf_projection_historical(ticker, timespan, first_year, historical_json):
     return f"""
@@ -27,6 +48,34 @@ def format_gemini_capex_projection_historical(ticker, timespan, first_year, hist
     {historical_json}
     """
 
+def format_gemini_missing_years_prompt(metric, ticker, years, known_json, historical_json):
+    return f"""
+    You are a professional financial analyst known for your extremely accurate financial forecasts.
+    Provide {metric} in dollars for {ticker} for only the following years: {", ".join(years)}.
+    You will only respond with a JSON object containing the estimates for these years. Do not provide explanations.
+
+    Your earlier estimates for the other years were:
+    {known_json}
+
+    Use the following historical data in your determination:
+    {historical_json}
+    """
+
+def format_gemini_batch_projection_historical(entries, timespan, first_year):
+    historical_json = json.dumps({ticker: {"operatingCashflow": json.loads(operating_cashflow_historicals),
+                                           "capitalExpenditures": json.loads(capex_historicals)}
+                                  for ticker, operating_cashflow_historicals, capex_historicals in entries})
+    return f"""
+    You are a professional financial analyst known for your extremely accurate financial forecasts.
+    Provide operating cash flow and capital expenditures in dollars for each of the following tickers over the next {timespan} years starting in {first_year}.
+    You will only respond with a single JSON object of the form
+    {{"<ticker>": {{"operatingCashflow": {{"<year>": <number>, ...}}, "capitalExpenditures": {{"<year>": <number>, ...}}}}, ...}}
+    covering every ticker and every year from {first_year} to {first_year + timespan - 1}. Do not provide explanations.
+
+    Use the following historical data in your determination:
+    {historical_json}
+    """
+
 def format_gemini_dcrate_prompt(ticker, timespan):
     return f"Determine the appropriate discount rate for a discounted cash flow model for {ticker}. You will only respond with a decimal."
 
@@ -34,34 +83,318 @@ def format_gemini_perpgrowthrate_prompt(ticker, timespan):
     return f"Determine the gordown growth formula terminal growth rate for {ticker} for a discounted cash flow model. Respond only with a decimal."
 
 
-def get_gemini_response(user_input):
+class VertexAIBackend:
+    """
+    Gemini on Vertex AI. The SDK, the .env file and the service-account credentials are loaded once,
+    on the first request, and the initialized model is shared by all threads.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, location="us-central1"):
+        self.model_name = model_name
+        self.location = location
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _get_model(self):
+        with self._lock:
+            if self._model is None:
+                from dotenv import load_dotenv
+                from google.oauth2 import service_account
+                import vertexai
+                from vertexai.preview.generative_models import GenerativeModel
+
+                load_dotenv()
+                credentials = service_account.Credentials.from_service_account_file(
+                            os.environ["VERTEX_AI_AUTHFILE"],
+                scopes = ["https://www.googleapis.com/auth/cloud-platform"])
+
+                vertexai.init(project=os.environ['VERTEX_AI_PROJECT'], location=self.location, credentials=credentials)
+
+                self._model = GenerativeModel(self.model_name)
+            return self._model
+
+    def generate(self, prompt, generation_config):
+        response = self._get_model().generate_content(
+                        prompt,
+            generation_config=generation_config,
+                    )
+        return response.candidates[0].text
+
+
+class FakeLLMBackend:
+    """
+    Deterministic local stand-in for the model, for tests and benchmarks.
+
+    Forecast prompts are answered with a JSON object that grows the last historical value by a fixed rate,
+    the discount rate and perpetual growth rate prompts with a fixed decimal.
+    """
+
+    def __init__(self, latency=0.0, growth_rate=0.05, discount_rate=0.08, perpetual_growth_rate=0.025,
+                 responder=None):
+        """
+        Args:
+        latency (float): Seconds each request sleeps to simulate a model round trip.
+        growth_rate (float): Yearly growth applied to the last historical value in forecasts.
+        discount_rate (float): The answer to discount rate prompts.
+        perpetual_growth_rate (float): The answer to perpetual growth rate prompts.
+        responder (callable, optional): Replaces the built-in answers; called with (prompt, generation_config).
+        """
+        self.model_name = "fake-llm"
+        self.latency = latency
+        self.growth_rate = growth_rate
+        self.discount_rate = discount_rate
+        self.perpetual_growth_rate = perpetual_growth_rate
+        self.responder = responder
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt, generation_config):
+        with self._lock:
+            self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.responder is not None:
+            return self.responder(prompt, generation_config)
+        if "discount rate" in prompt:
+            return str(self.discount_rate)
+        if "terminal growth rate" in prompt:
+            return str(self.perpetual_growth_rate)
+        requested_years = re.search(r"for only the following years: ([\d, ]+)", prompt)
+        if requested_years:
+            historicals = json.loads(prompt[prompt.index("determination:") + len("determination:"):])
+            last_year, last_value = max(historicals.items())
+            return json.dumps({year: round(float(last_value) * (1 + self.growth_rate) ** (int(year) - int(last_year)))
+                               for year in requested_years.group(1).replace(" ", "").split(",")})
+        horizon = re.search(r"over the next (\d+) years starting in (\d+)", prompt)
+        timespan, first_year = int(horizon.group(1)), int(horizon.group(2))
+        if "for each of the following tickers" in prompt:
+            historicals = json.loads(prompt[prompt.index("determination:") + len("determination:"):])
+            return json.dumps({ticker: {metric: self._forecast(values, timespan, first_year)
+                                        for metric, values in metrics.items()}
+                               for ticker, metrics in historicals.items()})
+        historical_values = re.findall(r":\s*(-?[\d.]+(?:[eE][-+]?\d+)?)", prompt[horizon.end():])
+        return json.dumps(self._forecast(dict(enumerate(historical_values)), timespan, first_year))
+
+    def _forecast(self, historical_values, timespan, first_year):
+        last_value = float(list(historical_values.values())[-1]) if historical_values else 0.0
+        return {str(first_year + year): round(last_value * (1 + self.growth_rate) ** (year + 1))
+                for year in range(timespan)}
+
+
+def get_backend():
+    """
+    Return the model backend shared by all predict_* functions, creating the Vertex AI backend on first use.
+
+    Returns:
+    VertexAIBackend or FakeLLMBackend: The process-wide backend.
+    """
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = VertexAIBackend()
+        return _backend
+
+
+def set_backend(backend):
+    """
+    Replace the process-wide model backend, e.g. with a FakeLLMBackend in tests and benchmarks.
+
+    Args:
+    backend: An object with a 'model_name' attribute and a generate(prompt, generation_config) method.
+
+    Returns:
+    The previously installed backend, or None.
+    """
+    global _backend
+    with _backend_lock:
+        previous_backend, _backend = _backend, backend
+        return previous_backend
+
+
+def _is_usable(response_text, validate):
+    if validate is None:
+        return True
+    try:
+        validate(response_text)
+    except ValueError:
+        return False
+    return True
+
+
+def get_gemini_response(user_input, bypass_cache=False, cache=None, generation_config=GENERATION_CONFIG,
+                        validate=None):
+    """
+    Get the Gemini response to a prompt, serving repeated prompts from the response cache.
+
+    Args:
+    user_input (str): The formatted prompt.
+    bypass_cache (bool): Skip the cache lookup and always call the model; the fresh response is still stored.
+    cache (LLMResponseCache, optional): The cache to use. Defaults to the process-wide cache.
+    generation_config (dict): The generation settings passed to the model.
+    validate (callable, optional): Called with the response text; raises ValueError if it is unusable. Unusable
+        responses are returned but neither cached nor served from the cache, so the next request asks the
+        model again.
+
+    Returns:
+    str: The text of the model response.
+    """
+    backend = get_backend()
+    cache = cache or get_default_cache()
+    cache_key = response_cache_key(backend.model_name, generation_config, user_input)
+    if not bypass_cache:
+        cached_response = cache.get(cache_key)
+        if cached_response is not None and _is_usable(cached_response, validate):
+            increment("llm_cache_hits")
+            return cached_response
+        increment("llm_cache_misses")
+
+    with timed("llm_request", model=backend.model_name):
+        response_text = backend.generate(user_input, generation_config)
+    increment("llm_response_bytes", len(response_text.encode("utf-8")))
+    if _is_usable(response_text, validate):
+        cache.put(cache_key, response_text)
+    else:
+        increment("llm_unusable_responses")
+    return response_text
+
+
+def complete_forecast(response_text, metric, ticker, time_period, first_year, historical_json, bypass_cache=False,
+                      max_repairs=MAX_FORECAST_REPAIRS):
+    """
+    Parse a yearly forecast response and re-request only the years that are missing from it.
+
+    Responses cut off by the output token limit, or with years that cannot be parsed, are completed with
+    targeted follow-up prompts instead of repeating the whole forecast.
+
+    Args:
+    response_text (str): The raw model response.
+    metric (str): The forecast metric as worded in the prompts, e.g. 'capital expenditures'.
+    ticker (str): The stock ticker symbol.
+    time_period (int): The number of forecast years.
+    first_year (int): The first forecast year.
+    historical_json (str): The historical values sent with the original prompt.
+    bypass_cache (bool): Whether to skip the response cache.
+    max_repairs (int): The number of follow-up requests made before giving up.
+
+    Returns:
+    str: A JSON object mapping every forecast year to its value.
+
+    Raises:
+    ForecastParseError: If years are still missing after max_repairs follow-up requests.
+    """
+    values, missing_years = parse_forecast(response_text, first_year, time_period)
+    for attempt in range(max_repairs):
+        if not missing_years:
+            break
+        increment("llm_forecast_repairs")
+        # A repeated follow-up must not be served the cached answer that was already unusable
+        repair_text = get_gemini_response(
+            format_gemini_missing_years_prompt(metric, ticker, missing_years, forecast_to_json(values), historical_json),
+            bypass_cache or attempt > 0)
+        repaired_values, _ = parse_forecast(repair_text, first_year, time_period)
+        values.update((year, value) for year, value in repaired_values.items() if year in missing_years)
+        missing_years = [year for year in missing_years if year not in values]
+
+    if missing_years:
+        raise ForecastParseError(f"{metric} forecast for {ticker} is missing the years {', '.join(missing_years)}")
+    return forecast_to_json(values)
+
 
-    credentials = service_account.Credentials.from_service_account_file(
-                os.environ["VERTEX_AI_AUTHFILE"],
-    scopes = ["https://www.googleapis.com/auth/cloud-platform"])
+def predict_capex(ticker, time_period, first_year, historical_json, bypass_cache=False):
+    response_text = get_gemini_response(format_gemini_capex_projection_historical(ticker, time_period, first_year, historical_json), bypass_cache)
+    return complete_forecast(response_text, "capital expenditures", ticker, time_period, first_year, historical_json, bypass_cache)
 
-    vertexai.init(project=os.environ['VERTEX_AI_PROJECT'], location="us-central1", credentials=credentials)
+def predict_opcf(ticker, time_period, first_year, historical_json, bypass_cache=False):
+    response_text = get_gemini_response(format_gemini_opcf_projection_historical(ticker, time_period, first_year, historical_json), bypass_cache)
+    return complete_forecast(response_text, "operating cash flow", ticker, time_period, first_year, historical_json, bypass_cache)
 
-    chat_model = GenerativeModel("gemini-pro")
+def predict_dcrate(ticker, timespan, bypass_cache=False):
+    # A rate that does not parse is not cached, so it is asked for again instead of failing until the TTL expires
+    return get_gemini_response(format_gemini_dcrate_prompt(ticker, timespan), bypass_cache, validate=parse_number)
 
-    response = chat_model.generate_content(
-                    user_input,
-        generation_config={
-            "max_output_tokens": 252,
-            "temperature": 0,
-        },
-                )
-    return response.candidates[0].text
+def predict_perpgrowthrate(ticker, timespan, bypass_cache=False):
+    return get_gemini_response(format_gemini_perpgrowthrate_prompt(ticker, timespan), bypass_cache,
+                               validate=parse_number)
 
 
-def predict_capex(ticker, time_period, first_year, historical_json):
-    return get_gemini_response(format_gemini_capex_projection_historical(ticker, time_period, first_year, historical_json))
+def validate_batch_forecast(response_text, tickers, timespan, first_year):
+    """
+    Validate a batched forecast response against the expected schema.
+
+    Each ticker must map both metrics to a number (or a number string such as "1.2B") for every year from
+    first_year to first_year + timespan - 1.
+    Entries that do not match are left out so they can be re-requested individually.
 
-def predict_opcf(ticker, time_period, first_year, historical_json):
-    return get_gemini_response(format_gemini_opcf_projection_historical(ticker, time_period, first_year, historical_json))
+    Args:
+    response_text (str): The raw model response.
+    tickers (list): The tickers that were requested.
+    timespan (int): The number of forecast years.
+    first_year (int): The first forecast year.
 
-def predict_dcrate(ticker, timespan):
-    return get_gemini_response(format_gemini_dcrate_prompt(ticker, timespan))
+    Returns:
+    dict: The valid entries, mapping each ticker to its 'operating_cashflow_json' and
+    'capital_expenditures_json' strings.
+    """
+    document = extract_json_payload(response_text)
+    if not isinstance(document, dict):
+        return {}
+
+    valid_entries = {}
+    for ticker in tickers:
+        entry = document.get(ticker)
+        if not isinstance(entry, dict) or not all(isinstance(entry.get(metric), dict) for metric in BATCH_METRICS):
+            continue
+        operating_cashflow, missing_operating_cashflow = parse_forecast_mapping(entry["operatingCashflow"], first_year, timespan)
+        capital_expenditures, missing_capital_expenditures = parse_forecast_mapping(entry["capitalExpenditures"], first_year, timespan)
+        if not missing_operating_cashflow and not missing_capital_expenditures:
+            valid_entries[ticker] = {
+                "operating_cashflow_json": forecast_to_json(operating_cashflow),
+                "capital_expenditures_json": forecast_to_json(capital_expenditures),
+            }
+    return valid_entries
+
+
+def predict_batch_cashflows(entries, time_period, first_year, batch_size=DEFAULT_BATCH_SIZE, bypass_cache=False,
+                            fallback=True):
+    """
+    Forecast operating cash flow and capital expenditures for many tickers with one model call per batch.
+
+    Tickers whose part of a batched response is missing or malformed fall back to predict_opcf and
+    predict_capex, unless fallback is False, in which case they are left out for the caller to re-request.
+
+    Args:
+    entries (list): Tuples of (ticker, operating_cashflow_historicals, capex_historicals).
+    time_period (int): The number of forecast years.
+    first_year (int): The first forecast year.
+    batch_size (int): The number of tickers packed into one request.
+    bypass_cache (bool): Whether to skip the response cache.
+    fallback (bool): Whether to make the per-ticker calls for tickers missing from the batched responses.
+
+    Returns:
+    dict: Each ticker mapped to its 'operating_cashflow_json' and 'capital_expenditures_json' strings, or to
+    the exception raised by its fallback calls. Without fallback, only the valid batched entries.
+    """
+    forecasts = {}
+    for start in range(0, len(entries), batch_size):
+        batch = entries[start:start + batch_size]
+        try:
+            response_text = get_gemini_response(format_gemini_batch_projection_historical(batch, time_period, first_year),
+                                                bypass_cache, generation_config=BATCH_GENERATION_CONFIG)
+            forecasts.update(validate_batch_forecast(response_text, [entry[0] for entry in batch], time_period, first_year))
+        except Exception as e:
+            logger.warning("Batched forecast failed, falling back to per-ticker requests: %s", e)
 
-def predict_perpgrowthrate(ticker, timespan):
-    return get_gemini_response(format_gemini_perpgrowthrate_prompt(ticker, timespan))
\ No newline at end of file
+        if not fallback:
+            continue
+        for ticker, operating_cashflow_historicals, capex_historicals in batch:
+            if ticker in forecasts:
+                continue
+            increment("llm_batch_fallbacks")
+            try:
+                forecasts[ticker] = {
+                    "operating_cashflow_json": predict_opcf(ticker, time_period, first_year, operating_cashflow_historicals, bypass_cache),
+                    "capital_expenditures_json": predict_capex(ticker, time_period, first_year, capex_historicals, bypass_cache),
+                }
+            except Exception as e:
+                forecasts[ticker] = e
+    return forecasts
@@ -0,0 +1,223 @@
+import bisect
+import json
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the latency histogram buckets; the last bucket is unbounded
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+METRIC_PREFIX = "autodcf"
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = [*label_key, *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+class MetricsRegistry:
+    """
+    Thread-safe collection of counters and latency histograms.
+
+    Counters record event counts and sizes (cache hits, retries, bytes transferred); histograms record how
+    long each pipeline stage took. Both can carry labels and are exported as JSON lines or in the
+    Prometheus text format.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        """
+        Args:
+        buckets (tuple): Ascending upper bounds, in seconds, of the histogram buckets.
+        """
+        self.buckets = tuple(buckets)
+        self._counters = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1, **labels):
+        """
+        Add to a counter.
+
+        Args:
+        name (str): The counter name, e.g. 'llm_cache_hits'.
+        value (float): The amount to add.
+        **labels: Labels distinguishing series of the same counter.
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        """
+        Record a latency in a histogram.
+
+        Args:
+        name (str): The histogram name, e.g. 'stage_seconds'.
+        seconds (float): The observed latency.
+        **labels: Labels distinguishing series of the same histogram.
+        """
+        key = (name, _label_key(labels))
+        bucket = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = {"count": 0, "sum": 0.0, "min": math.inf, "max": 0.0,
+                                                     "buckets": [0] * (len(self.buckets) + 1)}
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            histogram["min"] = min(histogram["min"], seconds)
+            histogram["max"] = max(histogram["max"], seconds)
+            histogram["buckets"][bucket] += 1
+
+    def counter_value(self, name, **labels):
+        """
+        Return the current value of a counter, or 0 if it was never incremented.
+        """
+        with self._lock:
+            return self._counters.get((name, _label_key(labels)), 0)
+
+    def snapshot(self):
+        """
+        Return a consistent copy of every metric.
+
+        Returns:
+        list: One dict per series with the 'type', 'name' and 'labels', plus the 'value' of counters or the
+        'count', 'sum', 'min', 'max' and cumulative 'buckets' of histograms.
+        """
+        with self._lock:
+            counters = list(self._counters.items())
+            histograms = [(key, dict(histogram, buckets=list(histogram["buckets"])))
+                          for key, histogram in self._histograms.items()]
+
+        metrics = [{"type": "counter", "name": name, "labels": dict(label_key), "value": value}
+                   for (name, label_key), value in sorted(counters)]
+        for (name, label_key), histogram in sorted(histograms, key=lambda item: item[0]):
+            cumulative, buckets = 0, {}
+            for upper_bound, count in zip([*self.buckets, math.inf], histogram["buckets"]):
+                cumulative += count
+                buckets["+Inf" if upper_bound == math.inf else repr(upper_bound)] = cumulative
+            metrics.append({"type": "histogram", "name": name, "labels": dict(label_key),
+                            "count": histogram["count"], "sum": histogram["sum"], "min": histogram["min"],
+                            "max": histogram["max"], "buckets": buckets})
+        return metrics
+
+    def to_json_lines(self):
+        """
+        Export every metric as one JSON object per line.
+
+        Returns:
+        str: The JSON lines, each stamped with the export time.
+        """
+        timestamp = time.time()
+        return "".join(json.dumps(dict(metric, timestamp=timestamp)) + "\n" for metric in self.snapshot())
+
+    def to_prometheus(self, prefix=METRIC_PREFIX):
+        """
+        Export every metric in the Prometheus text exposition format.
+
+        Args:
+        prefix (str): Prefix of every metric name.
+
+        Returns:
+        str: Counters as '<prefix>_<name>_total' and histograms as '_bucket', '_sum' and '_count' series.
+        """
+        lines, typed = [], set()
+        for metric in self.snapshot():
+            label_key = tuple(metric["labels"].items())
+            if metric["type"] == "counter":
+                name = f"{prefix}_{metric['name']}_total"
+                if name not in typed:
+                    lines.append(f"# TYPE {name} counter")
+                    typed.add(name)
+                lines.append(f"{name}{_format_labels(label_key)} {metric['value']}")
+            else:
+                name = f"{prefix}_{metric['name']}"
+                if name not in typed:
+                    lines.append(f"# TYPE {name} histogram")
+                    typed.add(name)
+                for upper_bound, count in metric["buckets"].items():
+                    lines.append(f"{name}_bucket{_format_labels(label_key, [('le', upper_bound)])} {count}")
+                lines.append(f"{name}_sum{_format_labels(label_key)} {metric['sum']}")
+                lines.append(f"{name}_count{_format_labels(label_key)} {metric['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        """
+        Drop every recorded metric.
+        """
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+def get_registry():
+    """
+    Return the process-wide metrics registry, creating it on first use.
+
+    Returns:
+    MetricsRegistry: The shared registry.
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = MetricsRegistry()
+        return _registry
+
+
+def set_registry(registry):
+    """
+    Replace the process-wide metrics registry, e.g. to isolate one run's metrics.
+
+    Args:
+    registry (MetricsRegistry): The registry to install.
+
+    Returns:
+    MetricsRegistry or None: The previously installed registry.
+    """
+    global _registry
+    with _registry_lock:
+        previous_registry, _registry = _registry, registry
+        return previous_registry
+
+
+def increment(name, value=1, **labels):
+    """
+    Add to a counter of the process-wide registry.
+
+    Args:
+    name (str): The counter name.
+    value (float): The amount to add.
+    **labels: Labels distinguishing series of the same counter.
+    """
+    get_registry().increment(name, value, **labels)
+
+
+@contextmanager
+def timed(stage, **labels):
+    """
+    Record the latency of a pipeline stage in the 'stage_seconds' histogram of the process-wide registry.
+
+    Works as a context manager and as a decorator. Failed runs are recorded too, and also counted in
+    'stage_errors'.
+
+    Args:
+    stage (str): The stage name, e.g. 'fetch' or 'dcf'.
+    **labels: Further labels of the series.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        increment("stage_errors", stage=stage, **labels)
+        raise
+    finally:
+        get_registry().observe("stage_seconds", time.perf_counter() - start, stage=stage, **labels)
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+DEFAULT_CACHE_PATH = "llm_cache.sqlite"
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 100_000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    last_access REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access);
+"""
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def response_cache_key(model_name, generation_config, prompt):
+    """
+    Hash the inputs that determine a model response.
+
+    Args:
+    model_name (str): The name of the model.
+    generation_config (dict): The generation settings passed to the model.
+    prompt (str): The formatted prompt.
+
+    Returns:
+    str: A hex SHA-256 digest identifying the request.
+    """
+    payload = json.dumps([model_name, generation_config, prompt], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """
+    Persistent SQLite cache of model responses with a TTL and a least-recently-used size limit.
+
+    The entry count is tracked in memory, so the size limit is approximate when several processes share
+    one cache file.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Args:
+        path (str): Path of the SQLite database file.
+        ttl_seconds (float): Age after which a response is no longer served. None disables expiry.
+        max_entries (int): Number of responses kept before the least recently used ones are evicted.
+        """
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        self._entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def get(self, key):
+        """
+        Look up a response, counting the hit or miss.
+
+        Args:
+        key (str): The key from response_cache_key.
+
+        Returns:
+        str or None: The cached response, or None if it is missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute("SELECT response, created_at FROM responses WHERE key = ?",
+                                           (key,)).fetchone()
+            if row is not None and self.ttl_seconds is not None and row[1] < now - self.ttl_seconds:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._entries -= 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._connection.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, response):
+        """
+        Store a response and evict the least recently used entries beyond the size limit.
+
+        Args:
+        key (str): The key from response_cache_key.
+        response (str): The model response.
+        """
+        now = time.time()
+        with self._lock:
+            exists = self._connection.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone()
+            self._connection.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)",
+                                     (key, response, now, now))
+            if exists is None:
+                self._entries += 1
+            excess = self._entries - self.max_entries
+            if excess > 0:
+                self._connection.execute(
+                    "DELETE FROM responses WHERE key IN "
+                    "(SELECT key FROM responses ORDER BY last_access LIMIT ?)", (excess,))
+                self._entries -= excess
+                self.evictions += excess
+
+    def clear(self):
+        """
+        Remove every cached response.
+        """
+        with self._lock:
+            self._connection.execute("DELETE FROM responses")
+            self._entries = 0
+
+    def stats(self):
+        """
+        Return the cache counters.
+
+        Returns:
+        dict: The number of 'hits', 'misses', 'evictions' and stored 'entries'.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "entries": self._entries}
+
+    def close(self):
+        """
+        Close the underlying database connection.
+        """
+        with self._lock:
+            self._connection.close()
+
+
+def get_default_cache():
+    """
+    Return the process-wide response cache, opening it on first use.
+
+    Returns:
+    LLMResponseCache: The shared cache at DEFAULT_CACHE_PATH.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LLMResponseCache()
+        return _default_cache
+
+
+def set_default_cache(cache):
+    """
+    Replace the process-wide response cache, e.g. with an in-memory cache in tests and benchmarks.
+
+    Args:
+    cache (LLMResponseCache): The cache to install.
+
+    Returns:
+    LLMResponseCache or None: The previously installed cache.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        previous_cache, _default_cache = _default_cache, cache
+        return previous_cache
@@ -0,0 +1,198 @@
+import json
+import re
+
+_FENCE = re.compile(r"```[A-Za-z0-9_-]*[ \t]*\n?")
+_JSON_START = re.compile(r"[{\[]")
+_YEAR = re.compile(r"(?<!\d)((?:19|20)\d{2})(?!\d)")
+# "2024": 123, "2025": "1,234.5 million", ... inside a (possibly cut off) JSON object; a value must be
+# followed by a delimiter, so a number cut off at the end of the response is not mistaken for a complete one
+_YEAR_VALUE_PAIR = re.compile(
+    r'"[^"\d]*((?:19|20)\d{2})[^"]*"\s*:\s*("[^"]*"|[-+$(\d][^,}\]\n]*?)(?=\s*[,}\]\n])')
+_NUMBER = re.compile(r"^([-+]?)\$?\s*([-+]?)\$?\s*(\d[\d,]*(?:\.\d*)?|\.\d+)(?:[eE]([-+]?\d+))?\s*([A-Za-z]*)\.?$")
+_UNITS = {
+    "": 1, "k": 1e3, "thousand": 1e3, "thousands": 1e3,
+    "m": 1e6, "mm": 1e6, "mn": 1e6, "mil": 1e6, "million": 1e6, "millions": 1e6,
+    "b": 1e9, "bn": 1e9, "billion": 1e9, "billions": 1e9,
+    "t": 1e12, "tn": 1e12, "trillion": 1e12, "trillions": 1e12,
+    "usd": 1, "dollars": 1,
+}
+_decoder = json.JSONDecoder()
+
+
+class ForecastParseError(ValueError):
+    """
+    Raised when a model response does not contain a usable forecast.
+    """
+
+
+def parse_number(value):
+    """
+    Convert a number from a model response to a float.
+
+    Besides JSON numbers, strings such as "1,234", "$1.2B", "-350 million" or "(1,200)" (a negative amount)
+    are accepted.
+
+    Args:
+    value (int, float or str): The value to convert.
+
+    Returns:
+    float: The parsed number.
+
+    Raises:
+    ValueError: If the value is not a number.
+    """
+    if isinstance(value, bool):
+        raise ValueError(f"Not a number: {value!r}")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if not isinstance(value, str):
+        raise ValueError(f"Not a number: {value!r}")
+
+    text = value.strip()
+    negative = text.startswith("(") and text.endswith(")")
+    if negative:
+        text = text[1:-1].strip()
+    match = _NUMBER.match(text)
+    if match is None or match.group(5).lower() not in _UNITS:
+        raise ValueError(f"Not a number: {value!r}")
+    sign, inner_sign, digits, exponent, unit = match.groups()
+    number = float(digits.replace(",", "") + (f"e{exponent}" if exponent else "")) * _UNITS[unit.lower()]
+    if negative or (sign == "-") != (inner_sign == "-"):
+        number = -number
+    return number
+
+
+def extract_json_payload(response_text):
+    """
+    Extract the first JSON object or array from a model response.
+
+    Markdown fences (with or without a language tag) and any prose before or after the object are ignored.
+
+    Args:
+    response_text (str): The raw model response.
+
+    Returns:
+    dict or list or None: The decoded JSON value, or None if the response holds no complete JSON value.
+    """
+    text = _FENCE.sub("", response_text)
+    for start in _JSON_START.finditer(text):
+        try:
+            return _decoder.raw_decode(text, start.start())[0]
+        except ValueError:
+            continue
+    return None
+
+
+def _year_mapping(document):
+    # Finds the year -> value mapping, also when the model nested it under a metric or ticker key
+    # or answered with a list of {"year": ..., "value": ...} records
+    if isinstance(document, list):
+        mapping = {}
+        for record in document:
+            if isinstance(record, dict) and len(record) == 2:
+                year = next((value for key, value in record.items() if "year" in str(key).lower()), None)
+                value = next((value for key, value in record.items() if "year" not in str(key).lower()), None)
+                if year is not None:
+                    mapping[str(year)] = value
+        return mapping
+    if not isinstance(document, dict):
+        return {}
+    if any(_YEAR.search(str(key)) for key in document):
+        return document
+    nested = [value for value in document.values() if isinstance(value, (dict, list))]
+    return _year_mapping(nested[0]) if len(nested) == 1 else {}
+
+
+def _salvage_year_values(response_text):
+    # Recovers the complete "year": value pairs of a response that was cut off mid-object
+    mapping = {}
+    for year, raw_value in _YEAR_VALUE_PAIR.findall(response_text):
+        raw_value = raw_value.strip()
+        mapping[year] = raw_value[1:-1] if raw_value.startswith('"') else raw_value
+    return mapping
+
+
+def parse_forecast(response_text, first_year=None, time_period=None):
+    """
+    Parse a yearly forecast from a model response, tolerating fences, prose, string numbers and truncation.
+
+    If the response holds no complete JSON object (typically because it was cut off by the output token
+    limit), the complete "year": value pairs are salvaged from the text.
+
+    Args:
+    response_text (str): The raw model response.
+    first_year (int, optional): The first expected forecast year.
+    time_period (int, optional): The number of expected forecast years. With first_year, years outside
+        first_year..first_year + time_period - 1 are dropped and missing ones reported.
+
+    Returns:
+    tuple: A dict mapping year strings to floats in ascending year order, and the list of expected years
+    (as strings) that are missing or unparsable.
+    """
+    document = extract_json_payload(response_text)
+    mapping = _year_mapping(document) if document is not None else {}
+    if not mapping:
+        mapping = _salvage_year_values(response_text)
+    return parse_forecast_mapping(mapping, first_year, time_period)
+
+
+def parse_forecast_mapping(mapping, first_year=None, time_period=None):
+    """
+    Parse the years and values of an already decoded forecast object.
+
+    Args:
+    mapping (dict): Year keys (e.g. "2024" or "FY2024") mapped to numbers or number strings.
+    first_year (int, optional): The first expected forecast year.
+    time_period (int, optional): The number of expected forecast years.
+
+    Returns:
+    tuple: A dict mapping year strings to floats in ascending year order, and the list of expected years
+    (as strings) that are missing or unparsable.
+    """
+    values = {}
+    for key, value in mapping.items():
+        year = _YEAR.search(str(key))
+        if year is None:
+            continue
+        try:
+            values[year.group(1)] = parse_number(value)
+        except ValueError:
+            continue
+
+    if first_year is None or time_period is None:
+        return dict(sorted(values.items())), []
+    expected_years = [str(first_year + year) for year in range(time_period)]
+    return ({year: values[year] for year in expected_years if year in values},
+            [year for year in expected_years if year not in values])
+
+
+def parse_forecast_values(response_text):
+    """
+    Parse a yearly forecast from a model response or a canonical forecast JSON string.
+
+    Args:
+    response_text (str): The raw model response or JSON string.
+
+    Returns:
+    dict: Year strings mapped to floats in ascending year order.
+
+    Raises:
+    ForecastParseError: If the response contains no yearly values.
+    """
+    values, _ = parse_forecast(response_text)
+    if not values:
+        raise ForecastParseError(f"No yearly forecast found in response: {response_text[:200]!r}")
+    return values
+
+
+def forecast_to_json(values):
+    """
+    Serialize parsed forecast values as the canonical JSON object used downstream.
+
+    Args:
+    values (dict): Year strings mapped to numbers.
+
+    Returns:
+    str: A JSON object mapping each year to its value, in ascending year order.
+    """
+    return json.dumps(dict(sorted(values.items())))
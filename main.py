@@ -1,14 +1,21 @@
 import json
+import logging
+import numpy as np
 import pandas as pd
-from alpha_vantage.fundamentaldata import FundamentalData
 import requests
 import os
 
 from dotenv import load_dotenv
 
-from support_functions import calculate_free_cash_flow, discount_cash_flows, calculate_terminal_value, to_float, extract_historicals
+from support_functions import calculate_free_cash_flow, discount_cash_flows, calculate_terminal_value, to_float, to_float_array, extract_historicals, shift_fiscal_date
 from calculation_functions import adjust_for_net_debt, calculate_equity_and_per_share_value
-from google_gemini import predict_opcf, predict_dcrate, predict_capex, predict_perpgrowthrate
+from forecast_orchestrator import run_forecasts
+from discounting import terminal_periods
+from fundamentals_store import get_default_store
+from instrumentation import timed, increment, get_registry
+from llm_parsing import ForecastParseError, parse_forecast_values
+
+logger = logging.getLogger(__name__)
 
 
 def process_df(df, exclude_columns, year):
@@ -26,114 +33,183 @@ def process_df(df, exclude_columns, year):
     return {col: to_float(val) if col not in exclude_columns else val
             for col, val in df.iloc[year].items()}
 
-def extract_detailed_financials(income_statement_df, balance_sheet_df, cash_flow_df):
+@timed("extraction")
+def extract_detailed_financials_frame(income_statement_df, balance_sheet_df, cash_flow_df):
     """
-        Extract and combine detailed financials from income statement, balance sheet, and cash flow data.
+    Combine income statement, balance sheet, and cash flow data into a single year-indexed DataFrame.
 
-        Args:
-        income_statement_df (DataFrame): DataFrame of income statement data.
-        balance_sheet_df (DataFrame): DataFrame of balance sheet data.
-        cash_flow_df (DataFrame): DataFrame of cash flow data.
+    All numeric fields are converted column-wise instead of cell by cell. When a field appears in several
+    statements, the later statement wins, as in extract_detailed_financials.
 
-        Returns:
-        dict: A dictionary containing detailed financials combined from all data sources.
-        """
-
-    extracted_financials = {}
-    previous_year_working_capital = None
+    Args:
+    income_statement_df (DataFrame): DataFrame of income statement data, latest fiscal year first.
+    balance_sheet_df (DataFrame): DataFrame of balance sheet data, latest fiscal year first.
+    cash_flow_df (DataFrame): DataFrame of cash flow data, latest fiscal year first.
 
+    Returns:
+    tuple: The combined DataFrame indexed by fiscal year in ascending order, and the number of years.
+    """
     exclude_columns = ['fiscalDateEnding', 'reportedCurrency']
 
-    def process_df(df):
-        return {col: to_float(val) if col not in exclude_columns else val
-                for col, val in df.iloc[year].items()}
-
-
     # Find the minimum length among the three dataframes
     min_length = min(len(income_statement_df), len(balance_sheet_df), len(cash_flow_df))
+    statements = [df.iloc[:min_length] for df in (income_statement_df, balance_sheet_df, cash_flow_df)]
+
+    # Later statements override earlier ones, while columns keep the position of their first appearance
+    column_sources = {}
+    for statement_index, df in enumerate(statements):
+        for column_index, column in enumerate(df.columns):
+            column_sources[column] = (statement_index, column_index)
+    columns = list(column_sources)
+    combined_values = np.empty((min_length, len(columns)), dtype=object)
+    for statement_index, df in enumerate(statements):
+        owned = [(target, source) for target, (owner, source) in enumerate(column_sources.values())
+                 if owner == statement_index]
+        if owned:
+            targets, sources = map(list, zip(*owned))
+            combined_values[:, targets] = df.to_numpy(dtype=object)[:, sources]
+
+    numeric_columns = [column for column in columns if column not in exclude_columns]
+    numeric_positions = [columns.index(column) for column in numeric_columns]
+    numeric_values = to_float_array(combined_values[:, numeric_positions])
+
+    # Additional Data Calculations; rows are still ordered latest fiscal year first
+    working_capital = (numeric_values[:, numeric_columns.index('totalCurrentAssets')] -
+                       numeric_values[:, numeric_columns.index('totalCurrentLiabilities')])
+    change_in_working_capital = np.concatenate([[np.nan], working_capital[1:] - working_capital[:-1]])
+
+    # Assuming Dividends Paid is available in the cash flow statement
+    if 'dividendPayout' in column_sources and column_sources['dividendPayout'][0] == 2:
+        dividends_paid = numeric_values[:, numeric_columns.index('dividendPayout')]
+    else:
+        dividends_paid = np.zeros(min_length)
+
+    combined_df = pd.DataFrame(
+        np.column_stack([numeric_values, working_capital, change_in_working_capital, dividends_paid]),
+        columns=numeric_columns + ['Working Capital', 'Change in Working Capital', 'Dividends Paid'])
+    for column in exclude_columns:
+        if column in column_sources:
+            combined_df.insert(columns.index(column), column, combined_values[:, columns.index(column)])
+
+    combined_df.index = [fiscal_date[:4] for fiscal_date in statements[0]['fiscalDateEnding']]
+    if combined_df.index.has_duplicates:
+        combined_df = combined_df[~combined_df.index.duplicated(keep='last')]
+
+    return combined_df.iloc[::-1], min_length
 
 
-    for year in range(min_length):
-        year_data = {}
+def extract_detailed_financials(income_statement_df, balance_sheet_df, cash_flow_df):
+    """
+        Extract and combine detailed financials from income statement, balance sheet, and cash flow data.
 
-        # Process each DataFrame
-        is_data = process_df(income_statement_df)
-        bs_data = process_df(balance_sheet_df)
-        cf_data = process_df(cash_flow_df)
+        Args:
+        income_statement_df (DataFrame): DataFrame of income statement data.
+        balance_sheet_df (DataFrame): DataFrame of balance sheet data.
+        cash_flow_df (DataFrame): DataFrame of cash flow data.
 
-        # Update year_data with processed data
-        year_data.update(is_data)
-        year_data.update(bs_data)
-        year_data.update(cf_data)
+        Returns:
+        dict: A dictionary containing detailed financials combined from all data sources.
+        """
+    combined_df, min_length = extract_detailed_financials_frame(income_statement_df, balance_sheet_df, cash_flow_df)
 
-        # Additional Data Calculations
-        current_year_working_capital = bs_data['totalCurrentAssets'] - bs_data['totalCurrentLiabilities']
-        year_data['Working Capital'] = current_year_working_capital
-        if previous_year_working_capital is not None:
-            year_data['Change in Working Capital'] = current_year_working_capital - previous_year_working_capital
-        else:
-            year_data['Change in Working Capital'] = None
-        previous_year_working_capital = current_year_working_capital
+    extracted_financials = combined_df.iloc[::-1].to_dict(orient='index')
+    if extracted_financials:
+        next(iter(extracted_financials.values()))['Change in Working Capital'] = None
 
-        # Assuming Dividends Paid is available in the cash flow statement
-        year_data['Dividends Paid'] = cf_data.get('dividendPayout', 0)
+    return extracted_financials, min_length
 
-        extracted_financials[is_data['fiscalDateEnding'][:4]] = year_data
 
-    return extracted_financials, min_length
+@timed("fetch")
+def fetch_financial_data(ticker, api_key, store=None):
+    """
+    Fetch the financial statements and shares outstanding of a ticker, using the local fundamentals store as cache.
 
+    Args:
+    ticker (str): The stock ticker symbol.
+    api_key (str): The Alpha Vantage API key.
+    store (FundamentalsStore, optional): The fundamentals store to read from and write to. Defaults to the
+    process-wide store.
 
-def fetch_financial_data(ticker, api_key):
-    fd = FundamentalData(api_key)
-    financial_data_filename = f"{ticker}_financial_data.json"
+    Returns:
+    dict or None: The income statement, balance sheet and cash flow DataFrames and the shares outstanding,
+    or None in case of an error. Freshly fetched data is returned as read back from the store, so it has
+    the same dtypes as a cache hit.
+    """
+    store = store or get_default_store()
 
     try:
-        # Check if financial data is already available as a JSON file
-        if os.path.exists(financial_data_filename):
-            with open(financial_data_filename, 'r') as file:
-                financial_data = json.load(file)
-                # Convert the loaded data back to DataFrame
-                financial_data['income_statement'] = pd.DataFrame(financial_data['income_statement'])
-                financial_data['balance_sheet'] = pd.DataFrame(financial_data['balance_sheet'])
-                financial_data['cash_flow'] = pd.DataFrame(financial_data['cash_flow'])
-                return financial_data
-        else:
+        # Check if fresh financial data is already available in the store (or in a legacy JSON cache file)
+        cached_financial_data = store.get(ticker, allow_stale=True)
+        if cached_financial_data is not None and not store.stale_tickers([ticker]):
+            increment("fundamentals_requests", source="store")
+            return cached_financial_data
+        if cached_financial_data is None:
+            legacy_financial_data = store.import_legacy_json(ticker)
+            if legacy_financial_data is not None:
+                increment("fundamentals_requests", source="legacy_json")
+                return legacy_financial_data
+
+        try:
+            from alpha_vantage.fundamentaldata import FundamentalData
+            fd = FundamentalData(api_key)
+
             # Fetch company overview data
             overview_url = f"https://www.alphavantage.co/query?function=OVERVIEW&symbol={ticker}&apikey={api_key}"
             overview_response = requests.get(overview_url)
+            increment("fetch_bytes", len(overview_response.content))
             overview_data = overview_response.json()
 
             # Fetch and process other financial data
             income_statement, _ = fd.get_income_statement_annual(symbol=ticker)
             balance_sheet, _ = fd.get_balance_sheet_annual(symbol=ticker)
             cash_flow, _ = fd.get_cash_flow_annual(symbol=ticker)
+        except Exception as e:
+            if cached_financial_data is None:
+                raise
+            logger.warning("Error refreshing data for %s, using stale cached data: %s", ticker, e)
+            increment("fundamentals_requests", source="stale_store")
+            return cached_financial_data
+
+        financial_data = {
+            "income_statement": pd.DataFrame(income_statement),
+            "balance_sheet": pd.DataFrame(balance_sheet),
+            "cash_flow": pd.DataFrame(cash_flow),
+            "shares_outstanding": int(overview_data.get("SharesOutstanding", 0))
+        }
 
-            financial_data = {
-                "income_statement": pd.DataFrame(income_statement),
-                "balance_sheet": pd.DataFrame(balance_sheet),
-                "cash_flow": pd.DataFrame(cash_flow),
-                "shares_outstanding": int(overview_data.get("SharesOutstanding", 0))
-            }
-
-            # Save the fetched data to a JSON file
-            with open(financial_data_filename, 'w') as file:
-                json_data = {key: (value.to_dict(orient='list') if isinstance(value, pd.DataFrame) else value)
-                             for key, value in financial_data.items()}
-                json.dump(json_data, file)
+        # Save the fetched data to the fundamentals store and read it back typed, like a cache hit
+        store.put(ticker, financial_data)
+        increment("fundamentals_requests", source="api")
 
-            return financial_data
+        return store.get(ticker, allow_stale=True)
 
-    except Exception as e:
-        print(f"Error fetching data: {e}")
+    except Exception:
+        logger.exception("Error fetching data for %s", ticker)
         return None
 
 
-from datetime import datetime, timedelta
+from datetime import datetime
+
+# The columns perform_dcf_analysis needs from the combined historical and forecast frame
+DCF_COLUMNS = ['fiscalDateEnding', 'reportedCurrency', 'operatingCashflow', 'capitalExpenditures']
 
-def setup_and_forecast_dataframe_llm(historical_df, operating_cashflow_json, capital_expenditures_json):
-    # Convert JSON strings to Python dictionaries
-    operating_cashflow = json.loads(operating_cashflow_json.replace("`", ""))
-    capital_expenditures = json.loads(capital_expenditures_json.replace("`", ""))
+@timed("forecast_frame")
+def setup_and_forecast_dataframe_llm(historical_df, operating_cashflow_json, capital_expenditures_json, columns=DCF_COLUMNS):
+    """
+    Append the forecast years from the LLM JSON output to the historical financials.
+
+    Args:
+    historical_df (DataFrame): Year-indexed historical financials in ascending order.
+    operating_cashflow_json (str): JSON object mapping forecast years to operating cash flow.
+    capital_expenditures_json (str): JSON object mapping forecast years to capital expenditures.
+    columns (list, optional): The historical columns to keep. Defaults to DCF_COLUMNS; None keeps all of them.
+
+    Returns:
+    DataFrame: The historical rows followed by one row per forecast year.
+    """
+    # Parse the forecasts, tolerating markdown fences, surrounding prose and numbers written as strings
+    operating_cashflow = parse_forecast_values(operating_cashflow_json)
+    capital_expenditures = parse_forecast_values(capital_expenditures_json)
 
     # Determine the last fiscal date and reported currency
     last_fiscal_date = historical_df['fiscalDateEnding'].dropna().iloc[-1]
@@ -142,42 +218,34 @@ def setup_and_forecast_dataframe_llm(historical_df, operating_cashflow_json, cap
     # Convert last fiscal date to a datetime object
     last_fiscal_date = datetime.strptime(last_fiscal_date, "%Y-%m-%d")
 
-    # Initialize the forecast DataFrame
-    forecast_df = pd.DataFrame()
-
-    # Since we no longer calculate future values, we iterate over the years provided in the JSON dictionaries
-    # Assuming both JSONs cover the same fiscal years
-    for year in operating_cashflow.keys():
-        future_year_data = {
-            'operatingCashflow': operating_cashflow[year],
-            'capitalExpenditures': capital_expenditures[year]
-        }
-
-        # Calculate the fiscal date for the future year
-        future_fiscal_date = (last_fiscal_date + timedelta(
-            days=365 * (int(year) - int(last_fiscal_date.strftime("%Y"))))).strftime("%Y-%m-%d")
-
-        # Add fiscal date and reported currency to the data
-        future_year_data['fiscalDateEnding'] = future_fiscal_date
-        future_year_data['reportedCurrency'] = reported_currency
-
-        # Convert future_year_data to a DataFrame and concatenate it with forecast_df
-        future_year_df = pd.DataFrame(
-            [future_year_data])  # Enclose future_year_data in a list to ensure it's treated as a single row
-        forecast_df = pd.concat([forecast_df, future_year_df], ignore_index=True)
-
     # When setting the forecast_df index, ensure you're working with integers.
     # Assuming historical_df.index[-1] is an integer or can be safely converted to one:
     last_index = int(historical_df.index[-1]) if isinstance(historical_df.index[-1], str) else historical_df.index[-1]
-    forecast_df.index = range(last_index + 1, last_index + 1 + len(forecast_df))
 
-    # Combine historical and forecasted data
+    # Build all forecast years in a single construction; both forecasts must cover the same fiscal years
+    years = list(operating_cashflow.keys())
+    missing_years = [year for year in years if year not in capital_expenditures]
+    if missing_years:
+        raise ForecastParseError(f"Capital expenditures forecast is missing the years {', '.join(missing_years)}")
+    forecast_df = pd.DataFrame({
+        'operatingCashflow': [operating_cashflow[year] for year in years],
+        'capitalExpenditures': [capital_expenditures[year] for year in years],
+        'fiscalDateEnding': [shift_fiscal_date(last_fiscal_date, int(year)).strftime("%Y-%m-%d") for year in years],
+        'reportedCurrency': reported_currency,
+    }, index=range(last_index + 1, last_index + 1 + len(years)))
+
+    # Keep only the columns needed downstream before combining historical and forecasted data
+    if columns is not None:
+        historical_df = historical_df[[column for column in columns if column in historical_df.columns]]
+        forecast_df = forecast_df[[column for column in columns if column in forecast_df.columns]]
     combined_df = pd.concat([historical_df, forecast_df])
 
     return combined_df
 
 
-def perform_dcf_analysis(df, balance_sheet_df, financial_data, discount_rate, perpetual_growth_rate, num_years_historicals):
+@timed("dcf")
+def perform_dcf_analysis(df, balance_sheet_df, financial_data, discount_rate, perpetual_growth_rate, num_years_historicals,
+                         convention="end", as_of=None):
     """
     Perform a Discounted Cash Flow (DCF) analysis on the provided financial data.
 
@@ -185,6 +253,9 @@ def perform_dcf_analysis(df, balance_sheet_df, financial_data, discount_rate, pe
     df (DataFrame): The financial data.
     discount_rate (float): The weighted average cost of capital (WACC).
     perpetual_growth_rate (float): The perpetual growth rate for terminal value calculation.
+    convention (str): The discounting convention: 'end' (default), 'mid_year' or 'actual_365'.
+    as_of (str, optional): A 'YYYY-MM-DD' fiscal date; net debt is then taken from the latest balance sheet
+        on or before it instead of the latest one, for point-in-time valuations.
 
     Returns:
     float: The per-share value of the company.
@@ -192,32 +263,69 @@ def perform_dcf_analysis(df, balance_sheet_df, financial_data, discount_rate, pe
     # Ensure dataframe is sorted by fiscalDateEnding in ascending order
     df = df.sort_values(by='fiscalDateEnding')
 
-    # Initialize variables
-    total_present_value_of_fcfs = 0
-    terminal_value = 0
-
     # Calculate Free Cash Flows (FCF)
     df_with_fcf = calculate_free_cash_flow(df)
 
     # Discount Future FCFs and Calculate Present Value
-    df_with_pv_fcf = discount_cash_flows(df_with_fcf, discount_rate, num_years_historicals)
+    df_with_pv_fcf = discount_cash_flows(df_with_fcf, discount_rate, num_years_historicals, convention)
+
+    return calculate_per_share_value(df_with_pv_fcf, balance_sheet_df, financial_data, discount_rate,
+                                     perpetual_growth_rate, as_of, convention)
 
-    for index, row in df_with_pv_fcf.iterrows():
-        total_present_value_of_fcfs = total_present_value_of_fcfs + row["Present Value of FCF"]
+
+def latest_balance_sheet_row(balance_sheet_df, as_of=None):
+    """
+    Return the latest balance sheet, optionally as it was known at a past fiscal date.
+
+    Args:
+    balance_sheet_df (DataFrame): Balance sheet data with the latest fiscal year in the first row.
+    as_of (str, optional): A 'YYYY-MM-DD' fiscal date; only balance sheets on or before it are considered.
+
+    Returns:
+    Series: The balance sheet row.
+    """
+    if as_of is None:
+        return balance_sheet_df.iloc[0]
+    available = balance_sheet_df[balance_sheet_df['fiscalDateEnding'] <= as_of]
+    if available.empty:
+        raise ValueError(f"No balance sheet on or before {as_of}")
+    return available.sort_values(by='fiscalDateEnding').iloc[-1]
+
+
+def calculate_per_share_value(df_with_pv_fcf, balance_sheet_df, financial_data, discount_rate, perpetual_growth_rate,
+                              as_of=None, convention="end"):
+    """
+    Calculate the per-share value from discounted forecast cash flows.
+
+    Args:
+    df_with_pv_fcf (DataFrame): Forecast rows from discount_cash_flows, with 'Free Cash Flow',
+        'Present Value of FCF' and 'Years in Future' columns.
+    balance_sheet_df (DataFrame): Balance sheet data with the latest fiscal year in the first row.
+    financial_data (dict): The fetched financial data, including 'shares_outstanding'.
+    discount_rate (float): The weighted average cost of capital (WACC).
+    perpetual_growth_rate (float): The perpetual growth rate for terminal value calculation.
+    as_of (str, optional): A 'YYYY-MM-DD' fiscal date; see latest_balance_sheet_row.
+    convention (str): The discounting convention of df_with_pv_fcf; the terminal value is always discounted
+        from the end of the last forecast year.
+
+    Returns:
+    float: The per-share value of the company.
+    """
+    total_present_value_of_fcfs = df_with_pv_fcf["Present Value of FCF"].sum()
 
     # Calculate Terminal Value at the end of the projection period
     last_fcf = df_with_pv_fcf['Free Cash Flow'].iloc[-1]
     terminal_value = calculate_terminal_value(last_fcf, perpetual_growth_rate, discount_rate)
 
-    # Discount the Terminal Value back to its present value
-    years_in_future = df_with_pv_fcf['Years in Future'].iloc[-1]
+    # Discount the Terminal Value back to its present value from the end of the last forecast year
+    years_in_future = terminal_periods(df_with_pv_fcf['Years in Future'].to_numpy(dtype=float), convention)
     present_value_of_terminal_value = terminal_value / ((1 + discount_rate) ** years_in_future)
 
     # Calculate Total Enterprise Value
     total_enterprise_value = total_present_value_of_fcfs + present_value_of_terminal_value
 
     # Retrieving latest cash and net debt data for enterprise value adjustment
-    latest_balance_sheet = balance_sheet_df.iloc[0]  # Accessing the first row for latest data
+    latest_balance_sheet = latest_balance_sheet_row(balance_sheet_df, as_of)  # The first row unless as_of is given
     total_debt = float(latest_balance_sheet['totalLiabilities'])
     cash_and_equivalents = float(latest_balance_sheet[
         'cashAndCashEquivalentsAtCarryingValue'])
@@ -230,17 +338,17 @@ def perform_dcf_analysis(df, balance_sheet_df, financial_data, discount_rate, pe
     equity_value, per_share_value = calculate_equity_and_per_share_value(adjusted_enterprise_value, total_debt,
                                                                          shares_outstanding)
 
-    ### SANITY CHEKC PRINTING ###
-
-    print("last fcf ", last_fcf)
-    print("terminal value ", terminal_value)
-    print("present value of terminal value ", present_value_of_terminal_value)
-    print("total pvalue of fcfs ", total_present_value_of_fcfs)
-    print("pv of terminal value ", present_value_of_terminal_value)
-    print("total debt ", total_debt)
-    print("cash and cash equivalents ", cash_and_equivalents)
-    print("adjusted enterprise value ", adjusted_enterprise_value)
-    print()
+    # Sanity check values, only serialized when debug logging is enabled
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("dcf sanity check %s", json.dumps({
+            "last_fcf": float(last_fcf),
+            "terminal_value": float(terminal_value),
+            "present_value_of_terminal_value": float(present_value_of_terminal_value),
+            "total_present_value_of_fcfs": float(total_present_value_of_fcfs),
+            "total_debt": total_debt,
+            "cash_and_equivalents": cash_and_equivalents,
+            "adjusted_enterprise_value": float(adjusted_enterprise_value),
+        }))
 
     # Return the per-share value
     return per_share_value
@@ -248,48 +356,114 @@ def perform_dcf_analysis(df, balance_sheet_df, financial_data, discount_rate, pe
 
 
 
-def main():
-    load_dotenv()
-    api_key = os.getenv("ALPHAVANTAGE_API_KEY") # Your API key
-    ticker = 'AAPL'  # Replace with your target company's ticker
-    time_period = 10
-    first_year = 2024
+def value_from_forecasts(financial_data, historical_df, num_years_historicals, forecasts):
+    """
+    Run the DCF analysis of a ticker from its model forecasts.
+
+    Args:
+    financial_data (dict): Financial data as returned by fetch_financial_data.
+    historical_df (DataFrame): Year-indexed historical financials from extract_detailed_financials_frame.
+    num_years_historicals (int): The number of historical years.
+    forecasts (dict): The ticker's forecasts as returned by run_forecasts.
 
-    financial_data = fetch_financial_data(ticker, api_key)
-    detailed_financials, num_years_historicals = extract_detailed_financials(financial_data["income_statement"], financial_data["balance_sheet"], financial_data["cash_flow"])
+    Returns:
+    float: The per-share value of the company.
+    """
+    forecasted_df = setup_and_forecast_dataframe_llm(historical_df, forecasts["operating_cashflow_json"],
+                                                     forecasts["capital_expenditures_json"])
 
-    # Extract historical data
-    historical_df = pd.DataFrame(detailed_financials)
+    # Extract the balance sheet DataFrame for the Net Debt calculation
+    balance_sheet_df = pd.DataFrame(financial_data["balance_sheet"])
 
-    # Transpose and reverse the order of rows in the DataFrame
-    historical_df = historical_df.T.iloc[::-1]
+    return perform_dcf_analysis(forecasted_df, balance_sheet_df, financial_data,
+                                discount_rate=forecasts["discount_rate"],
+                                perpetual_growth_rate=forecasts["perpetual_growth_rate"],
+                                num_years_historicals=num_years_historicals)
 
-    # Extracting historical values to pass them to Gemini Ultra for more accurate future predictions
-    operating_cashflow_historicals, capex_historicals = extract_historicals(historical_df)
 
-    # Gemini CapEx estimation
-    capital_expenditures_json_string = predict_capex(ticker, time_period, first_year, capex_historicals)
+def value_ticker(ticker, api_key, time_period=10, first_year=2024, store=None, bypass_cache=False, forecaster=None,
+                 discount_rate=None, perpetual_growth_rate=None):
+    """
+    Fetch, forecast and value a single ticker.
 
-    # Gemini Operating cash flow estimation
-    operating_cashflow_json_string = predict_opcf(ticker, time_period, first_year, operating_cashflow_historicals)
+    By default the model forecasts the cash flows and both rates. A local forecaster such as a
+    StatisticalForecaster replaces the cash flow calls, and given rates replace the rate calls, so with all
+    three the valuation runs without any model request.
 
-    # Estimating our discount rate with Gemini
-    discount_rate = float(predict_dcrate(ticker, time_period))
-    perp_growth_rate = float(predict_perpgrowthrate(ticker, time_period))
+    Args:
+    ticker (str): The stock ticker symbol.
+    api_key (str): The Alpha Vantage API key.
+    time_period (int): The number of forecast years.
+    first_year (int): The first forecast year.
+    store (FundamentalsStore, optional): The fundamentals store to read from and write to.
+    bypass_cache (bool): Whether to skip the model response cache.
+    forecaster (callable, optional): Called with (ticker, historical_df, time_period, first_year); returns the
+        operating cash flow and capital expenditures forecasts as JSON strings.
+    discount_rate (float, optional): The discount rate to use instead of the model's.
+    perpetual_growth_rate (float, optional): The perpetual growth rate to use instead of the model's.
 
-    print("Discount Rate: ", discount_rate)
-    print("Perpetual Growth Rate: ", perp_growth_rate)
+    Returns:
+    dict: The 'per_share_value' and the 'discount_rate' and 'perpetual_growth_rate' used.
+    """
+    financial_data = fetch_financial_data(ticker, api_key, store)
+    if financial_data is None:
+        raise ValueError(f"No financial data available for {ticker}")
 
-    forecasted_df = setup_and_forecast_dataframe_llm(historical_df, operating_cashflow_json_string, capital_expenditures_json_string)
+    # Extract historical data, indexed by fiscal year in ascending order
+    historical_df, num_years_historicals = extract_detailed_financials_frame(financial_data["income_statement"], financial_data["balance_sheet"], financial_data["cash_flow"])
 
-    # Extract the balance sheet DataFrame for the Net Debt calculation
-    balance_sheet_df = pd.DataFrame(financial_data["balance_sheet"])
+    # Extracting historical values to pass them to Gemini Ultra for more accurate future predictions
+    operating_cashflow_historicals, capex_historicals = extract_historicals(historical_df)
+
+    cashflow_forecasts = None
+    if forecaster is not None:
+        operating_cashflow_json, capital_expenditures_json = forecaster(ticker, historical_df, time_period, first_year)
+        cashflow_forecasts = {ticker: {"operating_cashflow_json": operating_cashflow_json,
+                                       "capital_expenditures_json": capital_expenditures_json}}
+    rates = None
+    if discount_rate is not None and perpetual_growth_rate is not None:
+        rates = (discount_rate, perpetual_growth_rate)
+
+    if cashflow_forecasts is not None and rates is not None:
+        forecasts = dict(cashflow_forecasts[ticker], discount_rate=float(discount_rate),
+                         perpetual_growth_rate=float(perpetual_growth_rate))
+    else:
+        # Gemini CapEx, operating cash flow, discount rate and perpetual growth rate estimation, run concurrently
+        forecasts = run_forecasts([(ticker, operating_cashflow_historicals, capex_historicals)], time_period, first_year,
+                                  bypass_cache=bypass_cache, cashflow_forecasts=cashflow_forecasts, rates=rates)[ticker]
+        if isinstance(forecasts, Exception):
+            raise forecasts
+        if discount_rate is not None:
+            forecasts["discount_rate"] = float(discount_rate)
+        if perpetual_growth_rate is not None:
+            forecasts["perpetual_growth_rate"] = float(perpetual_growth_rate)
+
+    return {
+        "per_share_value": value_from_forecasts(financial_data, historical_df, num_years_historicals, forecasts),
+        "discount_rate": forecasts["discount_rate"],
+        "perpetual_growth_rate": forecasts["perpetual_growth_rate"],
+    }
+
+
+def main():
+    load_dotenv()
+    logging.basicConfig(level=os.getenv("AUTODCF_LOG_LEVEL", "WARNING"))
+    api_key = os.getenv("ALPHAVANTAGE_API_KEY") # Your API key
+    ticker = 'AAPL'  # Replace with your target company's ticker; use batch_runner.py for many tickers
+    time_period = 10
+    first_year = 2024
+
+    valuation = value_ticker(ticker, api_key, time_period, first_year)
 
-    per_share_value = perform_dcf_analysis(forecasted_df, balance_sheet_df, financial_data,
-                                           discount_rate=discount_rate, perpetual_growth_rate=perp_growth_rate,
-                                           num_years_historicals = num_years_historicals)
+    print("Discount Rate: ", valuation["discount_rate"])
+    print("Perpetual Growth Rate: ", valuation["perpetual_growth_rate"])
+    print(f"---------- PER SHARE VALUE: {valuation['per_share_value']} -----------------")
 
-    print(f"---------- PER SHARE VALUE: {per_share_value} -----------------")
+    # Optionally export the stage timings and counters of this run
+    metrics_path = os.getenv("AUTODCF_METRICS_FILE")
+    if metrics_path:
+        with open(metrics_path, "a") as file:
+            file.write(get_registry().to_json_lines())
 
 
 if __name__ == "__main__":
@@ -0,0 +1,267 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from fundamentals_store import TEXT_COLUMNS
+from main import extract_detailed_financials_frame, setup_and_forecast_dataframe_llm, perform_dcf_analysis
+from support_functions import to_float_array
+from valuation_graph import llm_cashflow_forecaster
+
+STATEMENTS = ("income_statement", "balance_sheet", "cash_flow")
+DEFAULT_SHARDS_PER_WORKER = 4
+
+# Per-process state of the pool workers, set by _attach_fundamentals
+_worker_state = None
+
+
+def _string_array(values):
+    try:
+        return pa.array(values, type=pa.string())
+    except (pa.ArrowTypeError, pa.ArrowInvalid):
+        return pa.array([None if value is None else str(value) for value in values], type=pa.string())
+
+
+def _float_block(df, positions):
+    # Numeric fields of a statement as float64, with the to_float rules unless they are typed already
+    block = df.iloc[:, positions]
+    if all(dtype.kind in "fiu" for dtype in block.dtypes):
+        return block.to_numpy(dtype=np.float64)
+    return to_float_array(block.to_numpy(dtype=object))
+
+
+def pack_fundamentals(financial_data):
+    """
+    Pack the statements of many tickers into Arrow IPC buffers.
+
+    Each statement becomes a single table with the union of all tickers' columns, where the rows of a
+    ticker are contiguous. fiscalDateEnding and reportedCurrency are string columns and every other field is
+    a float64 column, converted with the to_float rules like the fundamentals store does. The layout records
+    each ticker's row range, its own column list and its shares outstanding, so the DataFrames can be
+    rebuilt from slices of the buffers. Slicing a ticker's rows out of a table is zero-copy; converting the
+    slice to a DataFrame copies its numeric columns as whole arrays and only its text cells one by one.
+
+    Args:
+    financial_data (dict): Financial data as returned by fetch_financial_data, keyed by ticker.
+
+    Returns:
+    tuple: One Arrow IPC file buffer per statement, and the layout dict.
+    """
+    tickers = list(financial_data)
+    layout = {"tickers": tickers, "column_sets": [],
+              "shares_outstanding": np.array([financial_data[ticker]["shares_outstanding"] for ticker in tickers],
+                                             dtype=np.int64)}
+    column_set_ids = {}
+    buffers = []
+    for statement in STATEMENTS:
+        frames = [financial_data[ticker][statement] for ticker in tickers]
+        lengths = np.array([len(df) for df in frames], dtype=np.int64)
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+
+        union_columns = list(dict.fromkeys(column for df in frames for column in df.columns))
+        text_columns = [column for column in union_columns if column in TEXT_COLUMNS]
+        numeric_columns = [column for column in union_columns if column not in TEXT_COLUMNS]
+        text_positions = {column: position for position, column in enumerate(text_columns)}
+        numeric_positions = {column: position for position, column in enumerate(numeric_columns)}
+        texts = np.full((offsets[-1], len(text_columns)), None, dtype=object)
+        numbers = np.full((offsets[-1], len(numeric_columns)), np.nan)
+        ticker_column_sets = np.empty(len(tickers), dtype=np.int64)
+        tickers_by_columns = {}
+        for index, df in enumerate(frames):
+            columns = tuple(df.columns)
+            if columns not in column_set_ids:
+                column_set_ids[columns] = len(layout["column_sets"])
+                layout["column_sets"].append(list(columns))
+            ticker_column_sets[index] = column_set_ids[columns]
+            tickers_by_columns.setdefault(columns, []).append(index)
+
+        # Tickers sharing a column list are converted together, usually the whole universe in one pass
+        for columns, indices in tickers_by_columns.items():
+            if not columns:
+                continue
+            rows = np.concatenate([np.arange(offsets[index], offsets[index + 1]) for index in indices])
+            df = pd.concat([frames[index] for index in indices], ignore_index=True, copy=False)
+            text_sources = [position for position, column in enumerate(columns) if column in text_positions]
+            numeric_sources = [position for position, column in enumerate(columns) if column in numeric_positions]
+            if text_sources:
+                texts[np.ix_(rows, [text_positions[columns[position]] for position in text_sources])] = \
+                    df.iloc[:, text_sources].to_numpy(dtype=object)
+            if numeric_sources:
+                numbers[np.ix_(rows, [numeric_positions[columns[position]] for position in numeric_sources])] = \
+                    _float_block(df, numeric_sources)
+
+        layout[statement] = {"offsets": offsets, "column_sets": ticker_column_sets}
+        arrays = {column: _string_array(texts[:, position]) for column, position in text_positions.items()}
+        arrays.update((column, pa.array(numbers[:, position], type=pa.float64()))
+                      for column, position in numeric_positions.items())
+        table = pa.table([arrays[column] for column in union_columns], names=union_columns)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        buffers.append(sink.getvalue())
+    return buffers, layout
+
+
+class _FundamentalsView:
+    # Rebuilds a ticker's financial data from the shared Arrow buffer
+
+    def __init__(self, buffer, layout):
+        self.layout = layout
+        self.tables = {}
+        for statement in STATEMENTS:
+            start, size = layout[statement]["buffer"]
+            self.tables[statement] = pa.ipc.open_file(buffer.slice(start, size)).read_all()
+
+    def shard_financial_data(self, positions):
+        # Converts the shard's contiguous rows to pandas once per statement, then slices out each ticker
+        frames = {}
+        for statement in STATEMENTS:
+            offsets = self.layout[statement]["offsets"]
+            frames[statement] = self.tables[statement].slice(
+                offsets[positions.start], offsets[positions.stop] - offsets[positions.start]).to_pandas()
+
+        for position in positions:
+            financial_data = {}
+            for statement in STATEMENTS:
+                statement_layout = self.layout[statement]
+                first_row = statement_layout["offsets"][positions.start]
+                start, end = statement_layout["offsets"][position], statement_layout["offsets"][position + 1]
+                columns = self.layout["column_sets"][statement_layout["column_sets"][position]]
+                df = frames[statement].iloc[start - first_row:end - first_row]
+                if len(columns) != df.shape[1]:
+                    df = df[columns]
+                financial_data[statement] = df.reset_index(drop=True)
+            financial_data["shares_outstanding"] = int(self.layout["shares_outstanding"][position])
+            yield position, financial_data
+
+
+def _pool_context():
+    # Workers must not inherit the parent's open SQLite connections (the default fundamentals store and model
+    # response cache) or model client, so they are not forked from it. A fork server imports this module once
+    # without opening any of them and forks the workers from there; 'spawn' is the portable fallback.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def _attach_fundamentals(shared_memory_name, layout, forecaster):
+    global _worker_state
+    block = shared_memory.SharedMemory(name=shared_memory_name)
+    view = _FundamentalsView(pa.py_buffer(block.buf), layout)
+    _worker_state = {"block": block, "view": view, "forecaster": forecaster}
+
+
+def value_financial_data(ticker, financial_data, discount_rate, perpetual_growth_rate, forecaster, time_period,
+                         first_year):
+    """
+    Run extraction, forecasting and the DCF analysis of one ticker, as main() does.
+
+    Args:
+    ticker (str): The stock ticker symbol.
+    financial_data (dict): Financial data as returned by fetch_financial_data.
+    discount_rate (float): The weighted average cost of capital (WACC).
+    perpetual_growth_rate (float): The perpetual growth rate for terminal value calculation.
+    forecaster (callable): Called with (ticker, historical_df, time_period, first_year); returns the
+        operating cash flow and capital expenditures forecasts as JSON strings.
+    time_period (int): The number of forecast years.
+    first_year (int): The first forecast year.
+
+    Returns:
+    float: The per-share value of the company.
+    """
+    historical_df, num_years_historicals = extract_detailed_financials_frame(
+        financial_data["income_statement"], financial_data["balance_sheet"], financial_data["cash_flow"])
+    operating_cashflow_json, capital_expenditures_json = forecaster(ticker, historical_df, time_period, first_year)
+    forecasted_df = setup_and_forecast_dataframe_llm(historical_df, operating_cashflow_json, capital_expenditures_json)
+    return perform_dcf_analysis(forecasted_df, financial_data["balance_sheet"], financial_data, discount_rate,
+                                perpetual_growth_rate, num_years_historicals)
+
+
+def _value_shard(positions, discount_rates, perpetual_growth_rates, time_period, first_year):
+    view, forecaster = _worker_state["view"], _worker_state["forecaster"]
+    results = []
+    for (position, financial_data), discount_rate, perpetual_growth_rate in zip(
+            view.shard_financial_data(positions), discount_rates, perpetual_growth_rates):
+        try:
+            results.append(float(value_financial_data(view.layout["tickers"][position], financial_data, discount_rate,
+                                                      perpetual_growth_rate, forecaster, time_period, first_year)))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _per_ticker(values, tickers, name):
+    if isinstance(values, dict):
+        missing = [ticker for ticker in tickers if ticker not in values]
+        if missing:
+            raise ValueError(f"No {name} for {', '.join(missing[:5])}")
+        return [float(values[ticker]) for ticker in tickers]
+    return [float(values)] * len(tickers)
+
+
+def value_universe_parallel(financial_data, discount_rates, perpetual_growth_rates, forecaster=llm_cashflow_forecaster,
+                            time_period=10, first_year=2024, max_workers=None,
+                            shards_per_worker=DEFAULT_SHARDS_PER_WORKER):
+    """
+    Value many tickers on a process pool, sharing the fundamentals through shared memory.
+
+    The statements are packed once into Arrow buffers in a shared memory block. Each worker attaches to
+    the block when it starts, takes zero-copy Arrow slices of its tickers' rows and converts only those
+    slices to DataFrames with typed float64 columns. Only ticker positions, rates and results cross process
+    boundaries. Workers come from a fork server (or are spawned), so they do not inherit the caller's open
+    SQLite connections. The universe is split into contiguous shards, several per worker to balance uneven
+    shards, and results are merged in input order.
+
+    Args:
+    financial_data (dict): Financial data as returned by fetch_financial_data, keyed by ticker.
+    discount_rates (float or dict): The discount rate of every ticker, or one rate per ticker.
+    perpetual_growth_rates (float or dict): The perpetual growth rate of every ticker, or one rate per ticker.
+    forecaster (callable): A picklable module-level function called with (ticker, historical_df, time_period,
+        first_year) in the workers; returns the operating cash flow and capital expenditures forecasts as
+        JSON strings.
+    time_period (int): The number of forecast years.
+    first_year (int): The first forecast year.
+    max_workers (int, optional): The number of worker processes. Defaults to the number of CPUs.
+    shards_per_worker (int): The number of shards handed to each worker.
+
+    Returns:
+    dict: The per-share value of each ticker, or the exception that made it fail, in input order.
+    """
+    tickers = list(financial_data)
+    if not tickers:
+        return {}
+    discount_rates = _per_ticker(discount_rates, tickers, "discount rate")
+    perpetual_growth_rates = _per_ticker(perpetual_growth_rates, tickers, "perpetual growth rate")
+    max_workers = max_workers or os.cpu_count() or 1
+
+    buffers, layout = pack_fundamentals(financial_data)
+    block = shared_memory.SharedMemory(create=True, size=sum(buffer.size for buffer in buffers))
+    try:
+        start = 0
+        for statement, buffer in zip(STATEMENTS, buffers):
+            block.buf[start:start + buffer.size] = memoryview(buffer).cast("B")
+            layout[statement]["buffer"] = (start, buffer.size)
+            start += buffer.size
+        del buffers, buffer
+
+        num_shards = min(len(tickers), max_workers * shards_per_worker)
+        bounds = np.linspace(0, len(tickers), num_shards + 1).astype(int)
+        shards = [range(start, end) for start, end in zip(bounds[:-1], bounds[1:])]
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=_pool_context(), initializer=_attach_fundamentals,
+                                 initargs=(block.name, layout, forecaster)) as executor:
+            shard_results = executor.map(
+                _value_shard, shards, [discount_rates[shard.start:shard.stop] for shard in shards],
+                [perpetual_growth_rates[shard.start:shard.stop] for shard in shards],
+                [time_period] * len(shards), [first_year] * len(shards))
+            values = [value for shard_values in shard_results for value in shard_values]
+    finally:
+        block.close()
+        block.unlink()
+
+    return dict(zip(tickers, values))
@@ -0,0 +1,175 @@
+import numpy as np
+import pandas as pd
+
+from batch_valuation import forecast_free_cash_flows, extract_net_debt_inputs
+from support_functions import calculate_terminal_value
+from calculation_functions import adjust_for_net_debt
+from discounting import discount_periods, terminal_periods
+
+DEFAULT_PERCENTILES = (5, 10, 25, 50, 75, 90, 95)
+
+
+def extract_dcf_inputs(df, balance_sheet_df, financial_data, historical_years):
+    """
+    Collect the inputs of a single-ticker DCF that do not depend on the discount or growth rate.
+
+    Args:
+    df (DataFrame): The combined historical and forecast financial data.
+    balance_sheet_df (DataFrame): Balance sheet data with the latest fiscal year in the first row.
+    financial_data (dict): The fetched financial data, including 'shares_outstanding'.
+    historical_years (int): The number of years of historical data in df.
+
+    Returns:
+    dict: The forecast FCF vector, total debt, cash and cash equivalents and shares outstanding.
+    """
+    total_debt, cash_and_equivalents = extract_net_debt_inputs([balance_sheet_df])
+    return {
+        "fcf": forecast_free_cash_flows(df, historical_years),
+        "total_debt": total_debt[0],
+        "cash_and_equivalents": cash_and_equivalents[0],
+        "shares_outstanding": financial_data["shares_outstanding"],
+    }
+
+
+def scenario_per_share_values(fcf, discount_rates, growth_rates, total_debt, cash_and_equivalents,
+                              shares_outstanding, years_in_future=None, convention="end"):
+    """
+    Calculate the per-share value of one ticker for many (discount rate, growth rate) scenarios.
+
+    The rate arrays are broadcast against each other, so any shape of scenario set can be evaluated
+    without re-running the DataFrame pipeline. Discount factors are computed once per distinct discount
+    rate, e.g. once per grid row. Scenarios where the discount rate does not exceed the growth rate have
+    no Gordon terminal value and are returned as NaN.
+
+    Args:
+    fcf (ndarray): The forecast Free Cash Flows of the ticker.
+    discount_rates (float or ndarray): The discount rates (WACC) to evaluate.
+    growth_rates (float or ndarray): The perpetual growth rates to evaluate.
+    total_debt (float): The total debt of the company.
+    cash_and_equivalents (float): The cash and cash equivalents of the company.
+    shares_outstanding (int): The number of shares outstanding.
+    years_in_future (ndarray, optional): Years in future of each forecast FCF. Defaults to the periods of
+        convention.
+    convention (str): 'end' (0..T-1, as perform_dcf_analysis) or 'mid_year' (-0.5..T-1.5).
+
+    Returns:
+    ndarray: The per-share value of every scenario, in the broadcast shape of the rate arrays.
+    """
+    fcf = np.asarray(fcf, dtype=float)
+    discount_rates, growth_rates = np.broadcast_arrays(np.asarray(discount_rates, dtype=float),
+                                                       np.asarray(growth_rates, dtype=float))
+    if years_in_future is None:
+        years_in_future = discount_periods(len(fcf), convention)
+    years_in_future = np.asarray(years_in_future, dtype=float)
+
+    # Accumulate one forecast year at a time over the distinct discount rates, so memory stays
+    # proportional to the number of scenarios
+    unique_rates, rate_positions = np.unique(discount_rates, return_inverse=True)
+    growth = 1 + unique_rates
+    unique_present_values = np.zeros(unique_rates.shape)
+    for cash_flow, years in zip(fcf, years_in_future):
+        unique_present_values += cash_flow * growth ** -years
+    total_present_value_of_fcfs = unique_present_values[rate_positions].reshape(discount_rates.shape)
+    last_factor = (growth ** -terminal_periods(years_in_future, convention))[rate_positions].reshape(discount_rates.shape)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        terminal_value = calculate_terminal_value(fcf[-1], growth_rates, discount_rates)
+    terminal_value = np.where(discount_rates > growth_rates, terminal_value, np.nan)
+    present_value_of_terminal_value = terminal_value * last_factor
+
+    total_enterprise_value = total_present_value_of_fcfs + present_value_of_terminal_value
+    adjusted_enterprise_value = adjust_for_net_debt(total_enterprise_value, total_debt, cash_and_equivalents)
+    equity_value = adjusted_enterprise_value - total_debt
+    if not shares_outstanding:
+        return np.where(np.isnan(equity_value), np.nan, 0.0)
+    return equity_value / shares_outstanding
+
+
+def summarize_values(values, percentiles=DEFAULT_PERCENTILES):
+    """
+    Summarize scenario per-share values as percentiles, ignoring invalid (NaN) scenarios.
+
+    Args:
+    values (ndarray): Per-share values of the evaluated scenarios.
+    percentiles (tuple): The percentiles to report.
+
+    Returns:
+    Series: The requested percentiles of the valid per-share values.
+    """
+    values = np.asarray(values, dtype=float).ravel()
+    valid = values[~np.isnan(values)]
+    if valid.size == 0:
+        return pd.Series(np.nan, index=list(percentiles), name="Per Share Value")
+    return pd.Series(np.percentile(valid, percentiles), index=list(percentiles), name="Per Share Value")
+
+
+def sensitivity_grid(fcf, discount_rates, growth_rates, total_debt, cash_and_equivalents, shares_outstanding,
+                     years_in_future=None, percentiles=DEFAULT_PERCENTILES, convention="end"):
+    """
+    Evaluate the per-share value over a full discount rate x perpetual growth rate grid.
+
+    Args:
+    fcf (ndarray): The forecast Free Cash Flows of the ticker.
+    discount_rates (list): The discount rates forming the rows of the grid.
+    growth_rates (list): The perpetual growth rates forming the columns of the grid.
+    total_debt (float): The total debt of the company.
+    cash_and_equivalents (float): The cash and cash equivalents of the company.
+    shares_outstanding (int): The number of shares outstanding.
+    years_in_future (ndarray, optional): Years in future of each forecast FCF. Defaults to the periods of
+        convention.
+    percentiles (tuple): The percentiles to report over the grid.
+    convention (str): 'end' (0..T-1, as perform_dcf_analysis) or 'mid_year' (-0.5..T-1.5).
+
+    Returns:
+    dict: The 'surface' DataFrame of per-share values and the 'percentiles' over all valid grid points.
+    """
+    discount_rates = np.asarray(discount_rates, dtype=float)
+    growth_rates = np.asarray(growth_rates, dtype=float)
+    values = scenario_per_share_values(fcf, discount_rates[:, None], growth_rates[None, :], total_debt,
+                                       cash_and_equivalents, shares_outstanding, years_in_future, convention)
+    surface = pd.DataFrame(values, index=pd.Index(discount_rates, name="Discount Rate"),
+                           columns=pd.Index(growth_rates, name="Perpetual Growth Rate"))
+    return {"surface": surface, "percentiles": summarize_values(values, percentiles)}
+
+
+def monte_carlo_valuation(fcf, discount_rate_mean, discount_rate_std, growth_rate_mean, growth_rate_std,
+                          total_debt, cash_and_equivalents, shares_outstanding, num_scenarios=100_000,
+                          years_in_future=None, percentiles=DEFAULT_PERCENTILES, seed=None, convention="end"):
+    """
+    Value a ticker under randomly sampled discount and perpetual growth rates.
+
+    Both rates are drawn from independent normal distributions. Scenarios where the sampled discount
+    rate does not exceed the sampled growth rate are counted as invalid and excluded from the percentiles.
+
+    Args:
+    fcf (ndarray): The forecast Free Cash Flows of the ticker.
+    discount_rate_mean (float): The mean of the sampled discount rates, e.g. from predict_dcrate.
+    discount_rate_std (float): The standard deviation of the sampled discount rates.
+    growth_rate_mean (float): The mean of the sampled growth rates, e.g. from predict_perpgrowthrate.
+    growth_rate_std (float): The standard deviation of the sampled growth rates.
+    total_debt (float): The total debt of the company.
+    cash_and_equivalents (float): The cash and cash equivalents of the company.
+    shares_outstanding (int): The number of shares outstanding.
+    num_scenarios (int): The number of scenarios to sample.
+    years_in_future (ndarray, optional): Years in future of each forecast FCF. Defaults to the periods of
+        convention.
+    percentiles (tuple): The percentiles to report.
+    seed (int, optional): Seed for the random number generator.
+    convention (str): 'end' (0..T-1, as perform_dcf_analysis) or 'mid_year' (-0.5..T-1.5).
+
+    Returns:
+    dict: The 'percentiles' of the valid per-share values, the number of 'invalid_scenarios', and the sampled
+    'discount_rates', 'growth_rates' and 'per_share_values' of every scenario.
+    """
+    rng = np.random.default_rng(seed)
+    discount_rates = rng.normal(discount_rate_mean, discount_rate_std, num_scenarios)
+    growth_rates = rng.normal(growth_rate_mean, growth_rate_std, num_scenarios)
+    values = scenario_per_share_values(fcf, discount_rates, growth_rates, total_debt, cash_and_equivalents,
+                                       shares_outstanding, years_in_future, convention)
+    return {
+        "percentiles": summarize_values(values, percentiles),
+        "invalid_scenarios": int(np.isnan(values).sum()),
+        "discount_rates": discount_rates,
+        "growth_rates": growth_rates,
+        "per_share_values": values,
+    }
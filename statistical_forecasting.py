@@ -0,0 +1,101 @@
+import numpy as np
+
+from calculation_functions import (calculate_average_growth_rate, calculate_cagr, calculate_regression_growth_rate,
+                                   project_future_values, project_mean_reverting_values)
+from llm_parsing import forecast_to_json
+
+GROWTH_METHODS = {
+    "average": calculate_average_growth_rate,
+    "cagr": calculate_cagr,
+    "regression": calculate_regression_growth_rate,
+}
+FORECAST_METHODS = (*GROWTH_METHODS, "mean_reverting")
+FORECAST_METRICS = ("operatingCashflow", "capitalExpenditures")
+
+
+class StatisticalForecaster:
+    """
+    Local cash flow forecaster that extrapolates the full historical series, without a model round trip.
+
+    Instances are drop-in replacements for llm_cashflow_forecaster: they are called with (ticker,
+    historical_df, time_period, first_year) and return the operating cash flow and capital expenditures
+    forecasts as the same JSON strings the model path feeds into setup_and_forecast_dataframe_llm.
+    Instances are picklable, so they also work with value_universe_parallel.
+    """
+
+    def __init__(self, method="regression", long_term_growth_rate=0.025, reversion_rate=0.3, min_growth_rate=-0.3,
+                 max_growth_rate=0.3):
+        """
+        Args:
+        method (str): 'average', 'cagr' or 'regression' to project a constant growth rate fitted with that
+            method, or 'mean_reverting' to start from the regression growth rate and revert it towards
+            long_term_growth_rate.
+        long_term_growth_rate (float): The growth rate mean-reverting projections converge to.
+        reversion_rate (float): The share of the gap to long_term_growth_rate closed each year.
+        min_growth_rate (float): Lower bound of the fitted growth rate.
+        max_growth_rate (float): Upper bound of the fitted growth rate.
+        """
+        if method not in FORECAST_METHODS:
+            raise ValueError(f"Unknown forecast method '{method}', expected one of {', '.join(FORECAST_METHODS)}")
+        self.method = method
+        self.long_term_growth_rate = long_term_growth_rate
+        self.reversion_rate = reversion_rate
+        self.min_growth_rate = min_growth_rate
+        self.max_growth_rate = max_growth_rate
+
+    def __repr__(self):
+        # Stable across processes, as it is part of ValuationGraph's forecast stage key
+        return (f"StatisticalForecaster(method={self.method!r}, long_term_growth_rate={self.long_term_growth_rate!r}, "
+                f"reversion_rate={self.reversion_rate!r}, min_growth_rate={self.min_growth_rate!r}, "
+                f"max_growth_rate={self.max_growth_rate!r})")
+
+    def growth_rate(self, values):
+        """
+        Fit the growth rate of a historical series.
+
+        Args:
+        values (list): Yearly historical values, oldest first; missing values may be None or NaN.
+
+        Returns:
+        float: The fitted growth rate, clipped to [min_growth_rate, max_growth_rate].
+        """
+        values = [None if value is None or not np.isfinite(value) else value for value in values]
+        growth_method = GROWTH_METHODS["regression" if self.method == "mean_reverting" else self.method]
+        return float(np.clip(growth_method(values), self.min_growth_rate, self.max_growth_rate))
+
+    def project(self, values, time_period):
+        """
+        Project a historical series forward from its latest valid value.
+
+        Args:
+        values (list): Yearly historical values, oldest first.
+        time_period (int): The number of forecast years.
+
+        Returns:
+        list: The projected values of the forecast years.
+        """
+        values = [float(value) for value in values]
+        valid_values = [value for value in values if np.isfinite(value)]
+        base_value = valid_values[-1] if valid_values else 0.0
+        growth_rate = self.growth_rate(values)
+        if self.method == "mean_reverting":
+            return project_mean_reverting_values(base_value, growth_rate, self.long_term_growth_rate, time_period,
+                                                 self.reversion_rate)
+        return project_future_values(base_value, growth_rate, time_period)
+
+    def __call__(self, ticker, historical_df, time_period, first_year):
+        """
+        Forecast operating cash flow and capital expenditures from their full history.
+
+        Args:
+        ticker (str): The stock ticker symbol.
+        historical_df (DataFrame): Year-indexed historical financials in ascending order.
+        time_period (int): The number of forecast years.
+        first_year (int): The first forecast year.
+
+        Returns:
+        tuple: The operating cash flow and capital expenditures forecasts as JSON strings.
+        """
+        years = [str(first_year + year) for year in range(time_period)]
+        return tuple(forecast_to_json(dict(zip(years, self.project(historical_df[metric].tolist(), time_period))))
+                     for metric in FORECAST_METRICS)
@@ -1,5 +1,8 @@
+import numpy as np
 import pandas as pd
 
+from discounting import discount_factors, discount_periods
+
 def extract_historicals(df):
     # Extract the last three rows of the dataframe
     last_three_rows = df.tail(3)
@@ -63,7 +66,7 @@ def calculate_free_cash_flow(df):
 
 import pandas as pd
 
-def discount_cash_flows(df, discount_rate, historical_years):
+def discount_cash_flows(df, discount_rate, historical_years, convention="end"):
     """
     Discount the future cash flows and calculate their present value.
 
@@ -71,27 +74,49 @@ def discount_cash_flows(df, discount_rate, historical_years):
     df (DataFrame): The financial data, including a 'Free Cash Flow' column.
     discount_rate (float): The discount rate (WACC).
     historical_years (int): The number of years of historical data in the DataFrame.
+    convention (str): The discounting convention of discount_periods: 'end' (default), 'mid_year' or
+        'actual_365'. All measure from the first forecast fiscal date.
 
     Returns:
     DataFrame: The DataFrame with an additional column for the present value of each cash flow and the actuals removed.
     """
-    # Extract the year from the fiscalDateEnding
-    df['Year'] = pd.to_datetime(df['fiscalDateEnding']).dt.year
-    base_year = df['Year'].iloc[historical_years]  # Adjust based on the actual number of historical years
-
-    # Calculate the number of years into the future for each cash flow
-    df['Years in Future'] = df['Year'] - (base_year)
+    # Extract the year from the 'YYYY-MM-DD' fiscalDateEnding without parsing full dates
+    fiscal_dates = df['fiscalDateEnding'].tolist()
+    years = np.array([int(fiscal_date[:4]) for fiscal_date in fiscal_dates])
+    base_year = years[historical_years]  # Adjust based on the actual number of historical years
+
+    # Calculate the discounting period of each future cash flow
+    forecast_years = years[historical_years:]
+    if convention == "end":
+        periods = forecast_years - base_year
+    else:
+        periods = discount_periods(len(forecast_years), convention, fiscal_dates=fiscal_dates[historical_years:])
+
+    # Remove the rows with historical data, and calculate the present value of each future cash flow with
+    # the cached discount factors
+    df = df.iloc[historical_years:]
+    if {'Year', 'Years in Future', 'Present Value of FCF'} & set(df.columns):
+        df = df.drop(columns=['Year', 'Years in Future', 'Present Value of FCF'], errors='ignore')
+    present_values = df['Free Cash Flow'].to_numpy(dtype=float) * discount_factors(discount_rate, periods)
+    return pd.concat([df, pd.DataFrame({'Year': forecast_years, 'Years in Future': periods,
+                                        'Present Value of FCF': present_values}, index=df.index)], axis=1)
 
-    # Calculate the present value of each future cash flow
-    df['Present Value of FCF'] = df.apply(
-        lambda row: row['Free Cash Flow'] / ((1 + discount_rate) ** row['Years in Future']), axis=1
-    )
 
+def shift_fiscal_date(fiscal_date, year):
+    """
+    Move a fiscal year end date to another year, keeping its month and day.
 
-    # Remove the rows with historical data
-    df = df.iloc[historical_years:]
+    Args:
+    fiscal_date (datetime): The fiscal year end date.
+    year (int): The target year.
 
-    return df
+    Returns:
+    datetime: The same month and day in the target year; February 29 becomes February 28 in non-leap years.
+    """
+    try:
+        return fiscal_date.replace(year=year)
+    except ValueError:
+        return fiscal_date.replace(year=year, day=28)
 
 
 def to_float(s):
@@ -99,14 +124,44 @@ def to_float(s):
     Convert a string to a float, removing any currency symbols and commas.
 
     Args:
-    s (str): The string to convert.
+    s (str or float): The string to convert; numbers, e.g. from the fundamentals store, are returned as floats.
 
     Returns:
     float or None: The converted float, or None if conversion is not possible.
     """
+    if isinstance(s, (int, float, np.number)):
+        return float(s)
     if s == "None":
         return 0
     try:
         return float(s.replace(',', '').replace('$', ''))
     except ValueError:
-        return None
\ No newline at end of file
+        return None
+
+
+def to_float_array(values):
+    """
+    Convert an array of strings (or numbers) to floats in one vectorized pass, with the same rules as to_float.
+
+    Args:
+    values (ndarray): The values to convert, of any shape.
+
+    Returns:
+    ndarray: A float array of the same shape, where "None" becomes 0 and unparsable values become NaN.
+    """
+    values = np.asarray(values, dtype=object)
+    if values.size == 0:
+        return np.empty(values.shape)
+    flat = values.ravel()
+    floats = np.array(pd.to_numeric(flat, errors='coerce'), dtype=float)
+
+    # Only cells that are not plain numbers (or numeric strings) go through "None" and the currency symbol
+    # and comma cleanup, so already-typed columns are never turned into strings
+    retry = np.flatnonzero(np.isnan(floats))
+    if len(retry):
+        text = flat[retry].astype(str)
+        cleaned = np.char.replace(np.char.replace(text, ',', ''), '$', '')
+        retried = np.array(pd.to_numeric(cleaned, errors='coerce'), dtype=float)
+        retried[text == "None"] = 0
+        floats[retry] = retried
+    return floats.reshape(values.shape)
@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from google_gemini import FakeLLMBackend, set_backend
+from instrumentation import MetricsRegistry, set_registry
+from llm_cache import LLMResponseCache, set_default_cache
+
+
+@pytest.fixture
+def registry():
+    registry = MetricsRegistry()
+    previous_registry = set_registry(registry)
+    yield registry
+    set_registry(previous_registry)
+
+
+@pytest.fixture
+def fake_backend():
+    """
+    Installs a FakeLLMBackend and an in-memory response cache for the duration of a test.
+    """
+    backend = FakeLLMBackend()
+    previous_backend = set_backend(backend)
+    previous_cache = set_default_cache(LLMResponseCache(":memory:"))
+    yield backend
+    set_backend(previous_backend)
+    set_default_cache(previous_cache)
@@ -0,0 +1,208 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+from async_fetch import TokenBucket, fetch_universe
+from fundamentals_store import FundamentalsStore
+
+
+class StubAlphaVantage:
+    """
+    Local stand-in for the Alpha Vantage query endpoint.
+
+    Every ticker has shares outstanding and one annual report per statement. Scripted responses, keyed by
+    (symbol, function), are served in order before the regular payload.
+    """
+
+    def __init__(self):
+        self.scripted = {}
+        self.requests = []
+
+    def script(self, symbol, function, *responses):
+        self.scripted.setdefault((symbol, function), []).extend(responses)
+
+    def count(self, symbol=None, function=None):
+        return sum(1 for _, request_symbol, request_function in self.requests
+                   if symbol in (None, request_symbol) and function in (None, request_function))
+
+    async def handle(self, request):
+        symbol, function = request.query["symbol"], request.query["function"]
+        self.requests.append((time.monotonic(), symbol, function))
+        scripted = self.scripted.get((symbol, function))
+        if scripted:
+            status, payload = scripted.pop(0)
+            return web.json_response(payload, status=status)
+        if function == "OVERVIEW":
+            return web.json_response({"Symbol": symbol, "SharesOutstanding": "1000"})
+        return web.json_response({"symbol": symbol, "annualReports": [
+            {"fiscalDateEnding": "2023-12-31", "reportedCurrency": "USD", "value": "200"},
+            {"fiscalDateEnding": "2022-12-31", "reportedCurrency": "USD", "value": "None"},
+        ]})
+
+
+async def _fetch(stub, tickers, store, **kwargs):
+    app = web.Application()
+    app.router.add_get("/query", stub.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    options = {"requests_per_minute": 60000, "burst": 100, "backoff_seconds": 0.01}
+    options.update(kwargs)
+    try:
+        return await fetch_universe(tickers, "demo", store=store, base_url=f"http://127.0.0.1:{port}/query",
+                                    **options)
+    finally:
+        await runner.cleanup()
+
+
+@pytest.fixture
+def store(tmp_path):
+    with FundamentalsStore(str(tmp_path / "fundamentals.sqlite")) as store:
+        yield store
+
+
+def test_token_bucket_spaces_requests_after_burst():
+    async def acquire_all():
+        bucket = TokenBucket(requests_per_minute=600, burst=2)
+        started_at = time.monotonic()
+        times = []
+        for _ in range(7):
+            await bucket.acquire()
+            times.append(time.monotonic() - started_at)
+        return times
+
+    times = asyncio.run(acquire_all())
+    assert times[1] < 0.05
+    # 10 requests per second once the two burst tokens are spent
+    assert times[-1] >= 0.45
+    assert times[-1] < 1.0
+
+
+def test_fetch_universe_respects_quota(store):
+    stub = StubAlphaVantage()
+    started_at = time.monotonic()
+    result = asyncio.run(_fetch(stub, ["AAA", "BBB"], store, requests_per_minute=1200, burst=4))
+    elapsed = time.monotonic() - started_at
+
+    assert sorted(result["fetched"]) == ["AAA", "BBB"]
+    assert stub.count() == 8
+    # 8 requests at 20 per second with a burst of 4
+    assert elapsed >= 0.18
+
+
+def test_fetch_universe_stores_statements(store):
+    result = asyncio.run(_fetch(StubAlphaVantage(), ["AAA"], store))
+
+    assert result == {"fetched": ["AAA"], "failed": {}}
+    financial_data = store.get("AAA")
+    assert financial_data["shares_outstanding"] == 1000
+    assert financial_data["cash_flow"]["value"].tolist() == [200.0, 0.0]
+    assert store.stale_tickers(["AAA", "BBB"]) == ["BBB"]
+
+
+def test_transient_errors_are_retried_with_backoff(store, registry):
+    stub = StubAlphaVantage()
+    stub.script("AAA", "INCOME_STATEMENT", (503, {}), (429, {}))
+    stub.script("AAA", "BALANCE_SHEET", (200, {"Note": "Thank you for using Alpha Vantage!"}))
+
+    result = asyncio.run(_fetch(stub, ["AAA"], store))
+
+    assert result["fetched"] == ["AAA"]
+    assert stub.count("AAA", "INCOME_STATEMENT") == 3
+    assert stub.count("AAA", "BALANCE_SHEET") == 2
+    assert registry.counter_value("fetch_retries", reason="ClientResponseError") == 2
+    assert registry.counter_value("fetch_retries", reason="RateLimitError") == 1
+
+
+def test_retries_give_up_after_max_retries(store):
+    stub = StubAlphaVantage()
+    stub.script("AAA", "CASH_FLOW", *[(500, {})] * 5)
+
+    result = asyncio.run(_fetch(stub, ["AAA"], store, max_retries=2))
+
+    assert result["fetched"] == []
+    assert isinstance(result["failed"]["AAA"], aiohttp.ClientResponseError)
+    assert stub.count("AAA", "CASH_FLOW") == 3
+    assert store.get("AAA") is None
+
+
+def test_client_errors_are_not_retried(store):
+    stub = StubAlphaVantage()
+    stub.script("AAA", "OVERVIEW", (404, {}))
+
+    result = asyncio.run(_fetch(stub, ["AAA"], store))
+
+    assert result["failed"]["AAA"].status == 404
+    assert stub.count("AAA", "OVERVIEW") == 1
+
+
+def test_partial_failures_keep_the_other_tickers(store):
+    stub = StubAlphaVantage()
+    stub.script("BAD", "OVERVIEW", (200, {"Error Message": "Invalid API call."}))
+    finished = {}
+
+    result = asyncio.run(_fetch(stub, ["AAA", "BAD", "CCC"], store,
+                                on_result=lambda ticker, data, error: finished.setdefault(ticker, error)))
+
+    assert sorted(result["fetched"]) == ["AAA", "CCC"]
+    assert list(result["failed"]) == ["BAD"]
+    assert isinstance(result["failed"]["BAD"], ValueError)
+    assert finished["AAA"] is None and isinstance(finished["BAD"], ValueError)
+    assert sorted(store.get_many()) == ["AAA", "CCC"]
+
+
+def test_store_write_failures_are_recorded(tmp_path):
+    class FailingStore(FundamentalsStore):
+        def put(self, ticker, financial_data, fetched_at=None):
+            if ticker == "BBB":
+                raise sqlite3.OperationalError("database is locked")
+            return super().put(ticker, financial_data, fetched_at)
+
+    finished = {}
+    with FailingStore(str(tmp_path / "fundamentals.sqlite")) as store:
+        result = asyncio.run(_fetch(StubAlphaVantage(), ["AAA", "BBB", "CCC"], store,
+                                    on_result=lambda ticker, data, error: finished.setdefault(ticker, error)))
+
+        assert sorted(result["fetched"]) == ["AAA", "CCC"]
+        assert isinstance(result["failed"]["BBB"], sqlite3.OperationalError)
+        assert isinstance(finished["BBB"], sqlite3.OperationalError)
+        assert sorted(store.get_many()) == ["AAA", "CCC"]
+
+
+def test_unknown_symbols_are_failures_and_keep_stored_data(store):
+    stub = StubAlphaVantage()
+    asyncio.run(_fetch(stub, ["AAA"], store))
+    for function in ("OVERVIEW", "INCOME_STATEMENT", "BALANCE_SHEET", "CASH_FLOW"):
+        stub.script("AAA", function, (200, {}))
+        stub.script("ZZZ", function, (200, {}))
+
+    result = asyncio.run(_fetch(stub, ["AAA", "ZZZ"], store, only_stale=False))
+
+    assert result["fetched"] == []
+    assert isinstance(result["failed"]["AAA"], LookupError)
+    assert isinstance(result["failed"]["ZZZ"], LookupError)
+    assert store.get("AAA")["shares_outstanding"] == 1000
+    assert store.get("ZZZ") is None
+
+
+def test_store_writes_run_off_the_event_loop_thread(tmp_path):
+    writer_threads = []
+
+    class RecordingStore(FundamentalsStore):
+        def put(self, ticker, financial_data, fetched_at=None):
+            writer_threads.append(threading.current_thread())
+            return super().put(ticker, financial_data, fetched_at)
+
+    with RecordingStore(str(tmp_path / "fundamentals.sqlite")) as store:
+        result = asyncio.run(_fetch(StubAlphaVantage(), ["AAA", "BBB"], store))
+
+    assert sorted(result["fetched"]) == ["AAA", "BBB"]
+    assert len(writer_threads) == 2
+    assert threading.main_thread() not in writer_threads
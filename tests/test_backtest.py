@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from backtest import backtest_valuations, compare_to_prices
+from benchmark_fixtures import make_financial_data
+
+
+def _valuations():
+    return pd.DataFrame({
+        "ticker": ["LIVE", "GONE"],
+        "as_of": ["2022-09-30", "2022-09-30"],
+        "fiscal_year": [2022, 2022],
+        "Per Share Value": [110.0, 55.0],
+    })
+
+
+def _prices():
+    dates = pd.date_range("2022-09-01", "2024-06-30", freq="D")
+    prices = pd.DataFrame({"LIVE": np.linspace(100.0, 200.0, len(dates)),
+                           "GONE": np.linspace(50.0, 40.0, len(dates))}, index=dates)
+    # GONE was delisted in the spring of 2023, long before the end of the price history
+    prices.loc[prices.index > "2023-03-31", "GONE"] = np.nan
+    return prices
+
+
+def test_prices_are_taken_once_the_statements_are_public():
+    prices = _prices()
+
+    compared = compare_to_prices(_valuations(), prices, holding_period_days=365, reporting_lag_days=60)
+
+    live = compared.set_index("ticker").loc["LIVE"]
+    assert live["price"] == prices.loc["2022-11-29", "LIVE"]
+    assert live["forward_price"] == prices.loc["2023-11-29", "LIVE"]
+
+
+def test_forward_prices_after_a_tickers_last_quote_are_missing():
+    compared = compare_to_prices(_valuations(), _prices(), holding_period_days=365, reporting_lag_days=60)
+
+    gone = compared.set_index("ticker").loc["GONE"]
+    assert np.isfinite(gone["price"])
+    assert np.isnan(gone["forward_price"])
+    assert np.isnan(gone["forward_return"])
+
+
+def test_missing_historical_share_counts_are_not_replaced_by_todays():
+    financial_data = make_financial_data(num_years=6)
+    balance_sheet = financial_data["balance_sheet"].copy()
+    balance_sheet["commonStockSharesOutstanding"] = ["5000000"] * 3 + ["None"] * 3
+    financial_data = dict(financial_data, balance_sheet=balance_sheet)
+
+    valuations, failures = backtest_valuations({"T": financial_data}, 0.09, 0.02, time_period=5)
+
+    assert not failures
+    assert valuations["fiscal_year"].tolist() == [2020, 2021, 2022, 2023]
+    # The three oldest fiscal years report no share count; "None" converts to 0, which is not a share count
+    assert np.isnan(valuations["shares_outstanding"].iloc[0])
+    assert np.isnan(valuations["Per Share Value"].iloc[0])
+    assert (valuations["shares_outstanding"].iloc[1:] == 5_000_000).all()
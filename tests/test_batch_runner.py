@@ -0,0 +1,41 @@
+import threading
+
+import pytest
+
+import batch_runner
+from batch_runner import Checkpoint, JSONLinesResultWriter, value_universe
+from benchmark_fixtures import make_universe
+from fundamentals_store import FundamentalsStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    with FundamentalsStore(str(tmp_path / "fundamentals.sqlite")) as store:
+        for ticker, financial_data in make_universe(4).items():
+            store.put(ticker, financial_data)
+        yield store
+
+
+def test_valuations_run_off_the_event_loop_thread(store, tmp_path, fake_backend, monkeypatch):
+    valuation_threads = []
+    value_from_forecasts = batch_runner.value_from_forecasts
+
+    def recording_value_from_forecasts(*args):
+        valuation_threads.append(threading.current_thread().name)
+        return value_from_forecasts(*args)
+
+    monkeypatch.setattr(batch_runner, "value_from_forecasts", recording_value_from_forecasts)
+    writer = JSONLinesResultWriter(str(tmp_path / "results.jsonl"))
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.jsonl"))
+    try:
+        summary = value_universe(list(store.get_many()), writer, checkpoint, store=store, fetch=False,
+                                 bypass_cache=True)
+    finally:
+        writer.close()
+        checkpoint.close()
+
+    assert summary["valued"] == 4 and not summary["failed"]
+    assert len(valuation_threads) == 4
+    assert all(name.startswith("valuation") for name in valuation_threads)
+    assert checkpoint.completed == {"T00000", "T00001", "T00002", "T00003"}
+    assert len((tmp_path / "results.jsonl").read_text().splitlines()) == 4
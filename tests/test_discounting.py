@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from batch_valuation import batch_dcf_valuation
+from discounting import discount_periods, terminal_periods
+from main import perform_dcf_analysis
+
+FISCAL_DATES = ["2021-12-31", "2022-12-31", "2023-12-31", "2024-12-31", "2025-12-31", "2026-12-31", "2027-12-31",
+                "2028-12-31"]
+HISTORICAL_YEARS = 3
+
+
+def _financials():
+    df = pd.DataFrame({
+        "fiscalDateEnding": FISCAL_DATES,
+        "operatingCashflow": [900.0, 950.0, 1000.0, 1050.0, 1100.0, 1150.0, 1200.0, 1250.0],
+        "capitalExpenditures": [300.0, 310.0, 320.0, 330.0, 340.0, 350.0, 360.0, 370.0],
+    })
+    balance_sheet_df = pd.DataFrame({"fiscalDateEnding": ["2023-12-31"], "totalLiabilities": [2000.0],
+                                     "cashAndCashEquivalentsAtCarryingValue": [500.0]})
+    return df, balance_sheet_df, {"shares_outstanding": 100}
+
+
+def _per_share_value(convention):
+    df, balance_sheet_df, financial_data = _financials()
+    return perform_dcf_analysis(df, balance_sheet_df, financial_data, 0.09, 0.02, HISTORICAL_YEARS, convention)
+
+
+def test_conventions_share_the_valuation_date():
+    fiscal_dates = FISCAL_DATES[HISTORICAL_YEARS:]
+
+    end = discount_periods(5, "end")
+    assert end.tolist() == [0, 1, 2, 3, 4]
+    assert (discount_periods(5, "mid_year") == end - 0.5).all()
+    # Only the last period spans a February 29 (in 2028), so it is one day longer than under 'end'
+    actual = discount_periods(5, "actual_365", fiscal_dates=fiscal_dates)
+    assert np.allclose(actual, end, atol=2 / 365)
+    assert terminal_periods(discount_periods(5, "mid_year"), "mid_year") == terminal_periods(end) == 4
+
+
+def test_mid_year_values_at_least_end_and_actual_matches_end():
+    end = _per_share_value("end")
+
+    assert _per_share_value("mid_year") >= end
+    assert _per_share_value("actual_365") == pytest.approx(end, rel=1e-3)
+
+
+def test_batch_valuation_discounts_the_terminal_value_from_the_end_of_the_horizon():
+    df, balance_sheet_df, financial_data = _financials()
+    fcf = (df["operatingCashflow"] - df["capitalExpenditures"]).to_numpy()[HISTORICAL_YEARS:]
+
+    for convention in ("end", "mid_year"):
+        batch = batch_dcf_valuation(fcf, 0.09, 0.02, 2000.0, 500.0, 100, convention=convention)
+        assert batch["Per Share Value"].iloc[0] == pytest.approx(_per_share_value(convention))
@@ -0,0 +1,102 @@
+import json
+import threading
+import time
+
+from forecast_orchestrator import ForecastTimeoutError, run_forecasts
+from google_gemini import FakeLLMBackend, set_backend
+
+HISTORICALS = json.dumps({"2021": 100, "2022": 110, "2023": 120})
+
+
+class TrackingBackend(FakeLLMBackend):
+    """
+    FakeLLMBackend that records the peak number of requests in flight and can slow down or garble answers.
+    """
+
+    def __init__(self, latency=0.0, slow_tickers=(), slow_latency=0.0, garble_batches=False):
+        super().__init__(latency=latency)
+        self.slow_tickers = slow_tickers
+        self.slow_latency = slow_latency
+        self.garble_batches = garble_batches
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._tracking_lock = threading.Lock()
+
+    def generate(self, prompt, generation_config):
+        with self._tracking_lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if any(f" {ticker} " in prompt for ticker in self.slow_tickers):
+                time.sleep(self.slow_latency)
+            response = super().generate(prompt, generation_config)
+            if self.garble_batches and "for each of the following tickers" in prompt:
+                return "Sorry, I cannot help with that."
+            return response
+        finally:
+            with self._tracking_lock:
+                self.in_flight -= 1
+
+
+def _jobs(count):
+    return [(f"T{index}", HISTORICALS, HISTORICALS) for index in range(count)]
+
+
+def test_calls_run_concurrently_up_to_the_cap(fake_backend):
+    # fake_backend provides the in-memory response cache and restores the previous backend afterwards
+    backend = TrackingBackend(latency=0.2)
+    set_backend(backend)
+
+    started_at = time.monotonic()
+    results = run_forecasts(_jobs(8), 5, 2024, max_concurrency=8, bypass_cache=True)
+    elapsed = time.monotonic() - started_at
+
+    assert not any(isinstance(forecasts, Exception) for forecasts in results.values())
+    assert backend.calls == 32
+    assert backend.max_in_flight == 8
+    # 32 calls of 0.2s take 6.4s one after another, and 0.8s in four waves of 8
+    assert elapsed < 2.0
+
+
+def test_results_are_streamed_and_parsed(fake_backend):
+    finished = []
+    results = run_forecasts(_jobs(3), 5, 2024, bypass_cache=True,
+                            on_result=lambda ticker, forecasts, error: finished.append((ticker, error)))
+
+    assert sorted(finished) == [("T0", None), ("T1", None), ("T2", None)]
+    forecasts = results["T0"]
+    assert forecasts["discount_rate"] == 0.08
+    assert forecasts["perpetual_growth_rate"] == 0.025
+    assert sorted(json.loads(forecasts["operating_cashflow_json"])) == ["2024", "2025", "2026", "2027", "2028"]
+
+
+def test_a_slow_call_only_fails_its_ticker(fake_backend):
+    set_backend(TrackingBackend(slow_tickers=("T1",), slow_latency=1.0))
+
+    results = run_forecasts(_jobs(3), 5, 2024, call_timeout=0.3, bypass_cache=True)
+
+    assert isinstance(results["T1"], ForecastTimeoutError)
+    assert not isinstance(results["T0"], Exception)
+    assert not isinstance(results["T2"], Exception)
+
+
+def test_fixed_rates_and_precomputed_cashflows_make_no_calls(fake_backend):
+    cashflows = {"operating_cashflow_json": "{}", "capital_expenditures_json": "{}"}
+
+    results = run_forecasts(_jobs(4), 5, 2024, rates=(0.09, 0.02),
+                            cashflow_forecasts={f"T{index}": cashflows for index in range(4)})
+
+    assert fake_backend.calls == 0
+    assert results["T3"] == dict(cashflows, discount_rate=0.09, perpetual_growth_rate=0.02)
+
+
+def test_batch_fallback_calls_get_their_own_timeout(fake_backend):
+    backend = TrackingBackend(latency=0.3, garble_batches=True)
+    set_backend(backend)
+
+    results = run_forecasts(_jobs(10), 5, 2024, max_concurrency=16, call_timeout=3, batch_size=10,
+                            bypass_cache=True)
+
+    assert not any(isinstance(forecasts, Exception) for forecasts in results.values())
+    # One batched request, then four calls per ticker
+    assert backend.calls == 41
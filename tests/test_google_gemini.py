@@ -0,0 +1,20 @@
+from google_gemini import predict_dcrate, predict_perpgrowthrate
+
+
+def test_unparsable_rates_are_not_cached(fake_backend, registry):
+    fake_backend.discount_rate = "I cannot provide financial advice."
+
+    assert predict_dcrate("AAA", 5) == "I cannot provide financial advice."
+    fake_backend.discount_rate = 0.09
+    assert predict_dcrate("AAA", 5) == "0.09"
+    assert predict_dcrate("AAA", 5) == "0.09"
+
+    assert fake_backend.calls == 2
+    assert registry.counter_value("llm_unusable_responses") == 1
+    assert registry.counter_value("llm_cache_hits") == 1
+
+
+def test_parsable_rates_are_cached(fake_backend):
+    assert predict_perpgrowthrate("AAA", 5) == predict_perpgrowthrate("AAA", 5) == "0.025"
+
+    assert fake_backend.calls == 1
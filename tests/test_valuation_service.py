@@ -0,0 +1,169 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError
+from urllib.request import urlopen
+
+import pytest
+
+from benchmark_fixtures import make_universe
+from fundamentals_store import FundamentalsStore
+from statistical_forecasting import StatisticalForecaster
+from valuation_service import ValuationError, ValuationService, make_server, parse_scenario
+
+TICKER = "T00000"
+
+
+class SlowForecaster:
+    """
+    StatisticalForecaster that takes a while and counts its calls, to make concurrent requests overlap.
+    """
+
+    def __init__(self, latency=0.2):
+        self.latency = latency
+        self.calls = 0
+        self._forecaster = StatisticalForecaster()
+        self._lock = threading.Lock()
+
+    def __call__(self, ticker, historical_df, time_period, first_year):
+        with self._lock:
+            self.calls += 1
+        time.sleep(self.latency)
+        return self._forecaster(ticker, historical_df, time_period, first_year)
+
+
+@pytest.fixture
+def store(tmp_path):
+    with FundamentalsStore(str(tmp_path / "fundamentals.sqlite")) as store:
+        for ticker, financial_data in make_universe(3).items():
+            store.put(ticker, financial_data)
+        yield store
+
+
+@pytest.fixture
+def forecaster():
+    return SlowForecaster()
+
+
+@pytest.fixture
+def service(store, forecaster, fake_backend, registry):
+    service = ValuationService(store, forecaster=forecaster, fetch=False)
+    yield service
+    service.close()
+
+
+def _concurrently(function, count=8):
+    with ThreadPoolExecutor(count) as executor:
+        return list(executor.map(lambda _: function(), range(count)))
+
+
+def test_concurrent_requests_share_one_valuation(service, forecaster, registry):
+    results = _concurrently(lambda: service.value(TICKER, discount_rate=0.09, perpetual_growth_rate=0.02))
+
+    assert len({result["per_share_value"] for result in results}) == 1
+    assert forecaster.calls == 1
+    assert registry.counter_value("service_fundamentals_loads") == 1
+    assert service.graph.computed["forecast"] == 1
+
+
+def test_concurrent_requests_share_one_rate_forecast(service, fake_backend):
+    fake_backend.latency = 0.2
+
+    results = _concurrently(lambda: service.value(TICKER))
+
+    assert fake_backend.calls == 2
+    assert {(result["discount_rate"], result["perpetual_growth_rate"]) for result in results} == {(0.08, 0.025)}
+
+
+def test_scenarios_reuse_the_forecast(service, forecaster):
+    values = [service.value(TICKER, discount_rate=discount_rate, perpetual_growth_rate=0.02)["per_share_value"]
+              for discount_rate in (0.08, 0.09, 0.10)]
+
+    assert forecaster.calls == 1
+    assert values[0] > values[1] > values[2]
+
+
+def test_rates_expire_with_the_store_ttl(store, forecaster, fake_backend):
+    service = ValuationService(store, forecaster=forecaster, fetch=False, bypass_cache=True)
+    try:
+        service.value(TICKER)
+        service.value(TICKER)
+        assert fake_backend.calls == 2
+
+        store.ttl_seconds = 0
+        service.value(TICKER)
+        assert fake_backend.calls == 4
+    finally:
+        service.close()
+
+
+@pytest.mark.parametrize("parameters", [
+    {"discount_rate": "0.02", "growth_rate": "0.03"},
+    {"discount_rate": "0.02", "perpetual_growth_rate": "0.02"},
+    {"discount_rate": "inf"},
+    {"growth_rate": "nan"},
+    {"time_period": "0"},
+    {"time_period": "51"},
+])
+def test_parse_scenario_rejects_meaningless_rates(parameters):
+    with pytest.raises(ValueError):
+        parse_scenario(parameters)
+
+
+def test_time_period_is_capped(service):
+    with pytest.raises(ValuationError):
+        service.value(TICKER, discount_rate=0.09, perpetual_growth_rate=0.02, time_period=10_000)
+    assert service.value(TICKER, discount_rate=0.09, perpetual_growth_rate=0.02, time_period=50)["time_period"] == 50
+
+
+def test_fundamentals_in_memory_are_limited(store, forecaster, fake_backend):
+    service = ValuationService(store, forecaster=forecaster, fetch=False, max_tickers=2)
+    try:
+        assert service.warm() == 3
+        assert list(service._fundamentals) == ["T00001", "T00002"]
+
+        service.fundamentals("T00001")
+        service.fundamentals("T00000")
+        assert list(service._fundamentals) == ["T00001", "T00000"]
+        assert service.health()["tickers_loaded"] == 2
+    finally:
+        service.close()
+
+
+def test_model_rates_must_leave_a_positive_spread(service, fake_backend):
+    fake_backend.discount_rate = 0.02
+
+    with pytest.raises(ValuationError):
+        service.value(TICKER)
+    assert service.value(TICKER, discount_rate=0.09)["discount_rate"] == 0.09
+
+
+def test_non_finite_values_are_errors(service, monkeypatch):
+    monkeypatch.setattr(service.graph, "revalue", lambda *args, **kwargs: float("inf"))
+
+    with pytest.raises(ValuationError):
+        service.value(TICKER, discount_rate=0.09, perpetual_growth_rate=0.02)
+
+
+def test_http_api(service):
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+    try:
+        result = json.load(urlopen(f"{base_url}/valuations/{TICKER.lower()}?discount_rate=0.09&growth_rate=0.02"))
+        assert result["ticker"] == TICKER
+        assert result["discount_rate"] == 0.09
+
+        for path, status in [("/valuations/NOPE", 404), (f"/valuations/{TICKER}?discount_rate=abc", 400),
+                             (f"/valuations/{TICKER}?discount_rate=0.02&growth_rate=0.03", 400),
+                             (f"/valuations/{TICKER}?discount_rate=0.02", 400),
+                             (f"/valuations/{TICKER}?time_period=100000", 400), ("/bogus", 404)]:
+            with pytest.raises(HTTPError) as error:
+                urlopen(base_url + path)
+            assert error.value.code == status
+
+        assert json.load(urlopen(f"{base_url}/health"))["status"] == "ok"
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import Future
+
+import pandas as pd
+
+from support_functions import calculate_free_cash_flow, discount_cash_flows, extract_historicals
+from google_gemini import predict_opcf, predict_capex
+from main import extract_detailed_financials_frame, setup_and_forecast_dataframe_llm, calculate_per_share_value
+
+DEFAULT_MAX_ENTRIES = 50_000
+
+
+def llm_cashflow_forecaster(ticker, historical_df, time_period, first_year):
+    """
+    Forecast operating cash flow and capital expenditures with the model, as main() does.
+
+    Args:
+    ticker (str): The stock ticker symbol.
+    historical_df (DataFrame): Year-indexed historical financials in ascending order.
+    time_period (int): The number of forecast years.
+    first_year (int): The first forecast year.
+
+    Returns:
+    tuple: The operating cash flow and capital expenditures forecasts as JSON strings.
+    """
+    operating_cashflow_historicals, capex_historicals = extract_historicals(historical_df)
+    return (predict_opcf(ticker, time_period, first_year, operating_cashflow_historicals),
+            predict_capex(ticker, time_period, first_year, capex_historicals))
+
+
+def hash_financial_data(financial_data):
+    """
+    Compute a content hash of fetched financial data.
+
+    Args:
+    financial_data (dict): The income statement, balance sheet and cash flow DataFrames and shares outstanding.
+
+    Returns:
+    str: A hex SHA-256 digest that changes whenever any statement cell or the share count changes.
+    """
+    digest = hashlib.sha256(str(financial_data["shares_outstanding"]).encode())
+    for statement in ("income_statement", "balance_sheet", "cash_flow"):
+        df = financial_data[statement]
+        digest.update(json.dumps([statement, list(df.columns)]).encode())
+        digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _node_key(stage, *inputs):
+    return hashlib.sha256(json.dumps([stage, *inputs], default=str).encode()).hexdigest()
+
+
+class ValuationGraph:
+    """
+    Memoized valuation pipeline: fundamentals -> detailed financials -> forecast -> FCF -> PV -> per-share value.
+
+    Every stage is keyed by a hash of its inputs, where upstream stages contribute their own keys. Changing
+    only the discount rate therefore re-runs just the discounting and terminal value stages, and changing only
+    the perpetual growth rate just the terminal value stage. Results are kept in a bounded LRU memo shared
+    by all tickers. Concurrent callers that need the same stage result while it is being computed wait for
+    that computation instead of repeating it.
+    """
+
+    def __init__(self, forecaster=llm_cashflow_forecaster, max_entries=DEFAULT_MAX_ENTRIES):
+        """
+        Args:
+        forecaster (callable): Called with (ticker, historical_df, time_period, first_year); returns the
+            operating cash flow and capital expenditures forecasts as JSON strings.
+        max_entries (int): The number of stage results kept in the memo.
+        """
+        self.forecaster = forecaster
+        self.max_entries = max_entries
+        self.computed = Counter()
+        self.reused = Counter()
+        self.coalesced = Counter()
+        self._memo = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.RLock()
+
+    def _node(self, stage, key, compute):
+        owner = False
+        with self._lock:
+            if key in self._memo:
+                self._memo.move_to_end(key)
+                self.reused[stage] += 1
+                return self._memo[key]
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                self.coalesced[stage] += 1
+            else:
+                in_flight = self._in_flight[key] = Future()
+                owner = True
+        if not owner:
+            return in_flight.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            with self._lock:
+                del self._in_flight[key]
+            in_flight.set_exception(e)
+            raise
+        with self._lock:
+            self._memo[key] = value
+            self.computed[stage] += 1
+            while len(self._memo) > self.max_entries:
+                self._memo.popitem(last=False)
+            del self._in_flight[key]
+        in_flight.set_result(value)
+        return value
+
+    def clear(self):
+        """
+        Drop every memoized stage result.
+        """
+        with self._lock:
+            self._memo.clear()
+
+    def revalue(self, ticker, financial_data, discount_rate, perpetual_growth_rate, time_period=10, first_year=2024,
+                fundamentals_key=None):
+        """
+        Value a ticker, re-running only the stages whose inputs changed since the last call.
+
+        Args:
+        ticker (str): The stock ticker symbol.
+        financial_data (dict): Financial data as returned by fetch_financial_data.
+        discount_rate (float): The weighted average cost of capital (WACC).
+        perpetual_growth_rate (float): The perpetual growth rate for terminal value calculation.
+        time_period (int): The number of forecast years.
+        first_year (int): The first forecast year.
+        fundamentals_key (str, optional): A precomputed identity of financial_data, e.g. a store version,
+            which skips hashing the statements.
+
+        Returns:
+        float: The per-share value of the company.
+        """
+        fundamentals_key = fundamentals_key or hash_financial_data(financial_data)
+
+        detailed_key = _node_key("detailed_financials", fundamentals_key)
+        historical_df, num_years_historicals = self._node(
+            "detailed_financials", detailed_key, lambda: self._detailed_financials(financial_data))
+
+        forecast_key = _node_key("forecast", detailed_key, ticker, time_period, first_year,
+                                 getattr(self.forecaster, "__name__", repr(self.forecaster)))
+        forecasted_df = self._node(
+            "forecast", forecast_key,
+            lambda: setup_and_forecast_dataframe_llm(historical_df,
+                                                     *self.forecaster(ticker, historical_df, time_period, first_year)))
+
+        fcf_key = _node_key("free_cash_flow", forecast_key)
+        df_with_fcf = self._node(
+            "free_cash_flow", fcf_key,
+            lambda: calculate_free_cash_flow(forecasted_df.sort_values(by='fiscalDateEnding')))
+
+        present_value_key = _node_key("present_value", fcf_key, discount_rate)
+        df_with_pv_fcf = self._node(
+            "present_value", present_value_key,
+            lambda: discount_cash_flows(df_with_fcf.copy(), discount_rate, num_years_historicals))
+
+        per_share_key = _node_key("per_share_value", present_value_key, fundamentals_key, perpetual_growth_rate)
+        return self._node(
+            "per_share_value", per_share_key,
+            lambda: calculate_per_share_value(df_with_pv_fcf, financial_data["balance_sheet"], financial_data,
+                                              discount_rate, perpetual_growth_rate))
+
+    @staticmethod
+    def _detailed_financials(financial_data):
+        return extract_detailed_financials_frame(
+            financial_data["income_statement"], financial_data["balance_sheet"], financial_data["cash_flow"])
@@ -0,0 +1,470 @@
+import argparse
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from dotenv import load_dotenv
+
+from fundamentals_store import FundamentalsStore, DEFAULT_STORE_PATH
+from google_gemini import predict_dcrate, predict_perpgrowthrate
+from instrumentation import get_registry, increment, timed
+from llm_parsing import parse_number
+from main import fetch_financial_data
+from statistical_forecasting import StatisticalForecaster, FORECAST_METHODS
+from valuation_graph import ValuationGraph, hash_financial_data, llm_cashflow_forecaster
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8080
+DEFAULT_WORKERS = 16
+MAX_BATCH_TICKERS = 1000
+MAX_TIME_PERIOD = 50
+DEFAULT_MAX_TICKERS = 10_000
+MAX_REQUEST_BYTES = 1 << 20
+
+logger = logging.getLogger(__name__)
+
+
+class ValuationError(ValueError):
+    """
+    Raised when the rates of a valuation cannot give a meaningful per-share value, e.g. when the discount rate
+    does not exceed the perpetual growth rate.
+    """
+
+
+class ValuationService:
+    """
+    Long-lived valuation engine behind the HTTP API.
+
+    The fundamentals store connection, the decoded fundamentals of every ticker served so far and the
+    ValuationGraph memo stay in memory between requests, next to the process-wide model response cache and
+    model client. Concurrent requests for the same ticker share one fundamentals load and one rate forecast,
+    and the ValuationGraph shares the forecast and discounting stages between them, so only the stages
+    that differ between scenarios are run per request.
+
+    For tests, pass a FundamentalsStore on a temporary file, a local forecaster such as a
+    StatisticalForecaster, fetch=False, and install a FakeLLMBackend with set_backend for the rate forecasts.
+    """
+
+    def __init__(self, store=None, api_key=None, forecaster=llm_cashflow_forecaster, time_period=10, first_year=2024,
+                 fetch=True, bypass_cache=False, max_workers=DEFAULT_WORKERS, graph=None,
+                 max_tickers=DEFAULT_MAX_TICKERS):
+        """
+        Args:
+        store (FundamentalsStore, optional): The fundamentals store to read from and write to.
+        api_key (str, optional): The Alpha Vantage API key used to fetch missing or stale fundamentals.
+        forecaster (callable): Called with (ticker, historical_df, time_period, first_year); returns the
+            operating cash flow and capital expenditures forecasts as JSON strings.
+        time_period (int): The default number of forecast years.
+        first_year (int): The default first forecast year.
+        fetch (bool): Whether to fetch fundamentals missing from the store; otherwise only stored data is served.
+        bypass_cache (bool): Whether to skip the model response cache for the rate forecasts.
+        max_workers (int): The number of threads valuing the tickers of a batch request.
+        graph (ValuationGraph, optional): The memoized pipeline; one using forecaster is created by default.
+        max_tickers (int): The number of tickers whose fundamentals and rates are kept in memory before the least
+            recently used ones are dropped.
+        """
+        self.store = store or FundamentalsStore()
+        self.api_key = api_key
+        self.time_period = time_period
+        self.first_year = first_year
+        self.fetch = fetch
+        self.bypass_cache = bypass_cache
+        self.graph = graph or ValuationGraph(forecaster)
+        self.started_at = time.time()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="valuation")
+        self.max_tickers = max_tickers
+        self._fundamentals = OrderedDict()
+        self._rates = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def close(self):
+        """
+        Stop the batch worker threads and close the fundamentals store.
+        """
+        self._executor.shutdown(wait=True)
+        self.store.close()
+
+    def _recall(self, memo, key):
+        with self._lock:
+            entry = memo.get(key)
+            if entry is not None:
+                memo.move_to_end(key)
+            return entry
+
+    def _remember(self, memo, key, entry):
+        # Keeps the memo to max_tickers entries, dropping the least recently used ones
+        with self._lock:
+            memo[key] = entry
+            memo.move_to_end(key)
+            while len(memo) > self.max_tickers:
+                memo.popitem(last=False)
+
+    def _coalesced(self, key, compute):
+        # Runs compute once for all concurrent callers with the same key
+        with self._lock:
+            in_flight = self._in_flight.get(key)
+            owner = in_flight is None
+            if owner:
+                in_flight = self._in_flight[key] = Future()
+        if not owner:
+            increment("service_coalesced_requests", kind=key[0])
+            return in_flight.result()
+
+        try:
+            value = compute()
+        except BaseException as e:
+            in_flight.set_exception(e)
+            raise
+        else:
+            in_flight.set_result(value)
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+        return value
+
+    def warm(self, tickers=None):
+        """
+        Load the fundamentals of many tickers from the store in one query.
+
+        Args:
+        tickers (list, optional): The tickers to load. Defaults to every stored ticker; only the last max_tickers
+            loaded stay in memory.
+
+        Returns:
+        int: The number of tickers loaded.
+        """
+        stored_data = self.store.get_many(tickers, allow_stale=True)
+        loaded_at = time.time()
+        for ticker, financial_data in stored_data.items():
+            self._remember(self._fundamentals, ticker,
+                           (financial_data, hash_financial_data(financial_data), loaded_at))
+        return len(stored_data)
+
+    def _load_fundamentals(self, ticker):
+        increment("service_fundamentals_loads")
+        if self.fetch and self.api_key:
+            financial_data = fetch_financial_data(ticker, self.api_key, self.store)
+        else:
+            financial_data = self.store.get(ticker, allow_stale=True)
+        if financial_data is None:
+            raise LookupError(f"No financial data available for {ticker}")
+        entry = (financial_data, hash_financial_data(financial_data), time.time())
+        self._remember(self._fundamentals, ticker, entry)
+        return entry
+
+    def fundamentals(self, ticker):
+        """
+        Return a ticker's financial data and its content hash, loading it if it is not in memory or expired.
+
+        Args:
+        ticker (str): The stock ticker symbol.
+
+        Returns:
+        tuple: The financial data as returned by fetch_financial_data and its fundamentals key.
+        """
+        entry = self._recall(self._fundamentals, ticker)
+        ttl_seconds = self.store.ttl_seconds
+        if entry is None or (ttl_seconds is not None and time.time() - entry[2] > ttl_seconds):
+            entry = self._coalesced(("fundamentals", ticker), lambda: self._load_fundamentals(ticker))
+        return entry[0], entry[1]
+
+    def _forecast_rates(self, ticker, time_period):
+        rates = (parse_number(predict_dcrate(ticker, time_period, bypass_cache=self.bypass_cache)),
+                 parse_number(predict_perpgrowthrate(ticker, time_period, bypass_cache=self.bypass_cache)))
+        entry = (rates, time.time())
+        self._remember(self._rates, (ticker, time_period), entry)
+        return entry
+
+    def rates(self, ticker, time_period):
+        """
+        Return the model's discount and perpetual growth rates of a ticker, memoized per forecast horizon until
+        the store's TTL expires, like the fundamentals.
+
+        Args:
+        ticker (str): The stock ticker symbol.
+        time_period (int): The number of forecast years.
+
+        Returns:
+        tuple: The discount rate and the perpetual growth rate.
+        """
+        entry = self._recall(self._rates, (ticker, time_period))
+        ttl_seconds = self.store.ttl_seconds
+        if entry is None or (ttl_seconds is not None and time.time() - entry[1] > ttl_seconds):
+            entry = self._coalesced(("rates", ticker, time_period), lambda: self._forecast_rates(ticker, time_period))
+        return entry[0]
+
+    def value(self, ticker, discount_rate=None, perpetual_growth_rate=None, time_period=None, first_year=None):
+        """
+        Value a ticker, optionally under scenario overrides.
+
+        Args:
+        ticker (str): The stock ticker symbol.
+        discount_rate (float, optional): The discount rate to use instead of the model's.
+        perpetual_growth_rate (float, optional): The perpetual growth rate to use instead of the model's.
+        time_period (int, optional): The number of forecast years (1 to MAX_TIME_PERIOD), instead of the service
+            default.
+        first_year (int, optional): The first forecast year, instead of the service default.
+
+        Returns:
+        dict: The ticker, its 'per_share_value' and the rates and horizon used.
+
+        Raises:
+        LookupError: If no financial data is available for the ticker.
+        ValuationError: If the time period is out of range, the discount rate does not exceed the perpetual
+            growth rate, or the per-share value is not a finite number.
+        """
+        ticker = ticker.strip().upper()
+        time_period = int(time_period or self.time_period)
+        first_year = int(first_year or self.first_year)
+        if not 1 <= time_period <= MAX_TIME_PERIOD:
+            raise ValuationError(f"The time period must be between 1 and {MAX_TIME_PERIOD} years, got {time_period}")
+        with timed("service_valuation"):
+            financial_data, fundamentals_key = self.fundamentals(ticker)
+            if discount_rate is None or perpetual_growth_rate is None:
+                model_discount_rate, model_perpetual_growth_rate = self.rates(ticker, time_period)
+                discount_rate = model_discount_rate if discount_rate is None else discount_rate
+                if perpetual_growth_rate is None:
+                    perpetual_growth_rate = model_perpetual_growth_rate
+            discount_rate, perpetual_growth_rate = float(discount_rate), float(perpetual_growth_rate)
+            # The terminal value divides by their difference, so it would be infinite or negative
+            if not discount_rate > perpetual_growth_rate:
+                raise ValuationError(f"The discount rate ({discount_rate}) of {ticker} must be greater than the "
+                                     f"perpetual growth rate ({perpetual_growth_rate})")
+
+            key = ("valuation", ticker, fundamentals_key, discount_rate, perpetual_growth_rate, time_period, first_year)
+            per_share_value = self._coalesced(key, lambda: self.graph.revalue(
+                ticker, financial_data, discount_rate, perpetual_growth_rate, time_period, first_year,
+                fundamentals_key=fundamentals_key))
+        if not math.isfinite(per_share_value):
+            raise ValuationError(f"The per-share value of {ticker} is not a finite number")
+        return {
+            "ticker": ticker,
+            "per_share_value": float(per_share_value),
+            "discount_rate": discount_rate,
+            "perpetual_growth_rate": perpetual_growth_rate,
+            "time_period": time_period,
+            "first_year": first_year,
+        }
+
+    def value_many(self, tickers, **scenario):
+        """
+        Value many tickers concurrently under the same scenario overrides.
+
+        Args:
+        tickers (list): The stock ticker symbols.
+        **scenario: The overrides accepted by value().
+
+        Returns:
+        list: One result dict per ticker in input order; failed tickers carry an 'error' instead of a value.
+        """
+        futures = [self._executor.submit(self.value, ticker, **scenario) for ticker in tickers]
+        results = []
+        for ticker, future in zip(tickers, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append({"ticker": ticker, "error": str(e)})
+        return results
+
+    def health(self):
+        """
+        Return the liveness status and the size of the warm state.
+        """
+        return {
+            "status": "ok",
+            "uptime_seconds": time.time() - self.started_at,
+            "tickers_loaded": len(self._fundamentals),
+            "memoized_stages": dict(self.graph.computed),
+        }
+
+
+_SCENARIO_PARAMETERS = {
+    "discount_rate": ("discount_rate", float),
+    "growth_rate": ("perpetual_growth_rate", float),
+    "perpetual_growth_rate": ("perpetual_growth_rate", float),
+    "time_period": ("time_period", int),
+    "first_year": ("first_year", int),
+}
+
+
+def parse_scenario(parameters):
+    """
+    Convert request parameters into value() scenario overrides.
+
+    Args:
+    parameters (dict): Parameter names mapped to values, e.g. {'discount_rate': '0.09', 'growth_rate': '0.02'}.
+
+    Returns:
+    dict: The overrides keyed by value() argument names.
+
+    Raises:
+    ValueError: If a parameter is unknown or not a finite number, the time period is out of range, or the
+        discount rate does not exceed the perpetual growth rate.
+    """
+    scenario = {}
+    for name, value in parameters.items():
+        if name not in _SCENARIO_PARAMETERS:
+            raise ValueError(f"Unknown parameter '{name}'")
+        argument, convert = _SCENARIO_PARAMETERS[name]
+        try:
+            scenario[argument] = convert(value)
+            if not math.isfinite(scenario[argument]):
+                raise ValueError
+        except (TypeError, ValueError, OverflowError):
+            raise ValueError(f"Invalid value for '{name}': {value!r}") from None
+    if not 1 <= scenario.get("time_period", 1) <= MAX_TIME_PERIOD:
+        raise ValueError(f"'time_period' must be between 1 and {MAX_TIME_PERIOD}")
+    if scenario.get("discount_rate", math.inf) <= scenario.get("perpetual_growth_rate", -math.inf):
+        raise ValueError("'discount_rate' must be greater than the perpetual growth rate")
+    return scenario
+
+
+class ValuationRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP/JSON API of a ValuationService.
+
+    GET /valuations/<ticker>?discount_rate=&growth_rate=&time_period=&first_year= values one ticker,
+    POST /valuations with {"tickers": [...], plus optional scenario fields} values a batch,
+    GET /health reports liveness and GET /metrics exports the metrics in the Prometheus text format.
+    """
+
+    server_version = "AutoDCF"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        logger.info("%s - %s", self.address_string(), format % args)
+
+    def _send(self, status, body, content_type="application/json"):
+        if content_type == "application/json":
+            # Infinity and NaN are not valid JSON, so they are never sent
+            try:
+                body = json.dumps(body, allow_nan=False)
+            except ValueError:
+                logger.error("Response to %s contains a non-finite number: %r", self.path, body)
+                status, body = HTTPStatus.INTERNAL_SERVER_ERROR, json.dumps({"error": "Non-finite number in response"})
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        increment("service_responses", status=int(status))
+
+    def _send_error(self, status, message):
+        self._send(status, {"error": message})
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = [unquote(part) for part in url.path.split("/") if part]
+        if parts == ["health"]:
+            return self._send(HTTPStatus.OK, self.service.health())
+        if parts == ["metrics"]:
+            return self._send(HTTPStatus.OK, get_registry().to_prometheus(), "text/plain; version=0.0.4")
+        if len(parts) == 2 and parts[0] == "valuations":
+            try:
+                scenario = parse_scenario({name: values[-1] for name, values in parse_qs(url.query).items()})
+            except ValueError as e:
+                return self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+            try:
+                return self._send(HTTPStatus.OK, self.service.value(parts[1], **scenario))
+            except LookupError as e:
+                return self._send_error(HTTPStatus.NOT_FOUND, str(e))
+            except ValuationError as e:
+                return self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+            except Exception as e:
+                logger.exception("Valuation of %s failed", parts[1])
+                return self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+        self._send_error(HTTPStatus.NOT_FOUND, f"Unknown path {url.path}")
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path.rstrip("/") != "/valuations":
+            return self._send_error(HTTPStatus.NOT_FOUND, f"Unknown path {url.path}")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_REQUEST_BYTES:
+            return self._send_error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Request body too large")
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("Expected a JSON object")
+            tickers = body.pop("tickers", None)
+            if not isinstance(tickers, list) or not all(isinstance(ticker, str) for ticker in tickers):
+                raise ValueError("'tickers' must be a list of ticker symbols")
+            if len(tickers) > MAX_BATCH_TICKERS:
+                raise ValueError(f"At most {MAX_BATCH_TICKERS} tickers per request")
+            scenario = parse_scenario(body)
+        except ValueError as e:
+            return self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+        self._send(HTTPStatus.OK, {"results": self.service.value_many(tickers, **scenario)})
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    Create the HTTP server of a ValuationService; each request is handled on its own thread.
+
+    Args:
+    service (ValuationService): The service answering the requests.
+    host (str): The interface to listen on.
+    port (int): The port to listen on; 0 picks a free port (see server.server_address).
+
+    Returns:
+    ThreadingHTTPServer: The server; call serve_forever() to start it.
+    """
+    server = ThreadingHTTPServer((host, port), ValuationRequestHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve DCF valuations over a local HTTP/JSON API.")
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Interface to listen on.")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on.")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="Path of the fundamentals store.")
+    parser.add_argument("--no-fetch", action="store_true", help="Only serve fundamentals already in the store.")
+    parser.add_argument("--warm", action="store_true", help="Load every stored ticker into memory at startup.")
+    parser.add_argument("--time-period", type=int, default=10, help="Default number of forecast years.")
+    parser.add_argument("--first-year", type=int, default=2024, help="Default first forecast year.")
+    parser.add_argument("--forecaster", choices=("llm", *FORECAST_METHODS), default="llm",
+                        help="Cash flow forecaster: the model, or a local statistical method.")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="Threads valuing the tickers of a batch request.")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    logging.basicConfig(level=os.getenv("AUTODCF_LOG_LEVEL", "WARNING"))
+
+    service = ValuationService(
+        FundamentalsStore(args.store), os.getenv("ALPHAVANTAGE_API_KEY"),
+        llm_cashflow_forecaster if args.forecaster == "llm" else StatisticalForecaster(args.forecaster),
+        args.time_period, args.first_year, fetch=not args.no_fetch, max_workers=args.workers)
+    if args.warm:
+        print(f"Loaded {service.warm()} tickers", file=sys.stderr)
+    server = make_server(service, args.host, args.port)
+    print(f"Serving valuations on http://{server.server_address[0]}:{server.server_address[1]}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())